@@ -39,6 +39,46 @@ class Settings(BaseSettings):
     DEEPSEEK_BASE_URL: str = "https://api.deepseek.com"
     DEEPSEEK_MODEL: str = "deepseek-chat"
 
+    # Worker de clasificación: lotes simultáneos, máximo de solicitudes por lote y tope de llamadas al LLM
+    AI_WORKER_CONCURRENCY: int = 4
+    AI_BATCH_SIZE: int = 25
+    # Empaquetado por tokens (estimación local): presupuesto por llamada sin contar el prompt de sistema,
+    # tope por descripción (se recorta conservando inicio y final) y respuesta esperada por solicitud
+    AI_BATCH_TOKEN_BUDGET: int = 4000
+    AI_MAX_ITEM_TOKENS: int = 300
+    AI_OUTPUT_TOKENS_PER_ITEM: int = 70
+    AI_REQUESTS_PER_MINUTE: int = 60
+    # Cola durable: un lote reclamado se considera abandonado tras AI_LEASE_SECONDS
+    AI_LEASE_SECONDS: int = 300
+    AI_MAX_ATTEMPTS: int = 3
+    # Una fila devuelta a la cola por un fallo no se vuelve a reclamar antes de
+    # AI_RETRY_BACKOFF_SECONDS * 2^intentos (tope AI_RETRY_BACKOFF_MAX_SECONDS)
+    AI_RETRY_BACKOFF_SECONDS: int = 30
+    AI_RETRY_BACKOFF_MAX_SECONDS: int = 3600
+    # "inline": la API lanza el worker como BackgroundTask; "external": sólo encola y avisa (NOTIFY)
+    # a los procesos `python -m app.workers.ai`
+    AI_WORKER_MODE: str = "inline"
+    # Sondeo de respaldo del worker dedicado (leases vencidos, avisos perdidos)
+    AI_WORKER_POLL_SECONDS: int = 30
+    # Similitud MinHash mínima para clasificar una solicitud con la etiqueta de otra casi idéntica (1.0 = desactivado)
+    AI_NEAR_DUPLICATE_THRESHOLD: float = 0.8
+    # Clasificador local (python -m app.scripts.train_local_classifier): resuelve sin LLM lo que
+    # supera el umbral de confianza. Ruta vacía = app/data/models/local_classifier.npz; umbral > 1 lo desactiva
+    AI_LOCAL_MODEL_PATH: str = ""
+    AI_LOCAL_MODEL_THRESHOLD: float = 0.85
+
+    # Importaciones masivas (/imports): copia del archivo mientras el job está vivo (vacío = app/data/imports)
+    # y segundos sin latido tras los que un job PROCESANDO se considera caído y se puede reanudar.
+    # La copia de un job en ERROR que nadie reanuda se borra pasadas IMPORT_RETENTION_HOURS
+    IMPORT_STORAGE_DIR: str = ""
+    IMPORT_STALE_SECONDS: int = 120
+    IMPORT_RETENTION_HOURS: int = 72
+
+    # Caché de geocodificación inversa (coordenadas -> municipio)
+    # Precisión geohash: 7 ≈ 150 m, 8 ≈ 38 x 19 m, 9 ≈ 5 m
+    GEOCODE_CACHE_SIZE: int = 10000
+    GEOCODE_CACHE_PRECISION: int = 8
+
     # Embeddings (Google)
     GOOGLE_API_KEY: str
     
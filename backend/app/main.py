@@ -10,6 +10,8 @@ from app.models import User, UserRole
 from app.core.security import get_password_hash
 from app.routers import all_routers
 from app.routers import chat
+from app.services.routing_service import routing_service
+from app.services.import_service import import_service
 
 # Configuración de Logs
 logging.basicConfig(level=logging.INFO)
@@ -63,6 +65,21 @@ def startup_event():
         logger.error(f"❌ Error creando superadmin: {e}")
     finally:
         db.close()
+
+    # 2.1 Sembrar la matriz de ruteo si aún no existe
+    db = SessionLocal()
+    try:
+        routing_service.seed_default_rules(db)
+    except Exception as e:
+        logger.error(f"❌ Error sembrando reglas de ruteo: {e}")
+    finally:
+        db.close()
+    
+    # 2.2 Retomar importaciones masivas que un reinicio dejó a medias
+    try:
+        import_service.resume_stale_jobs()
+    except Exception as e:
+        logger.error(f"❌ Error reanudando importaciones: {e}")
     
     # 3. DEBUG: Imprimir rutas registradas para verificar 404s
     logger.info("🔍 Rutas registradas:")
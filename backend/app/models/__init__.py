@@ -2,8 +2,11 @@
 from .base import Base
 from .organization import Dependency, Department
 from .users import User, CitizenProfile, UserRole
-from .requests import CitizenRequest, GovAction, RequestStatus, Urgency, Sentiment, Topic
+from .requests import CitizenRequest, GovAction, FolioCounter, RequestStatus, Urgency, Sentiment, Topic
 from .alerts import SystemAlert, AlertType
 from .knowledge import KnowledgeItem, InteractionLog
+from .routing import RoutingRule, RoutingConfigVersion
+from .ai_cache import AIClassificationCache
+from .imports import ImportJob, ImportStatus
 # NUEVO: Historial de Chat
 from .chat_history import ChatSession, ChatMessage
\ No newline at end of file
@@ -0,0 +1,30 @@
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Integer, DateTime, Enum as SQLAlchemyEnum, Text
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from .base import Base
+from .requests import Topic, Urgency, Sentiment, RequestType
+
+class AIClassificationCache(Base):
+    """
+    Clasificación ya pagada al LLM, reutilizable para textos idénticos tras normalizar
+    (mayúsculas, acentos, puntuación y espacios). La llave incluye la versión del prompt
+    y el modelo: cambiar cualquiera de los dos invalida el caché sin borrarlo.
+    """
+    __tablename__ = "ai_classification_cache"
+
+    text_hash: Mapped[str] = mapped_column(String(64), primary_key=True) # sha256 del texto normalizado
+    prompt_version: Mapped[str] = mapped_column(String(32), primary_key=True)
+    model: Mapped[str] = mapped_column(String(100), primary_key=True)
+
+    topic: Mapped[Topic] = mapped_column(SQLAlchemyEnum(Topic, name="topic_enum", native_enum=False), nullable=False)
+    urgency: Mapped[Urgency] = mapped_column(SQLAlchemyEnum(Urgency, name="urgency_enum", native_enum=False), nullable=False)
+    sentiment: Mapped[Sentiment] = mapped_column(SQLAlchemyEnum(Sentiment, name="sentiment_enum", native_enum=False), nullable=False)
+    request_type: Mapped[RequestType] = mapped_column(SQLAlchemyEnum(RequestType, name="req_type_enum", native_enum=False), nullable=False)
+    suggested_action: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    department: Mapped[Optional[str]] = mapped_column(String(255), nullable=True) # Dependencia sugerida por la IA
+
+    hits: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
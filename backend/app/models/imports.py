@@ -0,0 +1,54 @@
+import enum
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Integer, BigInteger, DateTime, ForeignKey, Enum as SQLAlchemyEnum, Text
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from .base import Base
+
+class ImportStatus(str, enum.Enum):
+    pendiente = "PENDIENTE"
+    procesando = "PROCESANDO"
+    completado = "COMPLETADO"
+    error = "ERROR"
+
+class ImportJob(Base):
+    """
+    Importación masiva procesada en el servidor por bloques. Cada bloque se inserta y su checkpoint
+    (renglones de datos ya consumidos) se guarda en la misma transacción: un job interrumpido
+    continúa desde checkpoint_row sin duplicar ni perder renglones.
+    """
+    __tablename__ = "import_jobs"
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    file_path: Mapped[str] = mapped_column(String(512), nullable=False) # Copia en disco para poder reanudar
+    status: Mapped[ImportStatus] = mapped_column(SQLAlchemyEnum(ImportStatus, name="import_status_enum", native_enum=False), default=ImportStatus.pendiente, index=True)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # Progreso (acumulado entre reanudaciones)
+    checkpoint_row: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    rows_read: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    rows_inserted: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    rows_skipped: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False) # Folio inválido o ya existente
+    rows_failed: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    locations_found: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # Token del reclamo vigente: un proceso que perdió el job (latido vencido) ya no puede escribir en él
+    claim_token: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), nullable=True)
+
+    created_by: Mapped[Optional[uuid.UUID]] = mapped_column(ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Latido del proceso que lo ejecuta: un job PROCESANDO sin latido reciente se considera caído
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if not self.started_at or not self.rows_read: return None
+        end = self.finished_at or datetime.now(self.started_at.tzinfo)
+        seconds = (end - self.started_at).total_seconds()
+        return round(self.rows_read / seconds, 1) if seconds > 0 else None
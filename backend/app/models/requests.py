@@ -2,7 +2,7 @@ import uuid
 import enum
 from datetime import datetime
 from typing import Optional, Dict, List
-from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Enum as SQLAlchemyEnum, Text, Float, JSON
+from sqlalchemy import Column, String, Boolean, DateTime, ForeignKey, Enum as SQLAlchemyEnum, Text, Float, Integer, BigInteger, JSON
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from sqlalchemy.sql import func
@@ -59,6 +59,12 @@ class GovAction(Base):
     dependency: Mapped["Dependency"] = relationship(back_populates="gov_actions")
     requests: Mapped[List["CitizenRequest"]] = relationship(back_populates="gov_action")
 
+class FolioCounter(Base):
+    """Último folio emitido por año; se avanza con UPDATE ... RETURNING (sin count(*) ni carreras)."""
+    __tablename__ = "folio_counters"
+    year: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    last_value: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0, server_default="0")
+
 class CitizenRequest(Base):
     __tablename__ = "citizen_requests"
 
@@ -79,6 +85,12 @@ class CitizenRequest(Base):
     request_type: Mapped[RequestType] = mapped_column(SQLAlchemyEnum(RequestType, name="req_type_enum", native_enum=False), default=RequestType.desconocida)
     suggested_action: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     analysis_status: Mapped[AnalysisStatus] = mapped_column(SQLAlchemyEnum(AnalysisStatus, name="analysis_status_enum", native_enum=False), default=AnalysisStatus.pendiente, index=True)
+    # Cola durable del worker: intentos consumidos y vencimiento del lease mientras está PROCESANDO
+    analysis_attempts: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    analysis_lease_expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    # Casi-duplicados: la etiqueta se copia del representante del grupo (confianza = similitud estimada)
+    duplicate_of_id: Mapped[Optional[uuid.UUID]] = mapped_column(ForeignKey("citizen_requests.id", ondelete="SET NULL"), nullable=True, index=True)
+    analysis_confidence: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     # ------------------------
 
     status: Mapped[RequestStatus] = mapped_column(SQLAlchemyEnum(RequestStatus, name="status_enum", native_enum=False), default=RequestStatus.recibida)
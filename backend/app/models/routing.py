@@ -0,0 +1,35 @@
+import uuid
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import String, Integer, DateTime, Enum as SQLAlchemyEnum, UniqueConstraint
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy.sql import func
+from .base import Base
+from .requests import Topic
+
+class RoutingRule(Base):
+    """
+    Regla de la matriz de asignación: (municipio, sector, tema) -> nombre del departamento responsable.
+    zone NULL = cualquier municipio; sector NULL = todo el municipio; zone y topic NULL = departamento por defecto.
+    """
+    __tablename__ = "routing_rules"
+    __table_args__ = (UniqueConstraint("zone", "sector", "topic", name="uq_routing_rules_zone_sector_topic"),)
+
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    zone: Mapped[Optional[str]] = mapped_column(String(150), nullable=True) # NOMGEO del GeoJSON
+    sector: Mapped[Optional[str]] = mapped_column(String(150), nullable=True) # Colonia/AGEB dentro de zone
+    topic: Mapped[Optional[Topic]] = mapped_column(SQLAlchemyEnum(Topic, name="topic_enum", native_enum=False), nullable=True)
+    department_name: Mapped[str] = mapped_column(String(150), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+
+class RoutingConfigVersion(Base):
+    """
+    Fila única con la versión de la configuración de ruteo (reglas + departamentos).
+    Cada worker compara este número para saber si debe recompilar su tabla en memoria.
+    """
+    __tablename__ = "routing_config_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, default=1)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
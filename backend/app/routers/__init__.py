@@ -12,6 +12,7 @@ from .uploads import router as uploads_router
 from .routing import router as routing_router
 from .chat import router as chat_router
 from .users import router as users_router
+from .imports import router as imports_router
 
 all_routers = [
     auth_router,
@@ -27,5 +28,6 @@ all_routers = [
     uploads_router,
     routing_router,
     chat_router,
-    users_router
+    users_router,
+    imports_router
 ]
\ No newline at end of file
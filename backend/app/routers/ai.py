@@ -1,6 +1,7 @@
 from typing import List, Any, Optional
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session, aliased
 from pydantic import BaseModel
 from datetime import datetime
 import json
@@ -16,6 +17,7 @@ class ProgressResponse(BaseModel):
     total: int
     processed: int
     pending: int
+    deferred: int = 0 # Pendientes en espera de reintento (backoff tras un fallo del LLM)
     percentage: float
     status: str
 
@@ -32,13 +34,25 @@ def get_analysis_progress(db: Session = Depends(get_db)):
     """
     total = db.query(CitizenRequest).count()
     if total == 0:
-        return {"total": 0, "processed": 0, "pending": 0, "percentage": 100, "status": "idle"}
+        return {"total": 0, "processed": 0, "pending": 0, "deferred": 0, "percentage": 100, "status": "idle"}
         
-    pending = db.query(CitizenRequest).filter(
+    queued = db.query(CitizenRequest).filter(
         CitizenRequest.analysis_status.in_([AnalysisStatus.pendiente, AnalysisStatus.procesando])
     ).count()
+    # En backoff: la fila misma o el representante del que espera heredar la etiqueta
+    rep = aliased(CitizenRequest)
+    rep_deferred = db.query(rep.id).filter(
+        rep.id == CitizenRequest.duplicate_of_id,
+        rep.analysis_status == AnalysisStatus.pendiente,
+        rep.analysis_lease_expires_at > func.now(),
+    ).exists()
+    deferred = db.query(CitizenRequest).filter(
+        CitizenRequest.analysis_status == AnalysisStatus.pendiente,
+        or_(CitizenRequest.analysis_lease_expires_at > func.now(), rep_deferred),
+    ).count()
+    pending = queued - deferred
     
-    processed = total - pending
+    processed = total - queued
     percentage = (processed / total) * 100 if total > 0 else 0
     
     status = "processing" if pending > 0 else "idle"
@@ -47,10 +61,27 @@ def get_analysis_progress(db: Session = Depends(get_db)):
         "total": total,
         "processed": processed,
         "pending": pending,
+        "deferred": deferred,
         "percentage": round(percentage, 1),
         "status": status
     }
 
+@router.get("/cache-stats")
+def get_classification_cache_stats(db: Session = Depends(get_db)):
+    """
+    Caché de clasificaciones: entradas vigentes (prompt y modelo actuales), aciertos acumulados
+    y tasa de aciertos de este proceso (filas resueltas sin llamada propia al LLM).
+    """
+    return ai_service.cache_stats(db)
+
+@router.get("/worker-stats")
+def get_worker_stats():
+    """
+    Aprovechamiento de las llamadas al LLM de este proceso: solicitudes y tokens por llamada,
+    divisiones de lotes incompletos y estado del limitador de tasa.
+    """
+    return ai_service.worker_stats()
+
 @router.post("/trigger-batch")
 async def trigger_batch_analysis(
     background_tasks: BackgroundTasks,
@@ -61,10 +92,16 @@ async def trigger_batch_analysis(
     Botón de Pánico: Fuerza el análisis de todo lo pendiente.
     """
     if force_reanalysis:
-        db.query(CitizenRequest).update({CitizenRequest.analysis_status: AnalysisStatus.pendiente})
+        db.query(CitizenRequest).update({
+            CitizenRequest.analysis_status: AnalysisStatus.pendiente,
+            CitizenRequest.analysis_attempts: 0,
+            CitizenRequest.analysis_lease_expires_at: None,
+            CitizenRequest.duplicate_of_id: None,
+            CitizenRequest.analysis_confidence: None,
+        })
         db.commit()
     
-    background_tasks.add_task(ai_service.run_process_queue)
+    ai_service.schedule_queue(db, background_tasks)
     return {"message": "Análisis iniciado en segundo plano."}
 
 @router.post("/batch-classify")
@@ -86,5 +123,5 @@ async def batch_classify_legacy(
          ]
 
     # Si es uso real, lanzamos el worker
-    background_tasks.add_task(ai_service.run_process_queue)
+    ai_service.schedule_queue(db, background_tasks)
     return {"status": "success", "message": "Procesamiento iniciado (Legacy Wrapper)"}
\ No newline at end of file
@@ -6,6 +6,7 @@ from app.models.organization import Dependency, Department
 from app.models.users import User, UserRole
 from app.schemas.organization import DependencyCreate, DependencyRead, DepartmentCreate, DepartmentRead
 from app.core.security import get_password_hash
+from app.services.routing_service import routing_service
 
 router = APIRouter(tags=["Organización"])
 
@@ -95,8 +96,10 @@ def create_department(
             )
             db.add(official_user)
 
+    routing_service.bump_config_version(db)
     db.commit()
     db.refresh(db_dept)
+    routing_service.refresh_routing_table(db)
     return db_dept
 
 @router.delete("/dependencies/{dep_id}", status_code=204)
@@ -109,5 +112,8 @@ def delete_dependency(
         raise HTTPException(status_code=404, detail="Dependencia no encontrada")
     
     db.delete(dep)
+    # Sus departamentos se borran en cascada: los demás workers deben recompilar
+    routing_service.bump_config_version(db)
     db.commit()
+    routing_service.refresh_routing_table(db)
     return None
\ No newline at end of file
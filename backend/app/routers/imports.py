@@ -0,0 +1,89 @@
+import uuid
+from pathlib import Path
+from typing import List
+from fastapi import APIRouter, BackgroundTasks, Depends, File, HTTPException, UploadFile
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.core.deps import get_current_active_user
+from app.models.users import User
+from app.models.imports import ImportJob, ImportStatus
+from app.schemas.imports import ImportJobRead
+from app.services.import_service import import_service
+
+router = APIRouter(prefix="/imports", tags=["Importaciones Masivas"])
+
+def _require_superadmin(current_user: User):
+    if current_user.role.value != 'superadmin':
+        raise HTTPException(status_code=403, detail="Solo superadmin puede importar")
+
+def _get_job(db: Session, job_id: uuid.UUID) -> ImportJob:
+    job = db.get(ImportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Importación no encontrada")
+    return job
+
+@router.post("", response_model=ImportJobRead, status_code=202)
+def create_import(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Guarda el archivo (CSV o XLSX) y devuelve el job de inmediato; los renglones se procesan en segundo plano."""
+    _require_superadmin(current_user)
+    job = import_service.create_job(db, file.file, file.filename, current_user.id)
+    background_tasks.add_task(import_service.run_job, job.id)
+    return job
+
+@router.get("", response_model=List[ImportJobRead])
+def list_imports(
+    limit: int = 20,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    _require_superadmin(current_user)
+    return db.query(ImportJob).order_by(ImportJob.created_at.desc()).limit(min(limit, 100)).all()
+
+@router.get("/{job_id}", response_model=ImportJobRead)
+def get_import(
+    job_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Avance del job: renglones leídos/insertados/omitidos/fallidos, checkpoint y renglones por segundo."""
+    _require_superadmin(current_user)
+    return _get_job(db, job_id)
+
+@router.post("/{job_id}/resume", response_model=ImportJobRead, status_code=202)
+def resume_import(
+    job_id: uuid.UUID,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Retoma un job detenido (ERROR o proceso caído) desde su último checkpoint."""
+    _require_superadmin(current_user)
+    job = _get_job(db, job_id)
+    if job.status == ImportStatus.completado:
+        raise HTTPException(status_code=409, detail="La importación ya terminó")
+    if not Path(job.file_path).exists():
+        raise HTTPException(status_code=410, detail="El archivo de la importación ya fue depurado; súbalo de nuevo")
+    token = import_service.claim_job(db, job_id)
+    if not token:
+        raise HTTPException(status_code=409, detail="La importación sigue en proceso")
+    background_tasks.add_task(import_service.run_job, job_id, token)
+    db.refresh(job)
+    return job
+
+@router.delete("/{job_id}", status_code=204)
+def delete_import(
+    job_id: uuid.UUID,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """Abandona un job (p. ej. en ERROR que no se va a reanudar): borra el registro y la copia del archivo."""
+    _require_superadmin(current_user)
+    _get_job(db, job_id)
+    if not import_service.delete_job(db, job_id):
+        raise HTTPException(status_code=409, detail="La importación sigue en proceso")
+    return None
@@ -6,14 +6,14 @@ from pydantic import BaseModel
 from app.database import get_db
 from app.models.users import User
 from app.models.organization import Department, Dependency
+from app.models.imports import ImportStatus
 from app.models.requests import CitizenRequest, RequestStatus, Topic, Urgency, Sentiment, AnalysisStatus, RequestType
 from app.schemas.requests import RequestCreate, RequestRead, RequestUpdateStatus, RequestImport, RequestAnalysisUpdate
 from app.services.request_service import request_service
 from app.services.ai_service import ai_service
+from app.services.import_service import import_service
 from app.core.deps import get_current_active_user
 import uuid
-import pandas as pd
-import io
 from datetime import datetime
 import logging
 
@@ -66,96 +66,47 @@ def list_requests(
     return {"items": items, "total": total}
 
 @router.post("/import-csv")
-async def import_requests_csv(
+def import_requests_csv(
     background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
+    """
+    Importación dentro de la petición (archivos chicos). Queda registrada como ImportJob: si la
+    conexión se corta, el avance se consulta en GET /imports/{job_id}. Para archivos grandes usar POST /imports.
+    """
     if current_user.role.value != 'superadmin':
         raise HTTPException(status_code=403, detail="Solo superadmin puede importar")
 
     try:
-        content = await file.read()
-        df = None
-        encodings = ['cp1252', 'latin-1', 'utf-8', 'iso-8859-1']
-        for enc in encodings:
-            try:
-                df = pd.read_csv(io.BytesIO(content), encoding=enc, engine='python', on_bad_lines='skip')
-                break
-            except: continue
-            
-        if df is None: raise HTTPException(400, "Error encoding CSV")
-        df.columns = df.columns.str.strip().str.replace('ï»¿', '')
-        
-        col_folio = next((c for c in df.columns if 'FOLIO' in c.upper() or 'ID' in c.upper()), None)
-        col_desc = next((c for c in df.columns if 'DESCRIPCION' in c.upper() or 'MOTIVO' in c.upper()), None)
-        col_mun = next((c for c in df.columns if 'MUNICIPIO' in c.upper() or 'UBICACION' in c.upper()), None)
-        
-        if not col_folio or not col_desc:
-             raise HTTPException(400, f"Columnas requeridas no encontradas.")
-
-        success = 0
-        # --- CONTADORES DE CALIDAD DE DATOS ---
-        loc_found = 0
-        loc_missing = 0
-        
-        for _, row in df.iterrows():
-            try:
-                folio_raw = str(row.get(col_folio, '')).replace('=', '').replace('"', '').strip()
-                if len(folio_raw) < 3: continue
-                if db.query(CitizenRequest.id).filter(CitizenRequest.folio == folio_raw).first(): continue
-
-                desc = str(row.get(col_desc, 'Sin descripción'))
-                if desc == 'nan': desc = "Solicitud importada"
-
-                # --- LÓGICA DE UBICACIÓN ---
-                raw_mun = row.get(col_mun) if col_mun else None
-                
-                # Verificar si es válido (No NaN, No vacío, No 'nan' literal)
-                if pd.isna(raw_mun) or str(raw_mun).strip() == '' or str(raw_mun).lower() == 'nan':
-                    location_str = "Ubicación General / No especificada"
-                    loc_missing += 1
-                else:
-                    location_str = f"Importado - {str(raw_mun).strip()}"
-                    loc_found += 1
-                # ---------------------------
-
-                db_req = CitizenRequest(
-                    folio=folio_raw,
-                    description=desc[:4000],
-                    location_text=location_str,
-                    status=RequestStatus.recibida,
-                    created_at=datetime.now(),
-                    topic=Topic.otros,
-                    analysis_status=AnalysisStatus.pendiente
-                )
-                db.add(db_req)
-                success += 1
-                if success % 100 == 0: db.commit()
-            except: continue
-        
-        db.commit()
-        
-        # --- LOG DE CALIDAD ---
-        logger.info(f"📊 REPORTE DE IMPORTACIÓN: {success} registros.")
-        logger.info(f"   📍 Ubicaciones detectadas: {loc_found}")
-        logger.info(f"   ⚠️ Ubicaciones vacías/nan: {loc_missing}")
-        
-        if success > 0:
-            background_tasks.add_task(ai_service.run_process_queue)
-
-        return {
-            "message": "Archivo cargado exitosamente.", 
-            "imported": success, 
-            "locations_found": loc_found,
-            "status": "processing_started"
-        }
-
+        job = import_service.create_job(db, file.file, file.filename, current_user.id)
+        token = import_service.claim_job(db, job.id)
+        db.refresh(job)
+        job = import_service.process_job(db, job, token)
     except Exception as e:
         logger.error(f"Error import: {e}")
         raise HTTPException(500, str(e))
 
+    if job.status == ImportStatus.error:
+        raise HTTPException(400, job.error)
+    
+    # --- LOG DE CALIDAD ---
+    logger.info(f"📊 REPORTE DE IMPORTACIÓN: {job.rows_inserted} registros.")
+    logger.info(f"   📍 Ubicaciones detectadas: {job.locations_found}")
+    logger.info(f"   ⚠️ Ubicaciones vacías/nan: {job.rows_inserted - job.locations_found}")
+    
+    if job.rows_inserted > 0:
+        ai_service.schedule_queue(db, background_tasks)
+
+    return {
+        "message": "Archivo cargado exitosamente.", 
+        "imported": job.rows_inserted, 
+        "locations_found": job.locations_found,
+        "job_id": str(job.id),
+        "status": "processing_started"
+    }
+
 @router.get("/stats/topics")
 def get_topic_counts(db: Session = Depends(get_db)):
     results = db.query(CitizenRequest.topic, func.count(CitizenRequest.id)).group_by(CitizenRequest.topic).all()
@@ -183,14 +134,17 @@ def update_request_analysis(
     return {"message": "Análisis actualizado"}
 
 @router.post("", response_model=RequestRead, status_code=201)
-async def create_request(
+def create_request(
     *,
     db: Session = Depends(get_db),
     request_in: RequestCreate,
+    background_tasks: BackgroundTasks,
     current_user: User = Depends(get_current_active_user)
 ):
     citizen_id = current_user.citizen_profile_id if current_user.role.value == 'citizen' else None
-    request = await request_service.create_request(db, request_in, citizen_id)
+    request = request_service.create_request(db, request_in, citizen_id)
+    # Clasificación y ruteo definitivo los termina la cola de IA; el folio se devuelve de inmediato
+    ai_service.schedule_queue(db, background_tasks)
     return request
 
 @router.put("/{request_id}/status", response_model=RequestRead)
@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from pathlib import Path
+from typing import List, Dict, Any, Optional, Literal
+import numpy as np
+from sqlalchemy.orm import Session
+from app.database import get_db
 from app.services.routing_service import routing_service
+from app.services.tile_service import tile_service
 from app.core.deps import get_current_active_user
 from app.models.users import User
+from app.models.routing import RoutingRule
+from app.schemas.routing import RoutingRuleCreate, RoutingRuleUpdate, RoutingRuleRead
 
 router = APIRouter(prefix="/routing", tags=["Geocodificación y Ruteo"])
 
@@ -13,6 +17,16 @@ class Coords(BaseModel):
     lat: float
     lon: float
 
+class CoordsBatch(BaseModel):
+    lats: List[float]
+    lons: List[float]
+
+class ZonesBatchResponse(BaseModel):
+    zones: List[Optional[str]]
+    distances: List[Optional[float]]
+
+MAX_BATCH_POINTS = 200_000
+
 @router.post("/get-zone")
 def get_zone_from_coordinates(
     coords: Coords,
@@ -26,26 +40,206 @@ def get_zone_from_coordinates(
     
     return {
         "zone": best_match,
+        "sector": routing_service.get_sector_from_coords(coords.lat, coords.lon, zone=best_match) if best_match else None,
         "candidates": candidates # Enviamos todo para debug y frontend
     }
 
+@router.post("/get-zones/batch", response_model=ZonesBatchResponse)
+def get_zones_batch(
+    batch: CoordsBatch,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Geocodificación masiva: resuelve el municipio de miles de coordenadas en una sola llamada.
+    """
+    if len(batch.lats) != len(batch.lons):
+        raise HTTPException(status_code=400, detail="lats y lons deben tener la misma longitud")
+    if len(batch.lats) > MAX_BATCH_POINTS:
+        raise HTTPException(status_code=413, detail=f"Máximo {MAX_BATCH_POINTS} puntos por lote")
+
+    zones, distances = routing_service.get_zones_bulk(np.array(batch.lats), np.array(batch.lons))
+    return {
+        "zones": zones.tolist(),
+        "distances": [None if np.isnan(d) else float(d) for d in distances]
+    }
+
 @router.get("/zones", response_model=List[str])
 def get_available_zones(
     current_user: User = Depends(get_current_active_user)
 ):
-    if not routing_service.zones: return []
-    zone_names = [
-        feature["properties"].get("NOMGEO")
-        for feature in routing_service.zones
-        if "properties" in feature and "NOMGEO" in feature["properties"]
-    ]
-    return sorted(list(set(zone_names)))
+    return sorted(set(name for name in routing_service.zone_names if name))
+
+@router.get("/zones/{zone}/sectors", response_model=List[str])
+def get_zone_sectors(
+    zone: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Colonias/AGEBs del municipio (vacío si no se cargó la capa de sectores)."""
+    if zone not in routing_service.zone_names:
+        raise HTTPException(status_code=404, detail="Municipio no encontrado")
+    return sorted(set(name for name in routing_service.sector_names(zone) if name))
+
+# --- Matriz de asignación (administración) ---
+def _require_superadmin(user: User):
+    if user.role.value != 'superadmin':
+        raise HTTPException(status_code=403, detail="Solo superadmin puede modificar el ruteo")
+
+def _validate_location(zone: Optional[str], sector: Optional[str]):
+    if zone and zone not in routing_service.zone_names:
+        raise HTTPException(status_code=400, detail=f"Municipio desconocido: {zone}")
+    if sector and not zone:
+        raise HTTPException(status_code=400, detail="Una regla por sector requiere el municipio")
+    if sector and sector not in routing_service.sector_names(zone):
+        raise HTTPException(status_code=400, detail=f"Sector desconocido en {zone}: {sector}")
+
+def _find_rule(db: Session, zone: Optional[str], sector: Optional[str], topic) -> Optional[RoutingRule]:
+    # UNIQUE no cubre NULLs en Postgres: la duplicidad se valida aquí
+    return db.query(RoutingRule).filter(
+        RoutingRule.zone.is_(None) if zone is None else RoutingRule.zone == zone,
+        RoutingRule.sector.is_(None) if sector is None else RoutingRule.sector == sector,
+        RoutingRule.topic.is_(None) if topic is None else RoutingRule.topic == topic,
+    ).first()
+
+def _publish_rules(db: Session):
+    routing_service.bump_config_version(db)
+    db.commit()
+    routing_service.refresh_routing_table(db)
+
+@router.get("/rules", response_model=List[RoutingRuleRead])
+def list_routing_rules(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    return db.query(RoutingRule).order_by(
+        RoutingRule.zone.nullslast(), RoutingRule.sector.nullsfirst(), RoutingRule.topic.nullslast()
+    ).all()
+
+@router.post("/rules", response_model=RoutingRuleRead, status_code=201)
+def create_routing_rule(
+    rule_in: RoutingRuleCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    _require_superadmin(current_user)
+    _validate_location(rule_in.zone, rule_in.sector)
+    if _find_rule(db, rule_in.zone, rule_in.sector, rule_in.topic):
+        raise HTTPException(status_code=409, detail="Ya existe una regla para esa zona y tema")
+
+    rule = RoutingRule(
+        zone=rule_in.zone, sector=rule_in.sector, topic=rule_in.topic, department_name=rule_in.department_name
+    )
+    db.add(rule)
+    _publish_rules(db)
+    db.refresh(rule)
+    return rule
+
+@router.put("/rules/{rule_id}", response_model=RoutingRuleRead)
+def update_routing_rule(
+    rule_id: str,
+    rule_in: RoutingRuleUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    _require_superadmin(current_user)
+    rule = db.query(RoutingRule).filter(RoutingRule.id == rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Regla no encontrada")
+
+    changes = rule_in.model_dump(exclude_unset=True)
+    zone = changes.get("zone", rule.zone)
+    sector = changes.get("sector", rule.sector)
+    topic = changes.get("topic", rule.topic)
+    _validate_location(zone, sector)
+    existing = _find_rule(db, zone, sector, topic)
+    if existing and existing.id != rule.id:
+        raise HTTPException(status_code=409, detail="Ya existe una regla para esa zona y tema")
+
+    for field, value in changes.items():
+        if field == "department_name" and not value: continue
+        setattr(rule, field, value)
+    _publish_rules(db)
+    db.refresh(rule)
+    return rule
+
+@router.delete("/rules/{rule_id}", status_code=204)
+def delete_routing_rule(
+    rule_id: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    _require_superadmin(current_user)
+    rule = db.query(RoutingRule).filter(RoutingRule.id == rule_id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Regla no encontrada")
+    db.delete(rule)
+    _publish_rules(db)
+    return None
+
+def _pick_encoding(accept_encoding: str) -> List[str]:
+    """Codificaciones aceptadas por el cliente, en orden de preferencia del servidor."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0"): continue
+        accepted.add(token.strip())
+    return [enc for enc in ("br", "gzip") if enc in accepted or "*" in accepted] + ["identity"]
+
+def _zoom_to_resolution(zoom: int) -> str:
+    if zoom <= 7: return "low"
+    if zoom <= 10: return "medium"
+    return "full"
 
 @router.get("/yucatan-geojson")
-def get_yucatan_geojson():
-    geojson_path = Path("/app/app/data/yucatan_municipios.geojson")
-    if not geojson_path.exists():
-        geojson_path = Path("app/data/yucatan_municipios.geojson")
-    if not geojson_path.exists():
+def get_yucatan_geojson(
+    request: Request,
+    resolution: Optional[Literal["low", "medium", "full"]] = None,
+    zoom: Optional[int] = Query(None, ge=0, le=22)
+):
+    """
+    Mapa municipal precomputado (simplificado por resolución o zoom, coordenadas a 5 decimales),
+    servido ya comprimido con ETag fuerte para que el navegador revalide con 304. Sin parámetros
+    se sirve la resolución media (la del zoom inicial del dashboard); "full" hay que pedirla.
+    """
+    if not resolution:
+        resolution = _zoom_to_resolution(zoom) if zoom is not None else "medium"
+
+    for encoding in _pick_encoding(request.headers.get("accept-encoding", "")):
+        asset = routing_service.get_map(resolution, encoding)
+        if asset: break
+    if not asset:
         raise HTTPException(status_code=404, detail="Mapa no disponible")
-    return FileResponse(geojson_path, media_type="application/geo+json")
\ No newline at end of file
+
+    body, etag = asset
+    # ETag fuerte distinto por codificación (los bytes difieren)
+    etag = f'"{etag}"' if encoding == "identity" else f'"{etag}-{encoding}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=3600, must-revalidate",
+        "Vary": "Accept-Encoding",
+    }
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/geo+json", headers=headers)
+
+
+@router.get("/tiles/{z}/{x}/{y}.mvt")
+def get_vector_tile(
+    z: int,
+    x: int,
+    y: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Mapbox Vector Tile con dos capas: 'municipios' (recortados y simplificados por zoom)
+    y 'solicitudes' (conteos agregados por celda en zoom bajo, puntos individuales en zoom alto).
+    """
+    if not 0 <= z <= 22 or not 0 <= x < 2 ** z or not 0 <= y < 2 ** z:
+        raise HTTPException(status_code=404, detail="Tile fuera de rango")
+    content = tile_service.get_tile(db, z, x, y)
+    return Response(content=content, media_type="application/vnd.mapbox-vector-tile")
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.schemas.stats import DashboardStats, StatsFilter
 from app.services.stats_service import stats_service
+from app.services.routing_service import routing_service
 from typing import Optional, List, Any
 from datetime import date
 
@@ -35,4 +36,11 @@ def get_trends(db: Session = Depends(get_db)) -> List[Any]:
     """
     # Reutilizamos la lógica del servicio, extrayendo solo la parte de fechas
     stats = stats_service.get_filtered_stats(db, StatsFilter())
-    return stats["requests_by_date"]
\ No newline at end of file
+    return stats["requests_by_date"]
+
+@router.get("/geocoding-cache")
+def get_geocoding_cache_stats():
+    """
+    Efectividad del caché de geocodificación inversa (por worker).
+    """
+    return routing_service.geocode_cache.stats()
@@ -0,0 +1,23 @@
+from typing import Optional
+from datetime import datetime
+from uuid import UUID
+from app.models.imports import ImportStatus
+from .base import BaseSchema
+
+class ImportJobRead(BaseSchema):
+    id: UUID
+    filename: str
+    status: ImportStatus
+    error: Optional[str] = None
+    checkpoint_row: int
+    rows_read: int
+    rows_inserted: int
+    rows_skipped: int
+    rows_failed: int
+    locations_found: int
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    # Renglones leídos por segundo desde que arrancó (o hasta que terminó)
+    rows_per_second: Optional[float] = None
@@ -56,6 +56,8 @@ class RequestRead(BaseSchema):
     request_type: Optional[RequestType] = None # <--- AHORA ES OPCIONAL
     suggested_action: Optional[str] = None
     analysis_status: Optional[AnalysisStatus] = AnalysisStatus.pendiente
+    duplicate_of_id: Optional[UUID] = None
+    analysis_confidence: Optional[float] = None
     
     department_id: Optional[UUID] = None
     department_name: Optional[str] = None
@@ -0,0 +1,26 @@
+from typing import Optional
+from datetime import datetime
+from uuid import UUID
+from app.models.requests import Topic
+from .base import BaseSchema
+
+# --- Reglas de la matriz de asignación ---
+class RoutingRuleBase(BaseSchema):
+    zone: Optional[str] = None # None = cualquier municipio
+    sector: Optional[str] = None # Colonia/AGEB; None = todo el municipio
+    topic: Optional[Topic] = None # None (junto con zone) = departamento por defecto
+    department_name: str
+
+class RoutingRuleCreate(RoutingRuleBase):
+    pass
+
+class RoutingRuleUpdate(BaseSchema):
+    zone: Optional[str] = None
+    sector: Optional[str] = None
+    topic: Optional[Topic] = None
+    department_name: Optional[str] = None
+
+class RoutingRuleRead(RoutingRuleBase):
+    id: UUID
+    created_at: datetime
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,162 @@
+import json
+import random
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+import shapely
+from shapely.geometry import Point, shape
+from app.services.geometry_cache import GeometryCache, PartitionedLayer, SECTOR_NAME_PROPERTY, resolve_geojson_path
+from app.services.routing_service import RoutingService
+
+# --- CONFIGURACIÓN ---
+N_POINTS = 2000
+N_BULK_POINTS = 100_000
+# Malla sintética de sectores (~500 m) cuando no existe yucatan_sectores.geojson
+SECTOR_CELL = 0.005
+SECTOR_ZONES = ("Mérida", "Kanasín", "Progreso", "Umán")
+SEED = 42
+# Bounding box aproximado de Yucatán (con margen para puntos en el mar)
+LAT_RANGE = (19.5, 21.7)
+LON_RANGE = (-90.5, -87.4)
+# Centroides fijos que usaba el escaneo original
+LEGACY_CENTROIDS = {
+    "Progreso": Point(-89.6630, 21.2820),
+    "Celestún": Point(-90.3989, 20.8589),
+}
+
+def legacy_candidates(features: list, lat: float, lon: float):
+    """Réplica del escaneo lineal original (shape + buffer(0) + distance por municipio)."""
+    point = Point(lon, lat)
+    candidates = []
+    processed_names = set()
+    for zone in features:
+        name = zone["properties"].get("NOMGEO")
+        try:
+            polygon = shape(zone["geometry"])
+            if not polygon.is_valid: polygon = polygon.buffer(0)
+            dist = polygon.distance(point)
+            if dist < 0.2:
+                candidates.append({"zone": name, "distance": dist})
+                processed_names.add(name)
+        except Exception:
+            continue
+    for name, centroid in LEGACY_CENTROIDS.items():
+        if name not in processed_names:
+            dist = point.distance(centroid)
+            if dist < 0.1:
+                candidates.append({"zone": name, "distance": dist})
+    candidates.sort(key=lambda x: x["distance"])
+    return candidates[:5]
+
+def benchmark():
+    print("⏱️  Benchmark de geo-ruteo (escaneo lineal vs STRtree)")
+
+    t0 = time.perf_counter()
+    with open(resolve_geojson_path(), "r", encoding="utf-8") as f:
+        features = json.load(f)["features"]
+    print(f"   📄 json.load del GeoJSON: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    t0 = time.perf_counter()
+    service = RoutingService()
+    service.get_layer()
+    print(f"   🏗️  Carga desde caché + índice: {(time.perf_counter() - t0) * 1000:.1f} ms")
+
+    rng = random.Random(SEED)
+    points = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(N_POINTS)]
+
+    # Para el escaneo lineal basta una muestra: es ~100x más lento
+    sample = points[:200]
+    t0 = time.perf_counter()
+    legacy = [legacy_candidates(features, lat, lon) for lat, lon in sample]
+    legacy_ms = (time.perf_counter() - t0) * 1000 / len(sample)
+
+    t0 = time.perf_counter()
+    indexed = [service.get_candidates_from_coords(lat, lon) for lat, lon in points]
+    indexed_ms = (time.perf_counter() - t0) * 1000 / len(points)
+
+    mismatches = sum(1 for a, b in zip(legacy, indexed) if a != b)
+
+    print(f"   🐢 Lineal:  {legacy_ms:.3f} ms/consulta ({len(sample)} puntos)")
+    print(f"   🚀 STRtree: {indexed_ms:.3f} ms/consulta ({len(points)} puntos)")
+    print(f"   📈 Aceleración: x{legacy_ms / indexed_ms:.1f}")
+    if mismatches:
+        print(f"   ❌ {mismatches} resultados difieren del escaneo lineal.")
+    else:
+        print("   ✅ Candidatos y orden idénticos al escaneo lineal.")
+
+    # --- Modo masivo (get_zones_bulk) ---
+    np_rng = np.random.default_rng(SEED)
+    lats = np_rng.uniform(*LAT_RANGE, N_BULK_POINTS)
+    lons = np_rng.uniform(*LON_RANGE, N_BULK_POINTS)
+    t0 = time.perf_counter()
+    zones, _ = service.get_zones_bulk(lats, lons)
+    bulk_s = time.perf_counter() - t0
+    bulk_mismatches = sum(
+        1 for i in range(len(points)) if service.resolve_zone(lats[i], lons[i]) != zones[i]
+    )
+    print(f"   📦 Masivo:  {N_BULK_POINTS} puntos en {bulk_s:.2f} s ({bulk_s * 1e6 / N_BULK_POINTS:.1f} µs/punto)")
+    if bulk_mismatches:
+        print(f"   ❌ {bulk_mismatches} zonas difieren de get_zone_from_coords.")
+    else:
+        print("   ✅ Zonas idénticas a get_zone_from_coords.")
+
+def synthetic_sectors(service: RoutingService, out_dir: Path) -> Path:
+    """GeoJSON de celdas recortadas a cada municipio, con CVEGEO hijo del municipio."""
+    layer = service.get_layer()
+    features = []
+    for zone in SECTOR_ZONES:
+        i = layer.names.index(zone)
+        municipality = layer.geometry(i)
+        minx, miny, maxx, maxy = municipality.bounds
+        xs, ys = np.meshgrid(np.arange(minx, maxx, SECTOR_CELL), np.arange(miny, maxy, SECTOR_CELL))
+        cells = shapely.intersection(shapely.box(xs.ravel(), ys.ravel(), xs.ravel() + SECTOR_CELL, ys.ravel() + SECTOR_CELL), municipality)
+        for n, cell in enumerate(c for c in cells if not c.is_empty and c.area > 0):
+            features.append({
+                "type": "Feature",
+                "properties": {"CVEGEO": f"{layer.codes[i]}{n:08d}", "NOMBRE": f"{zone} sector {n}"},
+                "geometry": json.loads(shapely.to_geojson(cell)),
+            })
+    path = out_dir / "sectores_sinteticos.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": features}), encoding="utf-8")
+    return path
+
+def benchmark_sectors(service: RoutingService):
+    print("⏱️  Benchmark de ruteo por colonia/AGEB (municipio -> sub-índice)")
+    with tempfile.TemporaryDirectory() as tmp:
+        if service.get_sectors() is None:
+            path = synthetic_sectors(service, Path(tmp))
+            cache = GeometryCache(path, cache_root=Path(tmp) / ".geocache", name_property=SECTOR_NAME_PROPERTY, render_maps=False)
+            service._sectors = PartitionedLayer(cache.load("full"))
+            print(f"   🧪 Capa sintética: {len(service._sectors)} sectores en {len(service._sectors.partitions)} municipios")
+        sectors = service._sectors
+
+        # Puntos dentro de los municipios con sectores (el caso que importa)
+        np_rng = np.random.default_rng(SEED)
+        bounds = np.asarray(sectors.layer.bounds)
+        lons = np_rng.uniform(bounds[:, 0].min(), bounds[:, 2].max(), N_POINTS)
+        lats = np_rng.uniform(bounds[:, 1].min(), bounds[:, 3].max(), N_POINTS)
+        for lat, lon in zip(lats, lons): service.get_sector_from_coords(lat, lon) # Calentamiento
+        service.geocode_cache.clear()
+
+        t0 = time.perf_counter()
+        found = [service.get_sector_from_coords(lat, lon) for lat, lon in zip(lats, lons)]
+        sector_ms = (time.perf_counter() - t0) * 1000 / N_POINTS
+
+        # Verificación contra un contains lineal sobre toda la capa
+        all_geoms = sectors.layer.geometries(np.arange(len(sectors)))
+        mismatches = 0
+        for lat, lon, name in zip(lats[:200], lons[:200], found[:200]):
+            hits = np.flatnonzero(shapely.contains_xy(all_geoms, lon, lat))
+            expected = sectors.layer.names[hits[0]] if len(hits) else None
+            mismatches += expected != name
+
+        print(f"   🏘️  Municipio + sector: {sector_ms:.3f} ms/consulta ({N_POINTS} puntos, sin caché de geohash)")
+        if mismatches:
+            print(f"   ❌ {mismatches} sectores difieren del escaneo lineal.")
+        else:
+            print("   ✅ Sectores idénticos al escaneo lineal.")
+
+if __name__ == "__main__":
+    benchmark()
+    benchmark_sectors(RoutingService())
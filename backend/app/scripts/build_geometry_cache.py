@@ -0,0 +1,26 @@
+import sys
+import time
+from app.services.geometry_cache import GeometryCache, SECTORS_GEOJSON, SECTOR_NAME_PROPERTY, resolve_geojson_path
+
+def build_one(cache: GeometryCache, force: bool):
+    t0 = time.perf_counter()
+    cache_dir = cache.build() if force else cache.ensure()
+    print(f"✅ Caché de geometrías listo en {cache_dir} ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+    for f in sorted(cache_dir.iterdir()):
+        print(f"   - {f.name}: {f.stat().st_size / 1024:.1f} KB")
+
+def build(force: bool = False):
+    geojson_path = resolve_geojson_path()
+    if not geojson_path:
+        print("❌ GeoJSON de municipios no encontrado.")
+        return
+    build_one(GeometryCache(geojson_path), force)
+
+    # Colonias/AGEBs: opcional
+    sectors_path = resolve_geojson_path(SECTORS_GEOJSON)
+    if sectors_path:
+        build_one(GeometryCache(sectors_path, name_property=SECTOR_NAME_PROPERTY, render_maps=False), force)
+
+if __name__ == "__main__":
+    # Uso: python -m app.scripts.build_geometry_cache [--force]
+    build(force="--force" in sys.argv)
@@ -25,5 +25,41 @@ def fix_schema():
         print(f"❌ Error al parchear: {e}")
         print("   (Si dice que la columna ya es text, ignora este error)")
 
+def fix_ai_queue():
+    print("🔧 Agregando columnas de lease a citizen_requests...")
+    try:
+        with engine.connect() as connection:
+            connection.execute(text(
+                "ALTER TABLE citizen_requests ADD COLUMN IF NOT EXISTS analysis_attempts INTEGER NOT NULL DEFAULT 0;"
+            ))
+            connection.execute(text(
+                "ALTER TABLE citizen_requests ADD COLUMN IF NOT EXISTS analysis_lease_expires_at TIMESTAMP WITH TIME ZONE;"
+            ))
+            connection.commit()
+            print("✅ citizen_requests lista para la cola con leases.")
+    except Exception as e:
+        print(f"❌ Error al parchear citizen_requests: {e}")
+
+def fix_near_duplicates():
+    print("🔧 Agregando columnas de casi-duplicados a citizen_requests...")
+    try:
+        with engine.connect() as connection:
+            connection.execute(text(
+                "ALTER TABLE citizen_requests ADD COLUMN IF NOT EXISTS duplicate_of_id UUID "
+                "REFERENCES citizen_requests(id) ON DELETE SET NULL;"
+            ))
+            connection.execute(text(
+                "ALTER TABLE citizen_requests ADD COLUMN IF NOT EXISTS analysis_confidence DOUBLE PRECISION;"
+            ))
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_citizen_requests_duplicate_of_id ON citizen_requests (duplicate_of_id);"
+            ))
+            connection.commit()
+            print("✅ citizen_requests lista para agrupar casi-duplicados.")
+    except Exception as e:
+        print(f"❌ Error al parchear citizen_requests: {e}")
+
 if __name__ == "__main__":
-    fix_schema()
\ No newline at end of file
+    fix_schema()
+    fix_ai_queue()
+    fix_near_duplicates()
\ No newline at end of file
@@ -1,16 +1,13 @@
-import pandas as pd
-import requests
-import json
+import sys
 import time
-import random
-from datetime import datetime
+import requests
 
 # --- CONFIGURACIÓN ---
 API_URL = "http://localhost:8000/api"
 ADMIN_EMAIL = "gobernador@yucatan.gob.mx"
 ADMIN_PASS = "admin"
-CSV_FILE = "datos_pnt.csv"
-CHUNK_SIZE = 50 # Enviar de 50 en 50
+CSV_FILE = "datos_pnt.csv" # También acepta .xlsx
+POLL_SECONDS = 2
 
 def login():
     print("🔑 Iniciando sesión...")
@@ -27,87 +24,53 @@ def login():
         print(f"❌ No hay conexión: {e}")
     return None
 
-def clean_folio(folio_raw):
-    return str(folio_raw).replace('=', '').replace('"', '').strip()
-
-def map_status(pnt_status):
-    s = str(pnt_status).lower()
-    if "terminada" in s or "entregada" in s: return "Atendida"
-    if "proceso" in s or "trámite" in s: return "En revisión"
-    if "desechada" in s or "cancelada" in s: return "Rechazada"
-    return "Recibida"
+def wait_for_job(job_id, headers):
+    """Consulta el avance del job hasta que termine. Si se corta, se puede volver a consultar con el mismo ID."""
+    while True:
+        job = requests.get(f"{API_URL}/imports/{job_id}", headers=headers).json()
+        print(
+            f"   ⏳ {job['status']}: {job['rows_read']} leídos, {job['rows_inserted']} insertados, "
+            f"{job['rows_skipped']} omitidos, {job['rows_failed']} fallidos ({job['rows_per_second'] or 0} renglones/s)"
+        )
+        if job["status"] not in ("PENDIENTE", "PROCESANDO"):
+            return job
+        time.sleep(POLL_SECONDS)
 
-def parse_date(date_str):
-    # Intentar parsear DD/MM/YYYY
-    try:
-        return datetime.strptime(str(date_str).strip(), "%d/%m/%Y").isoformat()
-    except:
-        return datetime.now().isoformat()
-
-def import_data():
+def import_data(path=CSV_FILE):
     token = login()
     if not token: return
     headers = {"Authorization": f"Bearer {token}"}
-    
-    print(f"📂 Leyendo {CSV_FILE}...")
+
+    # El servidor guarda el archivo y lo procesa por bloques con checkpoints (sin lotes desde el cliente);
+    # ESTATUS, FECHASOLICITUD y TEXTORESPUESTA también se mapean allá
+    print(f"📂 Subiendo {path}...")
     try:
-        df = pd.read_csv(CSV_FILE, encoding='latin-1')
-    except:
-        print("❌ No se encontró el archivo datos_pnt.csv")
+        with open(path, "rb") as f:
+            resp = requests.post(f"{API_URL}/imports", headers=headers, files={"file": (path, f)})
+    except FileNotFoundError:
+        print(f"❌ No se encontró el archivo {path}")
         return
+    if resp.status_code != 202:
+        print(f"⚠️ Error al crear la importación: {resp.text}")
+        return
+    job_id = resp.json()["id"]
+    print(f"🆔 Importación {job_id} creada.")
 
-    total_rows = len(df)
-    print(f"📊 Total registros: {total_rows}. Iniciando carga por lotes de {CHUNK_SIZE}...")
-
-    # Iterar por chunks
-    for i in range(0, total_rows, CHUNK_SIZE):
-        chunk = df.iloc[i:i+CHUNK_SIZE]
-        batch_payload = []
-        
-        for _, row in chunk.iterrows():
-            try:
-                folio = clean_folio(row.get('FOLIO', ''))
-                if not folio: continue
-                
-                desc = str(row.get('DESCRIPCIONSOLICITUD', 'Sin descripción'))
-                resp_text = str(row.get('TEXTORESPUESTA', ''))
-                status = map_status(row.get('ESTATUS', ''))
-                date_created = parse_date(row.get('FECHASOLICITUD', ''))
-                
-                # Limpieza
-                if pd.isna(desc) or desc == 'nan': desc = "Solicitud importada"
-                if pd.isna(resp_text) or resp_text == 'nan': resp_text = None
-                
-                # Coordenadas aleatorias en Yucatán
-                lat = 20.967 + (random.uniform(-0.1, 0.1))
-                lon = -89.623 + (random.uniform(-0.1, 0.1))
-
-                item = {
-                    "folio": folio,
-                    "description": desc[:2000],
-                    "location_text": f"Importado PNT - {row.get('MUNICIPIO', 'Yucatán')}",
-                    "latitude": lat,
-                    "longitude": lon,
-                    "status": status,
-                    "official_response": resp_text[:2000] if resp_text else None,
-                    "created_at": date_created
-                }
-                batch_payload.append(item)
-            except:
-                continue
-        
-        if batch_payload:
-            # Enviar Lote
-            r = requests.post(f"{API_URL}/requests/bulk", json=batch_payload, headers=headers)
-            if r.status_code == 201:
-                print(f"✅ Lote {i//CHUNK_SIZE + 1}: {r.json()['message']}")
-            else:
-                print(f"⚠️ Error en lote {i}: {r.text}")
-        
-        # Pequeña pausa para respirar
-        time.sleep(0.1)
-
+    job = wait_for_job(job_id, headers)
+    if job["status"] == "ERROR":
+        # Se retoma desde el último checkpoint sin duplicar renglones
+        print(f"⚠️ La importación se detuvo: {job['error']}. Reintentar con: python -m app.scripts.import_pnt_data --resume {job_id}")
+        return
     print("\n🏁 Carga masiva finalizada.")
 
 if __name__ == "__main__":
-    import_data()
\ No newline at end of file
+    args = sys.argv[1:]
+    if args[:1] == ["--resume"] and len(args) > 1:
+        token = login()
+        if token:
+            resp = requests.post(f"{API_URL}/imports/{args[1]}/resume", headers={"Authorization": f"Bearer {token}"})
+            print(f"♻️ {resp.status_code}: {resp.json().get('status', resp.json().get('detail'))}")
+            if resp.status_code in (202, 409):
+                wait_for_job(args[1], {"Authorization": f"Bearer {token}"})
+    else:
+        import_data(args[0] if args else CSV_FILE)
@@ -0,0 +1,79 @@
+import fiona
+import os
+import sys
+from pathlib import Path
+from fiona.transform import transform_geom
+
+# Campos que, si existen en el shapefile, se usan como nombre del sector (colonias/asentamientos)
+NAME_FIELDS = ("NOMBRE", "NOM_ASEN", "NOM_COL", "NOMGEO")
+
+def sector_properties(props: dict) -> dict:
+    """
+    Normaliza a CVEGEO / CVE_MUN / NOMBRE. Los primeros 5 dígitos del CVEGEO (entidad + municipio)
+    son los que usa el ruteo para colgar cada sector de su municipio.
+    """
+    cvegeo = props.get("CVEGEO") or "".join(
+        str(props.get(field) or "") for field in ("CVE_ENT", "CVE_MUN", "CVE_LOC", "CVE_AGEB")
+    )
+    name = next((props[field] for field in NAME_FIELDS if props.get(field)), None)
+    if not name and props.get("CVE_AGEB"):
+        name = f"AGEB {props['CVE_LOC']}-{props['CVE_AGEB']}" if props.get("CVE_LOC") else f"AGEB {props['CVE_AGEB']}"
+    return {"CVEGEO": cvegeo, "CVE_MUN": cvegeo[:5], "NOMBRE": name or cvegeo}
+
+def convert_sectors_to_geojson(source_name: str = "31a.shp"):
+    BASE_DIR = Path(__file__).resolve().parent.parent.parent
+    # 31a.shp = AGEB urbanas del Marco Geoestadístico; también acepta un shapefile de colonias con CVEGEO
+    SOURCE_PATH = BASE_DIR / "31_yucatan" / "conjunto_de_datos" / source_name
+    OUTPUT_PATH = BASE_DIR / "app" / "data" / "yucatan_sectores.geojson"
+
+    print(f"🔄 Procesando: {SOURCE_PATH}")
+
+    if not SOURCE_PATH.exists():
+        print("❌ Archivo no encontrado.")
+        return
+
+    try:
+        if OUTPUT_PATH.exists():
+            os.remove(OUTPUT_PATH)
+        OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
+
+        with fiona.open(str(SOURCE_PATH), 'r') as source:
+            print(f"ℹ️  Total sectores en origen: {len(source)}")
+
+            meta = source.meta.copy()
+            meta['driver'] = 'GeoJSON'
+            meta['crs'] = 'EPSG:4326'
+            meta['schema']['geometry'] = 'Unknown'
+            meta['schema']['properties'] = {'CVEGEO': 'str', 'CVE_MUN': 'str', 'NOMBRE': 'str'}
+
+            print("🚀 Transformando coordenadas...")
+            count = 0
+
+            with fiona.open(str(OUTPUT_PATH), 'w', **meta) as sink:
+                for feature in source:
+                    try:
+                        # Transformar de ITRF92 a WGS84
+                        new_geom = transform_geom(source.crs, 'EPSG:4326', feature['geometry'])
+                        new_props = sector_properties(dict(feature['properties']))
+                        if len(new_props['CVEGEO']) < 5:
+                            print(f"⚠️ Sector {feature['id']} sin clave de municipio, se omite.")
+                            continue
+
+                        sink.write({
+                            'type': 'Feature',
+                            'geometry': new_geom,
+                            'properties': new_props
+                        })
+                        count += 1
+                    except Exception as e_row:
+                        print(f"⚠️ Error en sector {feature['id']}: {e_row}")
+
+            print(f"✅ ¡ÉXITO! Se guardaron {count} de {len(source)} sectores.")
+            print(f"💾 GeoJSON listo en: {OUTPUT_PATH}")
+            print("ℹ️  Ejecuta scripts/build_geometry_cache.py para generar su caché binario.")
+
+    except Exception as e:
+        print(f"❌ Error crítico: {e}")
+
+if __name__ == "__main__":
+    convert_sectors_to_geojson(*sys.argv[1:2])
@@ -0,0 +1,100 @@
+"""
+Entrena el clasificador local (TF-IDF + regresión logística) con las solicitudes ya clasificadas.
+
+Uso: python -m app.scripts.train_local_classifier
+
+Sólo aprende de etiquetas directas del LLM (analysis_confidence NULL): las copiadas de un
+casi-duplicado o puestas por el propio modelo local no vuelven a entrar al entrenamiento.
+Evalúa con un holdout, reentrena con todo y deja el artefacto donde lo lee el worker
+(AI_LOCAL_MODEL_PATH); los workers lo recargan solos al detectar el cambio.
+"""
+import random
+import sys
+import time
+from collections import Counter
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models.requests import CitizenRequest, AnalysisStatus
+from app.services.local_classifier import FIELDS, LocalClassifier, resolve_model_path
+
+# --- CONFIGURACIÓN ---
+MIN_ROWS = 200
+HOLDOUT = 0.2
+SEED = 42
+DEPT_PREFIX = "[IA Sugiere Dept]: "
+
+def load_rows():
+    db = SessionLocal()
+    try:
+        return db.query(
+            CitizenRequest.description, CitizenRequest.topic, CitizenRequest.urgency, CitizenRequest.sentiment,
+            CitizenRequest.request_type, CitizenRequest.suggested_action, CitizenRequest.internal_notes,
+        ).filter(
+            CitizenRequest.analysis_status == AnalysisStatus.completado,
+            CitizenRequest.analysis_confidence.is_(None),
+        ).all()
+    finally:
+        db.close()
+
+def labels_of(rows) -> dict:
+    return {field: [getattr(row, field).value for row in rows] for field in FIELDS}
+
+def topic_defaults(rows) -> dict:
+    """Dependencia y acción sugerida más frecuentes por tema (el modelo local no genera texto)."""
+    departments, actions = {}, {}
+    for row in rows:
+        topic = row.topic.value
+        if row.internal_notes and row.internal_notes.startswith(DEPT_PREFIX):
+            departments.setdefault(topic, Counter())[row.internal_notes[len(DEPT_PREFIX):]] += 1
+        if row.suggested_action:
+            actions.setdefault(topic, Counter())[row.suggested_action] += 1
+    return {
+        topic: {
+            "department": departments[topic].most_common(1)[0][0] if topic in departments else None,
+            "suggested_action": actions[topic].most_common(1)[0][0] if topic in actions else "Revisar caso",
+        }
+        for topic in set(departments) | set(actions)
+    }
+
+def evaluate(model: LocalClassifier, rows, threshold: float) -> dict:
+    predictions = model.predict([row.description for row in rows])
+    expected = labels_of(rows)
+    metrics = {
+        f"{field}_accuracy": round(sum(values[field] == expected[field][i] for i, (values, _) in enumerate(predictions)) / len(rows), 4)
+        for field in FIELDS
+    }
+    confident = [i for i, (_, confidence) in enumerate(predictions) if confidence >= threshold]
+    metrics["coverage"] = round(len(confident) / len(rows), 4)
+    metrics["confident_accuracy"] = round(
+        sum(all(predictions[i][0][field] == expected[field][i] for field in FIELDS) for i in confident) / len(confident), 4
+    ) if confident else 0.0
+    metrics["holdout_rows"] = len(rows)
+    return metrics
+
+def train():
+    rows = load_rows()
+    if len(rows) < MIN_ROWS:
+        print(f"❌ Sólo hay {len(rows)} solicitudes clasificadas por el LLM (mínimo {MIN_ROWS}).")
+        return 1
+
+    random.Random(SEED).shuffle(rows)
+    cut = int(len(rows) * (1 - HOLDOUT))
+    train_rows, holdout_rows = rows[:cut], rows[cut:]
+    threshold = settings.AI_LOCAL_MODEL_THRESHOLD
+
+    t0 = time.perf_counter()
+    candidate = LocalClassifier.fit([row.description for row in train_rows], labels_of(train_rows), topic_defaults(train_rows))
+    metrics = evaluate(candidate, holdout_rows, threshold)
+    print(f"📊 Holdout ({len(holdout_rows)} filas, umbral {threshold}): {metrics} ({time.perf_counter() - t0:.1f} s)")
+
+    # Modelo final con todas las filas
+    model = LocalClassifier.fit([row.description for row in rows], labels_of(rows), topic_defaults(rows))
+    metrics["train_rows"] = len(rows)
+    metrics["threshold"] = threshold
+    path = resolve_model_path(settings.AI_LOCAL_MODEL_PATH)
+    model.save(path, metrics)
+    print(f"✅ Clasificador local guardado en {path} ({path.stat().st_size / 1024:.0f} KB, {len(model.vocabulary)} términos).")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(train())
@@ -1,17 +1,213 @@
+import hashlib
 import json
 import logging
 import asyncio
 import math
-from typing import List, Dict, Any
-from openai import AsyncOpenAI
-from sqlalchemy.orm import Session
+import os
+import re
+import threading
+import time
+import numpy as np
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Dict
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI, RateLimitError
+from sqlalchemy import Float, Integer, String, Text, and_, bindparam, case, cast, column, func, or_, select, text, update
+from sqlalchemy import values as sa_values
+from sqlalchemy.dialects.postgresql import UUID as PG_UUID
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session, aliased
 from app.core.config import settings
 from app.models.requests import CitizenRequest, Topic, Urgency, Sentiment, RequestType, AnalysisStatus
 from app.models.organization import Department
+from app.models.ai_cache import AIClassificationCache
+from app.services.dedup_service import near_duplicate_service, text_hash
+from app.services.local_classifier import LocalClassifier, resolve_model_path
+from app.services.prompt_service import prompt_service
+from app.services.routing_service import routing_service
+from app.services.tile_service import tile_service
 from app.database import SessionLocal
 
 logger = logging.getLogger(__name__)
 
+# Canal LISTEN/NOTIFY con el que la API despierta a los workers dedicados
+AI_QUEUE_CHANNEL = "ai_queue"
+
+class AdaptiveTokenBucket:
+    """
+    Token bucket para las llamadas al LLM (AIMD): arranca en el RPM configurado,
+    se reduce a la mitad con cada 429 (respetando Retry-After), un poco si la latencia
+    se dispara, y recupera la tasa gradualmente con cada respuesta sana.
+    Sin locks: se usa desde un solo event loop y no hay await entre revisar y descontar.
+    """
+    MIN_FRACTION = 0.05 # Nunca por debajo del 5% del RPM configurado
+    RECOVERY_FRACTION = 0.05 # Aumento aditivo por respuesta exitosa
+    SLOW_FACTOR = 2.0 # Latencia > 2x el promedio móvil = el proveedor está saturado
+
+    def __init__(self, requests_per_minute: int, burst: int = 1):
+        self.max_rate = max(requests_per_minute, 1) / 60.0
+        self.rate = self.max_rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.latency_ewma = None
+        self.rate_limited = 0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _set_rate(self, rate: float):
+        self._refill(time.monotonic())
+        self.rate = min(self.max_rate, max(self.max_rate * self.MIN_FRACTION, rate))
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._refill(now)
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def on_success(self, latency: float):
+        slow = self.latency_ewma is not None and latency > self.SLOW_FACTOR * self.latency_ewma
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        self._set_rate(self.rate * 0.8 if slow else self.rate + self.max_rate * self.RECOVERY_FRACTION)
+
+    def on_rate_limited(self, retry_after: float | None = None):
+        self.rate_limited += 1
+        self._set_rate(self.rate / 2)
+        self.tokens = 0.0
+        self._paused_until = max(self._paused_until, time.monotonic() + (retry_after or 1 / self.rate))
+
+    def stats(self) -> dict:
+        return {
+            "requests_per_minute": round(self.rate * 60, 1),
+            "max_requests_per_minute": round(self.max_rate * 60, 1),
+            "rate_limited": self.rate_limited,
+            "latency_ewma": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+        }
+
+CACHED_COLUMNS = ("topic", "urgency", "sentiment", "request_type", "suggested_action", "department")
+
+def map_enum(enum_cls, value, default):
+    """Mapeo robusto de la respuesta del modelo (case insensitive) al enum."""
+    try:
+        # Intento directo
+        return enum_cls(value)
+    except ValueError:
+        # Intento case-insensitive
+        for member in enum_cls:
+            if member.value.upper() == str(value).upper():
+                return member
+        return default
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimación local (sin tokenizer del proveedor): cada signo cuenta 1 y cada palabra
+    1 token por cada 6 caracteres, como suelen partirse en BPE las palabras largas en español.
+    """
+    return sum(1 + (len(tok) - 1) // 6 for tok in _TOKEN_PATTERN.findall(str(text or "")))
+
+def truncate_for_prompt(text: str, max_tokens: int) -> str:
+    """
+    Colapsa espacios y, si excede `max_tokens`, conserva el inicio (qué se pide) y el final
+    (ubicación, datos de contacto) cortando en palabra completa.
+    """
+    clean = " ".join(str(text or "").split())
+    if estimate_tokens(clean) <= max_tokens: return clean
+    words = clean.split(" ")
+    costs = [estimate_tokens(word) for word in words]
+    head_budget = max_tokens * 2 // 3
+    tail_budget = max_tokens - head_budget - 1
+    head, used = [], 0
+    for word, cost in zip(words, costs):
+        if used + cost > head_budget: break
+        head.append(word); used += cost
+    tail, used = [], 0
+    for word, cost in zip(reversed(words[len(head):]), reversed(costs[len(head):])):
+        if used + cost > tail_budget: break
+        tail.append(word); used += cost
+    return " ".join(head) + " … " + " ".join(reversed(tail))
+
+def item_tokens(description: str) -> int:
+    """Costo de una solicitud dentro de una llamada: texto (truncado), envoltura JSON y respuesta esperada."""
+    text = truncate_for_prompt(description, settings.AI_MAX_ITEM_TOKENS)
+    return estimate_tokens(text) + 12 + settings.AI_OUTPUT_TOKENS_PER_ITEM
+
+def pack_batch(costs: List[int], budget: int) -> List[int]:
+    """
+    Índices (en orden de llegada) que caben en `budget`. El primero siempre entra; los que no
+    caben se saltan para aprovechar el espacio con otros más cortos y quedan primeros en la cola.
+    """
+    chosen, used = [], 0
+    for i, cost in enumerate(costs):
+        if chosen and used + cost > budget: continue
+        chosen.append(i); used += cost
+    return chosen
+
+def encode_items(items: List[dict]) -> str:
+    """Entrada compacta para el LLM: una línea FOLIO|TEXTO por solicitud (en lugar de JSON con llaves y comillas)."""
+    return "\n".join(f"{item['folio']}|{' '.join(str(item['texto']).split()).replace('|', '/')}" for item in items)
+
+def folio_key(value) -> str:
+    """Folio normalizado para cruzar la respuesta: el modelo puede devolver folios numéricos como números JSON."""
+    return str(value if value is not None else "").strip()
+
+class JSONObjectStream:
+    """
+    Parser tolerante de la respuesta en streaming: entrega cada objeto con "folio" en cuanto
+    se cierra su llave, sin esperar al final del arreglo. Ignora envolturas ({"clasificaciones": [...]}),
+    bloques ``` y texto suelto; un objeto mal formado o cortado sólo pierde ese folio.
+    """
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._starts = []
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, chunk: str) -> List[dict]:
+        self._text += chunk
+        found = []
+        for i in range(self._pos, len(self._text)):
+            ch = self._text[i]
+            if self._in_string:
+                if self._escaped: self._escaped = False
+                elif ch == "\\": self._escaped = True
+                elif ch == '"': self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._starts.append(i)
+            elif ch == "}" and self._starts:
+                start = self._starts.pop()
+                try:
+                    obj = json.loads(self._text[start:i + 1])
+                except ValueError:
+                    continue
+                if isinstance(obj, dict) and "folio" in obj:
+                    found.append(obj)
+        self._pos = len(self._text)
+        return found
+
+def _retry_after(error: RateLimitError) -> float | None:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _llm_unreachable(error: Exception) -> bool:
+    """Sin conexión, timeout o 5xx: falla del proveedor, no de las solicitudes del lote."""
+    return isinstance(error, APIConnectionError) or (isinstance(error, APIStatusError) and error.status_code >= 500)
+
 class AIService:
     def __init__(self):
         if settings.DEEPSEEK_API_KEY:
@@ -19,161 +215,866 @@ class AIService:
                 api_key=settings.DEEPSEEK_API_KEY,
                 base_url=settings.DEEPSEEK_BASE_URL
             )
+            # El worker gestiona sus propios reintentos: necesita ver los 429 para frenar.
+            # El timeout queda muy por debajo del lease para no procesar filas ya reclamadas por otro.
+            self.worker_client = self.client.with_options(max_retries=0, timeout=settings.AI_LEASE_SECONDS / 2)
             self.model = settings.DEEPSEEK_MODEL
         else:
             self.client = None
+        self.rate_limiter = AdaptiveTokenBucket(settings.AI_REQUESTS_PER_MINUTE, burst=settings.AI_WORKER_CONCURRENCY)
+        # Cualquier cambio al prompt invalida el caché de clasificaciones
+        self.prompt_version = hashlib.sha256(self._get_system_prompt().encode("utf-8")).hexdigest()[:16]
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # Aprovechamiento de las llamadas del worker
+        self.llm_calls = 0
+        self.llm_items = 0
+        self.llm_prompt_tokens = 0
+        self.llm_completion_tokens = 0
+        self.llm_splits = 0
+        self.llm_first_item_seconds = 0.0
+        self.llm_cached_prompt_tokens = 0
+        # Clasificador local: se recarga si el artefacto cambia en disco (reentrenamiento)
+        self.local_model_path = resolve_model_path(settings.AI_LOCAL_MODEL_PATH)
+        self._local_model = None
+        self._local_model_mtime = None
+        self.local_hits = 0
+        # Worker inline: una sola corrida por proceso; los avisos durante la corrida piden otra pasada
+        self._inline_lock = threading.Lock()
+        self._inline_rerun = False
+        # Firmas MinHash de las pendientes sin grupo, entre corridas: sólo se firman las filas nuevas
+        self._cluster_signatures: Dict = {}
+        self._cluster_lock = threading.Lock()
+
+    def _get_system_prompt(self) -> str:
+        # Compilado una vez en prompt_service: mismo prefijo byte a byte en cada llamada (caché del proveedor)
+        return prompt_service.classification_system_prompt
+
+    # --- Caché de clasificaciones (texto normalizado + versión de prompt + modelo) ---
+    @staticmethod
+    def _classification_from_item(item: dict) -> dict:
+        """Respuesta del modelo -> columnas normalizadas (enums válidos), tal como se guardan en el caché."""
+        return {
+            "topic": map_enum(Topic, item.get("topic"), Topic.otros),
+            "urgency": map_enum(Urgency, item.get("urgency"), Urgency.media),
+            "sentiment": map_enum(Sentiment, item.get("sentiment"), Sentiment.neutro),
+            "request_type": map_enum(RequestType, item.get("tipo"), RequestType.desconocida),
+            "suggested_action": item.get("suggested_action", "Revisar caso"),
+            "department": item.get("department"),
+        }
+
+    # --- Clasificador local (TF-IDF + regresión logística entrenado con lo ya clasificado) ---
+    def local_model(self) -> LocalClassifier | None:
+        if settings.AI_LOCAL_MODEL_THRESHOLD > 1: return None
+        try:
+            mtime = os.path.getmtime(self.local_model_path)
+        except OSError:
+            self._local_model = self._local_model_mtime = None
+            return None
+        if mtime != self._local_model_mtime:
+            try:
+                self._local_model = LocalClassifier.load(self.local_model_path)
+                logger.info(f"🧠 Clasificador local cargado: {self.local_model_path} ({len(self._local_model.vocabulary)} términos).")
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo cargar el clasificador local ({e}). Todo irá al LLM.")
+                self._local_model = None
+            self._local_model_mtime = mtime
+        return self._local_model
+
+    def _local_classify(self, texts: List[str]) -> list | None:
+        """[(valores normalizados, confianza)] o None si no hay modelo local."""
+        model = self.local_model()
+        if model is None or not texts: return None
+        return [
+            (self._classification_from_item({**values, "tipo": values.get("request_type")}), confidence)
+            for values, confidence in model.predict(texts)
+        ]
+
+    @staticmethod
+    def _entry_values(entry: AIClassificationCache) -> dict:
+        return {column: getattr(entry, column) for column in CACHED_COLUMNS}
+
+    def _cache_lookup(self, db: Session, hashes) -> Dict[str, AIClassificationCache]:
+        if not hashes: return {}
+        rows = db.query(AIClassificationCache).filter(
+            AIClassificationCache.text_hash.in_(list(hashes)),
+            AIClassificationCache.prompt_version == self.prompt_version,
+            AIClassificationCache.model == settings.DEEPSEEK_MODEL,
+        ).all()
+        return {row.text_hash: row for row in rows}
 
-    def _get_system_prompt(self):
-        return """
-        Eres un Coordinador de Despacho del Gobierno de Yucatán.
-        Tu trabajo es leer solicitudes y decidir QUIÉN las atiende y QUÉ deben hacer.
-
-        TU MISIÓN:
-        1. Clasificar TIPO: ADMINISTRATIVA (Papeles/Info) vs OPERATIVA (Acción en calle).
-        2. Asignar DEPENDENCIA: ¿Quién resuelve esto? (SSP, Salud, JAPAY, Ayuntamiento, Transparencia).
-        3. Dictar ACCIÓN SUGERIDA: ¿Cuál es el siguiente paso lógico?
-        4. Determinar URGENCIA y SENTIMIENTO.
-
-        REGLAS DE NEGOCIO:
-        - Si piden estadísticas, contratos o leyes -> Depto: "Transparencia" | Tipo: ADMINISTRATIVA.
-        - Si reportan un delito o riesgo -> Depto: "SSP" | Tipo: OPERATIVA.
-        - Si es bache/luz -> Depto: "Servicios Públicos" | Tipo: OPERATIVA.
-
-        SALIDA JSON OBLIGATORIA (Lista de objetos):
-        [
-          {
-            "folio": "...", 
-            "tipo": "ADMINISTRATIVA" | "OPERATIVA", 
-            "topic": "Seguridad" | "Salud" | "Transporte" | "Servicios Públicos" | "Educación" | "Transparencia" | "Otros", 
-            "urgency": "Baja" | "Media" | "Alta" | "Crítica", 
-            "sentiment": "Positivo" | "Neutro" | "Negativo",
-            "department": "Nombre de la dependencia",
-            "suggested_action": "Acción concreta a realizar"
-          }
+    def _cache_touch(self, db: Session, counts: Counter):
+        """Suma los aciertos por entrada en un solo executemany."""
+        if not counts: return
+        table = AIClassificationCache.__table__
+        db.connection().execute(
+            update(table)
+            .where(
+                table.c.text_hash == bindparam("b_hash"),
+                table.c.prompt_version == self.prompt_version,
+                table.c.model == settings.DEEPSEEK_MODEL,
+            )
+            .values(hits=table.c.hits + bindparam("b_count"), last_hit_at=func.now()),
+            [{"b_hash": key, "b_count": n} for key, n in counts.items()],
+        )
+
+    def _cache_store(self, db: Session, classifications: Dict[str, dict]):
+        if not classifications: return
+        db.execute(
+            pg_insert(AIClassificationCache)
+            .values([
+                {"text_hash": key, "prompt_version": self.prompt_version, "model": settings.DEEPSEEK_MODEL, **values}
+                for key, values in classifications.items()
+            ])
+            .on_conflict_do_nothing()
+        )
+
+    def apply_cached_classifications(self, db: Session, chunk_size: int = 1000) -> int:
+        """
+        Resuelve desde el caché, en bloque y antes de cualquier llamada al LLM, todas las
+        solicitudes pendientes cuyo texto ya se clasificó (reimportaciones, force_reanalysis).
+        """
+        keys = [
+            (req_id, text_hash(description))
+            for req_id, description in db.query(CitizenRequest.id, CitizenRequest.description)
+            .filter(CitizenRequest.analysis_status == AnalysisStatus.pendiente)
+            .yield_per(chunk_size)
         ]
+        table = CitizenRequest.__table__
+        stmt = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"), table.c.analysis_status == AnalysisStatus.pendiente)
+            .values(
+                topic=bindparam("b_topic"), urgency=bindparam("b_urgency"), sentiment=bindparam("b_sentiment"),
+                request_type=bindparam("b_request_type"), suggested_action=bindparam("b_suggested_action"),
+                internal_notes=bindparam("b_internal_notes"), analysis_status=AnalysisStatus.completado,
+                analysis_lease_expires_at=None,
+            )
+        )
+        applied = 0
+        for i in range(0, len(keys), chunk_size):
+            chunk = keys[i:i + chunk_size]
+            entries = self._cache_lookup(db, {key for _, key in chunk})
+            params = []
+            for req_id, key in chunk:
+                entry = entries.get(key)
+                if not entry: continue
+                params.append({
+                    "b_id": req_id, "b_topic": entry.topic, "b_urgency": entry.urgency,
+                    "b_sentiment": entry.sentiment, "b_request_type": entry.request_type,
+                    "b_suggested_action": entry.suggested_action,
+                    "b_internal_notes": f"[IA Sugiere Dept]: {entry.department}" if entry.department else None,
+                })
+            if not params: continue
+            # Una fila reclamada por otro worker en el intermedio no coincide con el WHERE y se omite
+            applied += db.connection().execute(stmt, params).rowcount
+            self._cache_touch(db, Counter(key for req_id, key in chunk if key in entries))
+            db.commit()
+            self.route_classified(db, [p["b_id"] for p in params])
+        if applied:
+            # Reclasificación masiva (reimportación, force_reanalysis): como en las importaciones, todo el mapa
+            tile_service.invalidate_requests()
+            self.cache_hits += applied
+            logger.info(f"♻️  {applied} solicitudes clasificadas desde el caché sin llamar al LLM.")
+        return applied
+
+    # --- Casi-duplicados: una llamada al LLM por grupo, la etiqueta se copia a los miembros ---
+    def cluster_pending(self, db: Session, chunk_size: int = 1000) -> int:
         """
+        Agrupa las solicitudes pendientes casi idénticas (MinHash/LSH). El representante de cada
+        grupo es la más antigua y se clasifica normalmente; los miembros quedan con duplicate_of_id
+        y no se reclaman mientras su representante esté en la cola.
 
-    async def classify_request(self, text: str) -> Dict[str, Any]:
-        if not self.client:
-            return {"topic": Topic.otros, "sentiment": Sentiment.neutro, "urgency": Urgency.media}
-        try:
-            payload = [{"folio": "SINGLE", "texto": text[:500]}]
-            user_prompt = json.dumps(payload, ensure_ascii=False)
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "system", "content": self._get_system_prompt()}, {"role": "user", "content": user_prompt}],
-                temperature=0.1,
-                response_format={ "type": "json_object" }
-            )
-            content = response.choices[0].message.content
-            if "```json" in content: content = content.replace("```json", "").replace("```", "")
-            result_json = json.loads(content)
-            item = result_json[0] if isinstance(result_json, list) and result_json else {}
-            if isinstance(result_json, dict):
-                for val in result_json.values():
-                    if isinstance(val, list) and val: item = val[0]; break
-            
-            return {
-                "topic": item.get("topic", "Otros"),
-                "urgency": item.get("urgency", "Media"),
-                "sentiment": item.get("sentiment", "Neutro"),
-                "request_type": item.get("tipo", "DESCONOCIDA"),
-                "suggested_action": item.get("suggested_action", "")
+        Incremental: las firmas se conservan entre corridas y sólo se firman (y comparan) las filas
+        que no estaban en la pasada anterior; una solicitud nueva no vuelve a firmar toda la cola.
+        """
+        threshold = settings.AI_NEAR_DUPLICATE_THRESHOLD
+        if threshold >= 1: return 0
+        with self._cluster_lock:
+            rows = (
+                db.query(CitizenRequest.id)
+                .filter(CitizenRequest.analysis_status == AnalysisStatus.pendiente, CitizenRequest.duplicate_of_id.is_(None))
+                .order_by(CitizenRequest.created_at, CitizenRequest.id)
+                .all()
+            )
+            known = self._cluster_signatures
+            new_ids = [req_id for req_id, in rows if req_id not in known]
+            for i in range(0, len(new_ids), chunk_size):
+                chunk = db.query(CitizenRequest.id, CitizenRequest.description).filter(
+                    CitizenRequest.id.in_(new_ids[i:i + chunk_size])
+                ).all()
+                known.update(zip([req_id for req_id, _ in chunk], near_duplicate_service.signatures([d for _, d in chunk])))
+            # Lo clasificado o agrupado desde la pasada anterior (o borrado en el intermedio) sale del índice
+            rows = [row for row in rows if row.id in known]
+            self._cluster_signatures = {row.id: known[row.id] for row in rows}
+            if not new_ids or len(rows) < 2: return 0
+            fresh = set(new_ids)
+            pairs = near_duplicate_service.cluster_signatures(
+                np.array([self._cluster_signatures[row.id] for row in rows], dtype=np.uint64),
+                threshold,
+                fresh=np.array([row.id in fresh for row in rows]),
+            )
+        if not pairs: return 0
+
+        table = CitizenRequest.__table__
+        members = [
+            {"b_id": rows[member][0], "b_rep": rows[rep][0], "b_confidence": round(similarity, 4)}
+            for rep, member, similarity in pairs
+        ]
+        assign = (
+            update(table)
+            .where(
+                table.c.id == bindparam("b_id"),
+                table.c.analysis_status == AnalysisStatus.pendiente,
+                # Otro worker pudo agruparla en el intermedio
+                table.c.duplicate_of_id.is_(None),
+            )
+            .values(duplicate_of_id=bindparam("b_rep"), analysis_confidence=bindparam("b_confidence"))
+        )
+        # Un representante de una pasada anterior que ahora es miembro entrega sus miembros al nuevo
+        repoint = (
+            update(table)
+            .where(table.c.duplicate_of_id == bindparam("b_id"))
+            .values(duplicate_of_id=bindparam("b_rep"))
+        )
+        assigned = 0
+        for i in range(0, len(members), chunk_size):
+            chunk = members[i:i + chunk_size]
+            assigned += db.connection().execute(assign, chunk).rowcount
+            db.connection().execute(repoint, [{"b_id": m["b_id"], "b_rep": m["b_rep"]} for m in chunk])
+            db.commit()
+        if assigned:
+            logger.info(f"🧬 {assigned} solicitudes casi duplicadas heredarán la etiqueta de {len({p[0] for p in pairs})} representantes.")
+        return assigned
+
+    def propagate_cluster_labels(self, db: Session, rep_ids: list | None = None) -> int:
+        """Copia la clasificación de los representantes ya completados a sus miembros pendientes."""
+        table = CitizenRequest.__table__
+        rep = table.alias("rep")
+        conditions = [
+            table.c.duplicate_of_id == rep.c.id,
+            rep.c.analysis_status == AnalysisStatus.completado,
+            table.c.analysis_status == AnalysisStatus.pendiente,
+        ]
+        if rep_ids is not None:
+            if not rep_ids: return 0
+            conditions.append(rep.c.id.in_(list(rep_ids)))
+        propagated = db.connection().execute(
+            update(table)
+            .where(*conditions)
+            .values(
+                topic=rep.c.topic, urgency=rep.c.urgency, sentiment=rep.c.sentiment,
+                request_type=rep.c.request_type, suggested_action=rep.c.suggested_action,
+                internal_notes=rep.c.internal_notes, analysis_status=AnalysisStatus.completado,
+                analysis_lease_expires_at=None,
+            )
+            .returning(table.c.id, table.c.latitude, table.c.longitude)
+        ).all()
+        db.commit()
+        self._invalidate_tiles([(row.latitude, row.longitude) for row in propagated])
+        self.route_classified(db, [row.id for row in propagated])
+        propagated = len(propagated)
+        if propagated:
+            self.cache_hits += propagated
+            logger.info(f"🧬 {propagated} casi-duplicados clasificados con la etiqueta de su representante.")
+        return propagated
+
+    def cache_stats(self, db: Session) -> dict:
+        entries, stored_hits = db.query(
+            func.count(AIClassificationCache.text_hash), func.coalesce(func.sum(AIClassificationCache.hits), 0)
+        ).filter(
+            AIClassificationCache.prompt_version == self.prompt_version,
+            AIClassificationCache.model == settings.DEEPSEEK_MODEL,
+        ).one()
+        total = self.cache_hits + self.cache_misses
+        return {
+            "prompt_version": self.prompt_version,
+            "model": settings.DEEPSEEK_MODEL,
+            "entries": entries,
+            "stored_hits": int(stored_hits),
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_ratio": round(self.cache_hits / total, 4) if total else 0.0,
+        }
+
+    def _prepare_batch(self, db: Session, ids: list):
+        """
+        Parte síncrona previa al LLM (corre en un hilo): carga el lote, aplica aciertos del caché y del
+        clasificador local y agrupa textos repetidos. Devuelve sólo datos planos para el event loop.
+        """
+        rows = db.query(
+            CitizenRequest.id, CitizenRequest.folio, CitizenRequest.description, CitizenRequest.analysis_attempts
+        ).filter(CitizenRequest.id.in_(ids)).all()
+        logger.info(f"⚡ Procesando lote de {len(rows)} solicitudes...")
+        # Intentos al momento del reclamo: si cambian, otro worker recuperó el lease vencido
+        claimed = {row.id: row.analysis_attempts for row in rows}
+        keys = {row.id: text_hash(row.description) for row in rows}
+
+        # 1. Aciertos del caché: se aplican sin llamar al LLM
+        entries = self._cache_lookup(db, set(keys.values()))
+        if entries:
+            hits = [row for row in rows if keys[row.id] in entries]
+            points = self._bulk_apply(db, [
+                (row.id, claimed[row.id], self._entry_values(entries[keys[row.id]]), None) for row in hits
+            ])
+            self._cache_touch(db, Counter(keys[row.id] for row in hits))
+            self.cache_hits += len(points)
+            db.commit()
+            self._invalidate_tiles(points)
+            rows = [row for row in rows if keys[row.id] not in entries]
+
+        # 1b. Clasificador local: lo que supera el umbral de confianza no va al LLM
+        local = self._local_classify([row.description for row in rows]) if rows else None
+        if local:
+            confident = {
+                row.id: prediction for row, prediction in zip(rows, local)
+                if prediction[1] >= settings.AI_LOCAL_MODEL_THRESHOLD
             }
-        except Exception as e:
-            logger.error(f"Error single classify: {e}")
-            return {"topic": "Otros", "sentiment": "Neutro", "urgency": "Media"}
+            points = self._bulk_apply(db, [
+                (req_id, claimed[req_id], values, confidence) for req_id, (values, confidence) in confident.items()
+            ])
+            self.local_hits += len(points)
+            db.commit()
+            self._invalidate_tiles(points)
+            rows = [row for row in rows if row.id not in confident]
 
-    async def _process_batch(self, db: Session, batch: List[CitizenRequest]):
-        if not self.client: return
+        # 2. Textos repetidos dentro del lote: un solo folio representativo por texto
+        groups = {}
+        for row in rows:
+            groups.setdefault(keys[row.id], []).append(row)
+        self.cache_hits += len(rows) - len(groups)
+        self.cache_misses += len(groups)
 
         items_to_send = []
         req_map = {}
-        for req in batch:
-            clean_desc = str(req.description).replace('\n', ' ').strip()[:600]
-            items_to_send.append({"folio": req.folio, "texto": clean_desc})
-            req_map[req.folio] = req
-            req.analysis_status = AnalysisStatus.procesando
-        
+        for same_text in groups.values():
+            row = same_text[0]
+            items_to_send.append({"folio": row.folio, "texto": truncate_for_prompt(row.description, settings.AI_MAX_ITEM_TOKENS)})
+            req_map[folio_key(row.folio)] = [r.id for r in same_text]
+        return claimed, keys, items_to_send, req_map
+
+    def _write_results(self, db: Session, results: list):
+        """Guarda en un solo UPDATE ... FROM (VALUES ...) las clasificaciones recibidas y las agrega al caché."""
+        points = self._bulk_apply(db, [
+            (req_id, attempts, values, None) for claimed, values, _ in results for req_id, attempts in claimed.items()
+        ])
+        self._cache_store(db, {key: values for _, values, key in results})
         db.commit()
+        self._invalidate_tiles(points)
 
-        try:
-            user_prompt = json.dumps(items_to_send, ensure_ascii=False)
-            response = await self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "system", "content": self._get_system_prompt()}, {"role": "user", "content": user_prompt}],
-                temperature=0.1,
-                response_format={ "type": "json_object" }
-            )
-            
-            content = response.choices[0].message.content
-            if "```json" in content: content = content.replace("```json", "").replace("```", "")
-            result_json = json.loads(content)
-            
-            results = []
-            if isinstance(result_json, dict):
-                for key, val in result_json.items():
-                    if isinstance(val, list): results = val; break
-                if not results: results = [result_json]
-            elif isinstance(result_json, list):
-                results = result_json
-
-            for item in results:
-                folio = item.get("folio")
-                req = req_map.get(folio)
-                if req:
-                    # --- MAPEO ROBUSTO (CASE INSENSITIVE) ---
-                    def map_enum(enum_cls, value, default):
-                        try:
-                            # Intento directo
-                            return enum_cls(value)
-                        except ValueError:
-                            # Intento case-insensitive
-                            for member in enum_cls:
-                                if member.value.upper() == str(value).upper():
-                                    return member
-                            return default
-
-                    req.topic = map_enum(Topic, item.get("topic"), Topic.otros)
-                    req.urgency = map_enum(Urgency, item.get("urgency"), Urgency.media)
-                    req.sentiment = map_enum(Sentiment, item.get("sentiment"), Sentiment.neutro)
-                    req.request_type = map_enum(RequestType, item.get("tipo"), RequestType.desconocida)
-                    
-                    req.suggested_action = item.get("suggested_action", "Revisar caso")
-                    dept_name = item.get("department")
-                    if dept_name: req.internal_notes = f"[IA Sugiere Dept]: {dept_name}"
-
-                    req.analysis_status = AnalysisStatus.completado
+    def _finish_batch(self, db: Session, claimed: dict, error: Exception | None):
+        """Devuelve a la cola (o a ERROR) lo que quedó sin clasificar y propaga etiquetas a los casi-duplicados."""
+        if isinstance(error, RateLimitError):
+            # 429: lo no clasificado vuelve a la cola sin gastar intento y el limitador frena a todos los lotes en vuelo
+            retry_after = _retry_after(error)
+            released = self._release_claimed(db, claimed, None, refund=True)
+            logger.warning(f"⏳ Límite de tasa del LLM (Retry-After: {retry_after}). Reencolando {released} solicitudes.")
+            self.rate_limiter.on_rate_limited(retry_after)
+        elif error is not None and _llm_unreachable(error):
+            # LLM inaccesible: lo que el clasificador local no resolvió espera con backoff sin gastar intentos
+            released = self._release_claimed(db, claimed, None, refund=True)
+            logger.warning(f"📡 LLM inaccesible ({error}). {released} solicitudes esperan reintento.")
+        elif error is not None:
+            logger.error(f"Error IA Batch: {error}")
+            self._release_claimed(db, claimed, str(error))
+        else:
+            # Folios que el modelo omitió incluso enviados solos: se reintentan en otro lote
+            self._release_claimed(db, claimed, "el modelo no devolvió este folio")
+        db.commit()
+        self.route_classified(db, list(claimed))
+        self.propagate_cluster_labels(db, list(claimed))
 
-        except Exception as e:
-            logger.error(f"Error IA Batch: {e}")
-            for req in batch:
-                if req.analysis_status == AnalysisStatus.procesando:
-                    req.analysis_status = AnalysisStatus.error
-                    req.internal_notes = f"Error IA: {str(e)}"
+    def route_classified(self, db: Session, ids: list, chunk_size: int = 500) -> int:
+        """
+        Cierra las solicitudes ciudadanas recién clasificadas: ruteo con el tema definitivo y evento
+        'classified' en el timeline. Las importaciones (timeline vacío) no se tocan; un evento ya
+        registrado (reanálisis) no vuelve a rutear para no pisar reasignaciones manuales.
+        """
+        table = CitizenRequest.__table__
+        routed = 0
+        for i in range(0, len(ids), chunk_size):
+            rows = db.execute(
+                select(
+                    table.c.id, table.c.topic, table.c.latitude, table.c.longitude,
+                    table.c.department_id, table.c.timeline,
+                )
+                .where(
+                    table.c.id.in_(ids[i:i + chunk_size]),
+                    table.c.analysis_status == AnalysisStatus.completado,
+                    func.json_typeof(table.c.timeline) == "array",
+                    cast(table.c.timeline, Text) != "[]",
+                )
+                .with_for_update(of=table)
+            ).all()
+            updates = []
+            for row in rows:
+                timeline = list(row.timeline)
+                if any(event.get("action") == "classified" for event in timeline): continue
+                topic = row.topic
+                dept_id, zone = row.department_id, None # Provisional (asignado al crear) si no hay regla mejor
+                if row.latitude and row.longitude:
+                    zone = routing_service.get_zone_from_coords(row.latitude, row.longitude)
+                    if zone:
+                        sector = routing_service.get_sector_from_coords(row.latitude, row.longitude, zone=zone)
+                        dept_id = routing_service.get_department_id(db, zone, topic, sector) or dept_id
+                timeline.append({
+                    "action": "classified",
+                    "timestamp": datetime.now().isoformat(),
+                    "note": f"Clasificado como {topic.value}. Zona detectada: {zone or 'Desconocida'}.",
+                })
+                updates.append({"b_id": row.id, "b_department_id": dept_id, "b_timeline": timeline})
+            if updates:
+                db.connection().execute(
+                    update(table)
+                    .where(table.c.id == bindparam("b_id"))
+                    .values(department_id=bindparam("b_department_id"), timeline=bindparam("b_timeline")),
+                    updates,
+                )
+                routed += len(updates)
+            db.commit()
+        if routed:
+            logger.info(f"🧭 {routed} solicitudes ciudadanas ruteadas con su clasificación definitiva.")
+        return routed
+
+    async def _process_batch(self, db: Session, ids: list):
+        """
+        Clasifica un lote reclamado. Todo acceso a la base (y el trabajo de CPU) corre en hilos con
+        asyncio.to_thread: los commits de un lote no frenan el streaming de los demás lotes en vuelo.
+        """
+        if not self.client: return
+        claimed, keys, items_to_send, req_map = await asyncio.to_thread(self._prepare_batch, db, ids)
+
+        # 3. Llamadas al LLM en streaming: cada clasificación se encola para guardarse en cuanto se cierra
+        # su objeto; una sola escritura en vuelo por lote (la sesión no se comparte entre hilos a la vez)
+        # que toma todo lo acumulado mientras tanto. Los folios que el modelo omite, rompe o deja cortados
+        # se reenvían divididos a la mitad hasta quedar solos, sin gastar intentos de la cola.
+        resolved = set()
+        results = []
+        writer = None
+
+        async def drain():
+            while results:
+                chunk = results[:]
+                results.clear()
+                await asyncio.to_thread(self._write_results, db, chunk)
+
+        def on_item(item: dict):
+            nonlocal writer
+            folio = folio_key(item.get("folio"))
+            same_text = req_map.get(folio)
+            if not same_text or folio in resolved: return
+            resolved.add(folio)
+            results.append(({req_id: claimed[req_id] for req_id in same_text}, self._classification_from_item(item), keys[same_text[0]]))
+            if writer is None or writer.done():
+                writer = asyncio.create_task(drain())
+
+        chunks = [items_to_send] if items_to_send else []
+        error = None
+        first_call = True
+        while chunks:
+            chunk = chunks.pop()
+            try:
+                if not first_call:
+                    # Las llamadas divididas (más la espera del limitador) pueden rebasar el lease del reclamo:
+                    # se renueva para lo que sigue sin resolver antes de cada una. Si ya no es nuestro, se corta.
+                    if writer is not None: await writer
+                    pending = {
+                        req_id: claimed[req_id]
+                        for item in (chunk, *chunks) for entry in item for req_id in req_map[folio_key(entry["folio"])]
+                    }
+                    if not await asyncio.to_thread(self._renew_lease, db, pending):
+                        logger.warning(f"⚠️ Lease perdido para {len(pending)} solicitudes; otro worker las retomó.")
+                        break
+                    await self.rate_limiter.acquire()
+                first_call = False
+                await self._classify_chunk(chunk, on_item)
+            except Exception as e:
+                error = e
+                break
+            missing = [item for item in chunk if folio_key(item["folio"]) not in resolved]
+            if missing and len(chunk) > 1:
+                self.llm_splits += 1
+                half = (len(missing) + 1) // 2
+                chunks.extend(part for part in (missing[half:], missing[:half]) if part)
+
+        if writer is not None: await writer
+        await drain()
+        await asyncio.to_thread(self._finish_batch, db, claimed, error)
+
+    @staticmethod
+    def _claimed_values(rows: list, *extra):
+        """VALUES (id, intento, ...) para cruzar con citizen_requests; los tipos se fuerzan con CAST."""
+        return sa_values(column("id", String), column("attempts", Integer), *extra, name="v").data(rows)
+
+    @staticmethod
+    def _invalidate_tiles(points: list):
+        """
+        Los tiles del mapa muestran tema y urgencia: tras el commit se descartan los que contienen filas
+        reclasificadas. Sólo en este proceso; en los demás el tile vence por su TTL.
+        """
+        for latitude, longitude in points:
+            tile_service.invalidate_point(latitude, longitude)
 
+    def _bulk_apply(self, db: Session, rows: list) -> list:
+        """
+        [(id, intento, valores, confianza)] -> un solo UPDATE ... FROM (VALUES ...), sólo en filas cuyo lease
+        sigue siendo nuestro (mismo número de intento, aún PROCESANDO). `confianza` sólo la traen las
+        etiquetas del clasificador local; NULL = etiqueta directa del LLM. Devuelve (latitud, longitud)
+        de cada fila actualizada para invalidar sus tiles.
+        """
+        if not rows: return []
+        table = CitizenRequest.__table__
+        v = self._claimed_values(
+            [
+                (
+                    str(req_id), attempts, values["topic"].name, values["urgency"].name, values["sentiment"].name,
+                    values["request_type"].name, values["suggested_action"],
+                    f"[IA Sugiere Dept]: {values['department']}" if values.get("department") else None,
+                    confidence,
+                )
+                for req_id, attempts, values, confidence in rows
+            ],
+            # Enums no nativos: la columna guarda el NOMBRE del miembro
+            column("topic", String), column("urgency", String), column("sentiment", String),
+            column("request_type", String), column("suggested_action", Text), column("internal_notes", Text),
+            column("confidence", Float),
+        )
+        return db.connection().execute(
+            update(table)
+            .where(
+                table.c.id == cast(v.c.id, PG_UUID(as_uuid=True)),
+                table.c.analysis_attempts == cast(v.c.attempts, Integer),
+                table.c.analysis_status == AnalysisStatus.procesando,
+            )
+            .values(
+                topic=v.c.topic, urgency=v.c.urgency, sentiment=v.c.sentiment, request_type=v.c.request_type,
+                suggested_action=v.c.suggested_action,
+                internal_notes=func.coalesce(v.c.internal_notes, table.c.internal_notes),
+                analysis_status=AnalysisStatus.completado, analysis_lease_expires_at=None,
+                analysis_confidence=cast(v.c.confidence, Float),
+            )
+            .returning(table.c.latitude, table.c.longitude)
+        ).all()
+
+    async def _classify_chunk(self, items: List[dict], on_item):
+        """Una llamada al LLM en streaming con `items`; `on_item` recibe cada objeto apenas se completa."""
+        user_prompt = encode_items(items)
+        started = time.monotonic()
+        stream = await self.worker_client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "system", "content": self._get_system_prompt()}, {"role": "user", "content": user_prompt}],
+            temperature=0.1,
+            response_format={ "type": "json_object" },
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        parser = JSONObjectStream()
+        first_item = True
+        usage = None
+        async for event in stream:
+            if event.usage: usage = event.usage
+            if not event.choices: continue
+            for item in parser.feed(event.choices[0].delta.content or ""):
+                if first_item:
+                    # La latencia al primer resultado no depende del tamaño del lote: mejor señal de saturación
+                    first_item = False
+                    latency = time.monotonic() - started
+                    self.rate_limiter.on_success(latency)
+                    self.llm_first_item_seconds += latency
+                on_item(item)
+        if first_item:
+            self.rate_limiter.on_success(time.monotonic() - started)
+        self._record_usage(usage, len(items))
+
+    def _record_usage(self, usage, items: int):
+        """Tokens por llamada, incluidos los del prefijo servidos desde el caché del proveedor."""
+        self.llm_calls += 1
+        self.llm_items += items
+        if not usage: return
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+        # DeepSeek: prompt_cache_hit_tokens; OpenAI: prompt_tokens_details.cached_tokens
+        cached = getattr(usage, "prompt_cache_hit_tokens", None)
+        if cached is None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) if details else None
+        cached = cached or 0
+        self.llm_prompt_tokens += prompt_tokens
+        self.llm_completion_tokens += completion_tokens
+        self.llm_cached_prompt_tokens += cached
+        logger.info(f"🔢 Llamada IA: {items} solicitudes, {prompt_tokens} tokens de entrada ({cached} en caché), {completion_tokens} de salida.")
+
+    def worker_stats(self) -> dict:
+        calls = self.llm_calls
+        return {
+            "llm_calls": calls,
+            "items": self.llm_items,
+            "items_per_call": round(self.llm_items / calls, 2) if calls else 0.0,
+            "prompt_tokens": self.llm_prompt_tokens,
+            "completion_tokens": self.llm_completion_tokens,
+            "cached_prompt_tokens": self.llm_cached_prompt_tokens,
+            "prompt_cache_hit_ratio": round(self.llm_cached_prompt_tokens / self.llm_prompt_tokens, 4) if self.llm_prompt_tokens else 0.0,
+            "system_prompt_tokens": estimate_tokens(self._get_system_prompt()),
+            "tokens_per_item": round((self.llm_prompt_tokens + self.llm_completion_tokens) / self.llm_items, 1) if self.llm_items else 0.0,
+            "splits": self.llm_splits,
+            "avg_seconds_to_first_item": round(self.llm_first_item_seconds / calls, 3) if calls else 0.0,
+            "token_budget": settings.AI_BATCH_TOKEN_BUDGET,
+            "rate_limiter": self.rate_limiter.stats(),
+            "local_model": {
+                "loaded": self._local_model is not None,
+                "threshold": settings.AI_LOCAL_MODEL_THRESHOLD,
+                "hits": self.local_hits,
+                "metrics": self._local_model.metrics if self._local_model is not None else {},
+            },
+        }
+
+    def _record_failed(self, db: Session, ids: list) -> int:
+        """
+        Evento 'ai_failed' en el timeline de las solicitudes ciudadanas que quedaron en ERROR: el ciudadano
+        ve que su solicitud sigue en manos de un funcionario. Las importaciones (timeline vacío) no se
+        tocan. No hace commit: va en la misma transacción que el cambio a ERROR.
+        """
+        if not ids: return 0
+        table = CitizenRequest.__table__
+        rows = db.execute(
+            select(table.c.id, table.c.timeline)
+            .where(
+                table.c.id.in_(ids),
+                func.json_typeof(table.c.timeline) == "array",
+                cast(table.c.timeline, Text) != "[]",
+            )
+        ).all()
+        updates = [
+            {"b_id": row.id, "b_timeline": [*row.timeline, {
+                "action": "ai_failed",
+                "timestamp": datetime.now().isoformat(),
+                "note": "No fue posible clasificarla automáticamente; un funcionario la revisará.",
+            }]}
+            for row in rows
+        ]
+        if updates:
+            db.connection().execute(
+                update(table).where(table.c.id == bindparam("b_id")).values(timeline=bindparam("b_timeline")),
+                updates,
+            )
+        return len(updates)
+
+    def _release_claimed(self, db: Session, claimed: dict, reason: str | None, refund: bool = False) -> int:
+        """
+        Devuelve a la cola las filas del lote que sigan siendo nuestras y sin clasificar. Con `refund`
+        (429) no cuentan como intento; si no, las que agotaron AI_MAX_ATTEMPTS quedan en ERROR.
+        Las que vuelven a PENDIENTE guardan en analysis_lease_expires_at el momento a partir del cual
+        se pueden reclamar otra vez (backoff exponencial): un LLM caído no agota los intentos en segundos.
+        """
+        if not claimed: return 0
+        table = CitizenRequest.__table__
+        v = self._claimed_values([(str(req_id), attempts) for req_id, attempts in claimed.items()])
+        attempts = table.c.analysis_attempts - 1 if refund else table.c.analysis_attempts
+        backoff = func.least(
+            settings.AI_RETRY_BACKOFF_SECONDS * func.power(2, attempts), settings.AI_RETRY_BACKOFF_MAX_SECONDS
+        )
+        not_before = func.now() + func.make_interval(0, 0, 0, 0, 0, 0, backoff)
+        if refund:
+            changes = {
+                "analysis_attempts": attempts, "analysis_status": AnalysisStatus.pendiente,
+                "analysis_lease_expires_at": not_before,
+            }
+        else:
+            exhausted = table.c.analysis_attempts >= settings.AI_MAX_ATTEMPTS
+            changes = {
+                "analysis_status": case((exhausted, AnalysisStatus.error.name), else_=AnalysisStatus.pendiente.name),
+                "internal_notes": case(
+                    (exhausted, func.concat("Error IA (", table.c.analysis_attempts, " intentos): ", reason)),
+                    else_=table.c.internal_notes,
+                ),
+                "analysis_lease_expires_at": case((exhausted, None), else_=not_before),
+            }
+        released = db.connection().execute(
+            update(table)
+            .where(
+                table.c.id == cast(v.c.id, PG_UUID(as_uuid=True)),
+                table.c.analysis_attempts == cast(v.c.attempts, Integer),
+                table.c.analysis_status == AnalysisStatus.procesando,
+            )
+            .values(**changes)
+            .returning(table.c.id, table.c.analysis_status)
+        ).all()
+        self._record_failed(db, [row.id for row in released if row.analysis_status == AnalysisStatus.error])
+        return len(released)
+
+    def _renew_lease(self, db: Session, claimed: dict) -> int:
+        """Extiende AI_LEASE_SECONDS el lease de las filas del lote que sigan siendo nuestras (mismo intento, aún PROCESANDO)."""
+        if not claimed: return 0
+        table = CitizenRequest.__table__
+        v = self._claimed_values([(str(req_id), attempts) for req_id, attempts in claimed.items()])
+        renewed = db.connection().execute(
+            update(table)
+            .where(
+                table.c.id == cast(v.c.id, PG_UUID(as_uuid=True)),
+                table.c.analysis_attempts == cast(v.c.attempts, Integer),
+                table.c.analysis_status == AnalysisStatus.procesando,
+            )
+            .values(analysis_lease_expires_at=func.now() + timedelta(seconds=settings.AI_LEASE_SECONDS))
+        ).rowcount
+        db.commit()
+        return renewed
+
+    def _claim_batch(self, db: Session, size: int, token_budget: int) -> list:
+        """
+        Reclama con FOR UPDATE SKIP LOCKED hasta `size` solicitudes (pendientes o con lease vencido)
+        cuyo costo estimado quepa en `token_budget`: muchas cortas o pocas largas por llamada.
+        Varios workers (o procesos) nunca reciben la misma fila, y una fila abandonada por un
+        worker caído vuelve a la cola al vencer su lease, hasta AI_MAX_ATTEMPTS intentos. En una fila
+        PENDIENTE, analysis_lease_expires_at es el fin de su backoff: antes de eso no se reclama.
+        """
+        lease_expired = and_(
+            CitizenRequest.analysis_status == AnalysisStatus.procesando,
+            or_(CitizenRequest.analysis_lease_expires_at.is_(None), CitizenRequest.analysis_lease_expires_at < func.now()),
+        )
+        # 1. Leases vencidos sin intentos restantes: error definitivo
+        exhausted = db.execute(
+            update(CitizenRequest)
+            .where(lease_expired, CitizenRequest.analysis_attempts >= settings.AI_MAX_ATTEMPTS)
+            .values(
+                analysis_status=AnalysisStatus.error,
+                analysis_lease_expires_at=None,
+                internal_notes=f"Error IA: lease vencido {settings.AI_MAX_ATTEMPTS} veces",
+            )
+            .returning(CitizenRequest.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        if exhausted:
+            self._record_failed(db, exhausted)
+            logger.warning(f"⚠️ {len(exhausted)} solicitudes agotaron sus intentos de IA.")
+
+        ready = and_(
+            CitizenRequest.analysis_status == AnalysisStatus.pendiente,
+            or_(CitizenRequest.analysis_lease_expires_at.is_(None), CitizenRequest.analysis_lease_expires_at <= func.now()),
+        )
+        # 2. Reclamo atómico del siguiente lote. Los casi-duplicados esperan a su representante:
+        # si éste termina se les copia la etiqueta; si falla, se vuelven reclamables por sí mismos.
+        rep = aliased(CitizenRequest)
+        waiting_for_rep = (
+            select(rep.id)
+            .where(
+                rep.id == CitizenRequest.duplicate_of_id,
+                rep.analysis_status.in_([AnalysisStatus.pendiente, AnalysisStatus.procesando]),
+            )
+            .exists()
+        )
+        candidates = db.execute(
+            select(CitizenRequest.id, CitizenRequest.description)
+            .where(or_(ready, lease_expired), ~waiting_for_rep)
+            .order_by(CitizenRequest.created_at)
+            .limit(size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not candidates:
+            db.commit()
+            return []
+        # Las candidatas que no caben se liberan con el commit y encabezan el siguiente reclamo
+        packed = pack_batch([item_tokens(description) for _, description in candidates], token_budget)
+        ids = db.execute(
+            update(CitizenRequest)
+            .where(CitizenRequest.id.in_([candidates[i][0] for i in packed]))
+            .values(
+                analysis_status=AnalysisStatus.procesando,
+                analysis_attempts=CitizenRequest.analysis_attempts + 1,
+                analysis_lease_expires_at=func.now() + timedelta(seconds=settings.AI_LEASE_SECONDS),
+            )
+            .returning(CitizenRequest.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
         db.commit()
+        return ids
 
-    async def process_queue(self):
-        logger.info("🚀 Iniciando Worker de IA...")
+    async def _run_batch(self, ids: list):
+        # Sesión propia por lote: los lotes en vuelo no comparten estado del ORM
         db = SessionLocal()
-        BATCH_SIZE = 5
         try:
+            await self._process_batch(db, ids)
+        except Exception as e:
+            logger.error(f"🔥 Error en lote IA: {e}")
+        finally:
+            db.close()
+
+    async def process_queue(self, stop: asyncio.Event | None = None):
+        """Vacía la cola de pendientes. Con `stop` activado deja de reclamar y termina los lotes en vuelo."""
+        if not self.client:
+            logger.warning("⚠️ Worker IA sin DEEPSEEK_API_KEY: nada que procesar.")
+            return
+        concurrency = max(settings.AI_WORKER_CONCURRENCY, 1)
+        logger.info(
+            f"🚀 Iniciando Worker de IA ({concurrency} lotes en vuelo, hasta {settings.AI_BATCH_SIZE} por lote "
+            f"/ {settings.AI_BATCH_TOKEN_BUDGET} tokens, "
+            f"{settings.AI_REQUESTS_PER_MINUTE} RPM)..."
+        )
+        db = SessionLocal()
+        semaphore = asyncio.Semaphore(concurrency)
+        in_flight = set()
+        try:
+            # Lo ya clasificado (mismo texto, prompt y modelo) se resuelve antes de gastar tokens
+            await asyncio.to_thread(self.apply_cached_classifications, db)
+            # Los casi-duplicados se agrupan y los de representantes ya completados se resuelven aquí
+            await asyncio.to_thread(self.cluster_pending, db)
+            await asyncio.to_thread(self.propagate_cluster_labels, db)
             while True:
-                pending = db.query(CitizenRequest).filter(
-                    CitizenRequest.analysis_status == AnalysisStatus.pendiente
-                ).limit(BATCH_SIZE).all()
-                if not pending: break
-                logger.info(f"⚡ Procesando lote de {len(pending)} solicitudes...")
-                await self._process_batch(db, pending)
-                await asyncio.sleep(1)
+                await semaphore.acquire()
+                if stop and stop.is_set():
+                    semaphore.release()
+                    break
+                ids = await asyncio.to_thread(self._claim_batch, db, settings.AI_BATCH_SIZE, settings.AI_BATCH_TOKEN_BUDGET)
+                if not ids:
+                    semaphore.release()
+                    if not in_flight: break
+                    # Un lote en vuelo puede devolver filas a la cola (429): esperar a que termine y revisar
+                    await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+                await self.rate_limiter.acquire()
+                task = asyncio.create_task(self._run_batch(ids))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                task.add_done_callback(lambda _: semaphore.release())
         except Exception as e:
             logger.error(f"🔥 Error fatal en Worker IA: {e}")
         finally:
+            if in_flight:
+                await asyncio.gather(*in_flight, return_exceptions=True)
             db.close()
             logger.info("🏁 Worker IA finalizado.")
 
     def run_process_queue(self):
-        asyncio.run(self.process_queue())
+        """
+        Worker inline (single-flight): si ya hay una corrida en este proceso, sólo marca que hace falta
+        otra pasada y regresa; la corrida activa repite mientras lleguen avisos. Así N solicitudes
+        seguidas no lanzan N barridos completos de caché, agrupamiento y cola en paralelo.
+        """
+        self._inline_rerun = True
+        while self._inline_rerun:
+            if not self._inline_lock.acquire(blocking=False): return
+            try:
+                while self._inline_rerun:
+                    self._inline_rerun = False
+                    asyncio.run(self.process_queue())
+            finally:
+                self._inline_lock.release()
+
+    def notify_queue(self, db: Session):
+        """Avisa a los workers dedicados (NOTIFY) que hay solicitudes pendientes."""
+        try:
+            db.execute(text(f"NOTIFY {AI_QUEUE_CHANNEL}"))
+            db.commit()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo notificar a los workers de IA: {e}")
+            db.rollback()
+
+    def schedule_queue(self, db: Session, background_tasks):
+        """
+        Avisa que hay solicitudes pendientes. Los workers dedicados reciben el NOTIFY;
+        en modo inline además se lanza el worker dentro de este proceso.
+        """
+        self.notify_queue(db)
+        if settings.AI_WORKER_MODE == "inline":
+            background_tasks.add_task(self.run_process_queue)
 
 ai_service = AIService()
\ No newline at end of file
@@ -0,0 +1,118 @@
+import hashlib
+import re
+import unicodedata
+import zlib
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 128 permutaciones en 32 bandas de 4 filas: un par con similitud 0.7 cae en la misma
+# cubeta con probabilidad ~0.9998; los candidatos se verifican después con la firma completa.
+NUM_PERM = 128
+BANDS = 32
+ROWS_PER_BAND = NUM_PERM // BANDS
+# Primo > 2^32: (a * h + b) mod P sin desbordar uint64 con a < 2^31
+_PRIME = np.uint64(4294967311)
+_SEED = 1
+
+def normalize_text(text: str) -> str:
+    """Minúsculas, sin acentos ni puntuación y con espacios colapsados."""
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(re.findall(r"[a-z0-9]+", text))
+
+def text_hash(text: str) -> str:
+    """Llave de duplicados exactos (caché de clasificaciones)."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+class NearDuplicateService:
+    """
+    Agrupa textos casi idénticos con MinHash + LSH sobre el conjunto de palabras normalizadas.
+    Los números (fechas, folios, montos) se enmascaran, así que plantillas que sólo cambian
+    en esos datos o en un nombre terminan en el mismo grupo.
+    """
+    def __init__(self):
+        rng = np.random.default_rng(_SEED)
+        self._a = rng.integers(1, 2**31, NUM_PERM, dtype=np.uint64)
+        self._b = rng.integers(0, 2**32, NUM_PERM, dtype=np.uint64)
+
+    @staticmethod
+    def shingles(text: str) -> set:
+        # Palabras sueltas: cambiar un nombre o un mes altera pocos elementos del conjunto
+        return set(re.sub(r"\d+", "#", normalize_text(text)).split()) or {""}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in self.shingles(text)), dtype=np.uint64
+        )
+        return ((np.outer(hashes, self._a) + self._b) % _PRIME).min(axis=0)
+
+    def signatures(self, texts: List[str]) -> np.ndarray:
+        return np.array([self.signature(t) for t in texts], dtype=np.uint64).reshape(len(texts), NUM_PERM)
+
+    def cluster(self, texts: List[str], threshold: float) -> List[Tuple[int, int, float]]:
+        """
+        (representante, miembro, similitud estimada) para cada texto que se puede etiquetar con otro.
+        Asignación greedy en orden: el primer texto libre se vuelve representante y absorbe a los
+        candidatos LSH aún libres cuya firma coincide con la suya en >= threshold. Cada miembro se
+        compara directamente contra su representante (sin cadenas que deriven en textos distintos).
+        """
+        return self.cluster_signatures(self.signatures(texts), threshold)
+
+    def cluster_signatures(self, sigs: np.ndarray, threshold: float, fresh: Optional[np.ndarray] = None) -> List[Tuple[int, int, float]]:
+        """
+        Igual que cluster() sobre firmas ya calculadas. Con `fresh` (máscara de filas nuevas) sólo se
+        evalúan pares con al menos una fila nueva: los pares entre filas viejas ya se descartaron en
+        una pasada anterior, así que sólo se recorren las nuevas y las que comparten cubeta con ellas.
+        """
+        n = len(sigs)
+        if n < 2: return []
+
+        # Por banda: cubeta de cada fila y miembros de cada cubeta
+        row_bucket, bucket_members = [], []
+        for band in range(BANDS):
+            cols = sigs[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+            _, inverse = np.unique(cols, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            order = np.argsort(inverse, kind="stable")
+            bounds = np.flatnonzero(np.diff(inverse[order])) + 1
+            row_bucket.append(inverse)
+            bucket_members.append(np.split(order, bounds))
+
+        if fresh is None:
+            rows = range(n)
+        else:
+            if not fresh.any(): return []
+            # Filas que comparten alguna cubeta con una fila nueva
+            touched = np.zeros(n, dtype=bool)
+            for band in range(BANDS):
+                touched |= (np.bincount(row_bucket[band], weights=fresh) > 0)[row_bucket[band]]
+            rows = np.flatnonzero(touched | fresh)
+
+        assigned = np.full(n, -1, dtype=np.int64)
+        pairs = []
+        for i in rows:
+            if assigned[i] >= 0: continue
+            assigned[i] = i
+            candidates = []
+            for band in range(BANDS):
+                b = row_bucket[band][i]
+                members = bucket_members[band][b]
+                if len(members) < 2: continue
+                # Compactación perezosa: las cubetas grandes sólo se recorren completas una vez
+                members = bucket_members[band][b] = members[assigned[members] < 0]
+                candidates.append(members)
+            if not candidates: continue
+            candidates = np.unique(np.concatenate(candidates))
+            if fresh is not None and not fresh[i]:
+                candidates = candidates[fresh[candidates]]
+            if not len(candidates): continue
+            similarity = (sigs[candidates] == sigs[i]).mean(axis=1)
+            ok = similarity >= threshold
+            assigned[candidates[ok]] = i
+            pairs.extend((i, int(j), float(sim)) for j, sim in zip(candidates[ok], similarity[ok]))
+        return pairs
+
+near_duplicate_service = NearDuplicateService()
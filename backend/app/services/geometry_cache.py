@@ -0,0 +1,353 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+try:
+    import brotli
+except ImportError: # Opcional: sin brotli sólo se sirve gzip
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Incrementar si cambia el formato en disco para forzar la reconstrucción
+CACHE_VERSION = 5
+# ~100 m: suficiente para ruteo grueso y reduce fuertemente el número de vértices
+SIMPLIFY_TOLERANCE = 0.001
+VARIANTS = ("full", "simplified")
+
+# Resoluciones del mapa servido al dashboard: tolerancia de simplificación en grados (0 = sin simplificar)
+MAP_RESOLUTIONS = {"low": 0.01, "medium": 0.002, "full": 0.0}
+# 5 decimales ≈ 1 m, de sobra para dibujar
+MAP_PRECISION = 5
+MAP_ENCODINGS = ("identity", "gzip", "br")
+
+# Capa opcional de colonias/AGEBs (scripts/process_inegi_sectors.py). Sin ella el ruteo es sólo municipal.
+SECTORS_GEOJSON = "yucatan_sectores.geojson"
+SECTOR_NAME_PROPERTY = "NOMBRE"
+
+def repair_geometry(geom):
+    """make_valid conservando sólo la parte poligonal (descarta líneas/puntos degenerados)."""
+    if geom.is_valid: return geom
+    repaired = shapely.make_valid(geom)
+    if repaired.geom_type == "GeometryCollection":
+        polygons = [g for g in repaired.geoms if g.geom_type in ("Polygon", "MultiPolygon")]
+        repaired = shapely.union_all(polygons) if polygons else shapely.Polygon()
+    return repaired
+
+def simplify_coverage(geoms: np.ndarray, tolerance: float) -> np.ndarray:
+    """
+    Simplifica una cobertura (polígonos vecinos) sin abrir huecos ni encimar fronteras: cada arco
+    compartido se simplifica una sola vez y los polígonos se reconstruyen con las caras resultantes.
+    Un polígono que se quede sin caras (colapsado por la tolerancia) conserva su simplificación individual.
+    """
+    if not tolerance or not len(geoms): return geoms
+    fallback = shapely.simplify(geoms, tolerance, preserve_topology=True)
+    # Fronteras nodadas: una arista compartida aparece una sola vez; line_merge une tramos hasta cada nodo triple
+    arcs = shapely.get_parts(shapely.line_merge(shapely.union_all(shapely.boundary(geoms))))
+    arcs = shapely.simplify(arcs, tolerance, preserve_topology=True) # Conserva los extremos de cada arco
+    faces = shapely.get_parts(shapely.polygonize(shapely.get_parts(shapely.union_all(arcs))))
+    if not len(faces): return fallback
+
+    # Cada cara va con el polígono original con el que más se traslapa; las que quedan casi
+    # fuera de todos (huecos de la cobertura, mar recortado) se descartan
+    face_idx, geom_idx = STRtree(geoms).query(faces, predicate="intersects")
+    overlap = shapely.area(shapely.intersection(faces[face_idx], geoms[geom_idx]))
+    covered = np.bincount(face_idx, weights=overlap, minlength=len(faces))
+    order = np.lexsort((-overlap, face_idx))
+    first = order[np.r_[True, face_idx[order][1:] != face_idx[order][:-1]]] if len(order) else order
+    owner = np.full(len(faces), -1, dtype=np.int64)
+    owner[face_idx[first]] = geom_idx[first]
+    owner[covered < shapely.area(faces) / 2] = -1
+
+    result = fallback.copy()
+    for i in np.unique(owner[owner >= 0]):
+        result[i] = shapely.union_all(faces[owner == i])
+    return result
+
+def resolve_geojson_path(filename: str = "yucatan_municipios.geojson") -> Optional[Path]:
+    """Ruta de un GeoJSON de app/data (contenedor Docker o ejecución local)."""
+    for candidate in (Path("/app/app/data") / filename, Path("app/data") / filename):
+        if candidate.exists():
+            return candidate
+    return None
+
+class GeometryLayer:
+    """
+    Vista de sólo lectura sobre una variante del caché (full/simplified).
+    Los bounding boxes y el WKB se abren con mmap; cada geometría se deserializa
+    y prepara sólo la primera vez que se consulta.
+    """
+    def __init__(self, cache_dir: Path, variant: str, names: List[str], codes: Optional[List[str]] = None):
+        self.variant = variant
+        self.names = names
+        # Clave geoestadística INEGI (CVEGEO) de cada polígono, en el mismo orden que names
+        self.codes = codes or [None] * len(names)
+        self.bounds = np.load(cache_dir / f"{variant}.bounds.npy", mmap_mode="r")
+        self.offsets = np.load(cache_dir / f"{variant}.offsets.npy")
+        self.blob = np.memmap(cache_dir / f"{variant}.wkb", dtype=np.uint8, mode="r")
+        self._geometries = np.full(len(names), None, dtype=object)
+        self._loaded = np.zeros(len(names), dtype=bool)
+        self._lock = threading.Lock()
+        # Índice de bounding boxes: no requiere deserializar ninguna geometría
+        self.tree = STRtree(shapely.box(*np.asarray(self.bounds).T)) if len(names) else None
+        # Índice sobre las geometrías reales, sólo para vecino más cercano (se construye al primer uso)
+        self._geometry_tree = None
+
+    def __len__(self):
+        return len(self.names)
+
+    def geometries(self, idx) -> np.ndarray:
+        """Geometrías (preparadas) para los índices dados, deserializando las que falten."""
+        idx = np.atleast_1d(np.asarray(idx, dtype=np.int64))
+        missing = np.unique(idx[~self._loaded[idx]])
+        if len(missing):
+            with self._lock:
+                for i in missing:
+                    if self._loaded[i]: continue
+                    geom = shapely.from_wkb(self.blob[self.offsets[i]:self.offsets[i + 1]].tobytes())
+                    shapely.prepare(geom)
+                    self._geometries[i] = geom
+                    self._loaded[i] = True
+        return self._geometries[idx]
+
+    def geometry(self, i: int):
+        return self.geometries(i)[0]
+
+    def nearest(self, lon: float, lat: float, max_distance: float):
+        """(índice, distancia) del polígono más cercano dentro de max_distance, o None. Empates: orden del GeoJSON."""
+        if not len(self.names): return None
+        if self._geometry_tree is None:
+            self._geometry_tree = STRtree(self.geometries(np.arange(len(self.names))))
+        idx, dist = self._geometry_tree.query_nearest(
+            shapely.Point(lon, lat), max_distance=max_distance, return_distance=True, all_matches=True
+        )
+        if not len(idx): return None
+        best = np.lexsort((idx, dist))[0]
+        return int(idx[best]), float(dist[best])
+
+class PartitionedLayer:
+    """
+    Capa grande (colonias/AGEBs) particionada por polígono padre (municipio).
+    La clave del padre son los primeros dígitos del CVEGEO (entidad + municipio = 5).
+    Cada partición tiene su propio STRtree de bounding boxes, construido al primer uso,
+    así una consulta sólo toca los polígonos del municipio ya resuelto.
+    """
+    def __init__(self, layer: GeometryLayer, parent_code_length: int = 5):
+        self.layer = layer
+        parents = np.array([(code or "")[:parent_code_length] for code in layer.codes], dtype=object)
+        self.partitions = {
+            parent: np.flatnonzero(parents == parent) for parent in np.unique(parents) if parent
+        }
+        self._trees = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.layer)
+
+    def _tree(self, parent: str):
+        tree = self._trees.get(parent)
+        if tree is None:
+            with self._lock:
+                tree = self._trees.get(parent)
+                if tree is None:
+                    bounds = np.asarray(self.layer.bounds[self.partitions[parent]])
+                    tree = self._trees[parent] = STRtree(shapely.box(*bounds.T))
+        return tree
+
+    def names(self, parent: str) -> List[str]:
+        return [self.layer.names[i] for i in self.partitions.get(parent, ())]
+
+    def locate(self, parent: str, lon: float, lat: float) -> Optional[int]:
+        """Índice (en la capa completa) del polígono del padre que contiene el punto, o None."""
+        if parent not in self.partitions: return None
+        point = shapely.Point(lon, lat)
+        local = np.sort(self._tree(parent).query(point))
+        if not len(local): return None
+        idx = self.partitions[parent][local]
+        for i, geom in zip(idx, self.layer.geometries(idx)):
+            if geom.contains(point): return int(i)
+        return None
+
+class GeometryCache:
+    """
+    Caché binario de geometrías (municipios, colonias/AGEBs) junto al GeoJSON de origen.
+
+    Estructura: app/data/.geocache/<nombre>-<sha256[:16]>/
+      meta.json                      nombres, claves CVEGEO, hash de origen, versión y tolerancia
+      <variante>.bounds.npy          (N, 4) float64: minx, miny, maxx, maxy
+      <variante>.offsets.npy         (N + 1) int64: cortes dentro del blob WKB
+      <variante>.wkb                 WKB concatenado (geometrías ya reparadas)
+      map-<resolución>.geojson[.gz|.br]   GeoJSON compacto para el mapa, ya comprimido (si render_maps)
+    """
+    def __init__(
+        self, geojson_path: Path, cache_root: Optional[Path] = None,
+        name_property: str = "NOMGEO", render_maps: bool = True,
+    ):
+        self.geojson_path = Path(geojson_path)
+        self.cache_root = cache_root or self.geojson_path.parent / ".geocache"
+        self.name_property = name_property
+        # Las capas grandes (colonias/AGEBs) sólo se usan para ruteo, no se dibujan completas
+        self.render_maps = render_maps
+
+    def source_hash(self) -> str:
+        h = hashlib.sha256()
+        with open(self.geojson_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        return h.hexdigest()
+
+    def cache_dir(self, source_hash: str) -> Path:
+        return self.cache_root / f"{self.geojson_path.stem}-{source_hash[:16]}"
+
+    def _is_valid(self, cache_dir: Path, source_hash: str) -> bool:
+        try:
+            meta = json.loads((cache_dir / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return False
+        return (
+            meta.get("version") == CACHE_VERSION
+            and meta.get("source_sha256") == source_hash
+            and meta.get("simplify_tolerance") == SIMPLIFY_TOLERANCE
+            and meta.get("name_property") == self.name_property
+            and meta.get("render_maps") == self.render_maps
+        )
+
+    def build(self, source_hash: Optional[str] = None) -> Path:
+        """Parsea el GeoJSON, repara geometrías y escribe el caché de forma atómica."""
+        source_hash = source_hash or self.source_hash()
+        with open(self.geojson_path, "r", encoding="utf-8") as f:
+            features = json.load(f).get("features", [])
+
+        names, codes, full, properties = [], [], [], []
+        for feature in features:
+            name = feature.get("properties", {}).get(self.name_property)
+            try:
+                polygon = repair_geometry(shape(feature["geometry"]))
+            except Exception as e:
+                logger.warning(f"⚠️ Geometría inválida para {name}: {e}")
+                continue
+            if polygon.is_empty:
+                logger.warning(f"⚠️ Geometría vacía tras reparar {name}, se omite.")
+                continue
+            names.append(name)
+            codes.append(feature.get("properties", {}).get("CVEGEO"))
+            full.append(polygon)
+            properties.append(feature.get("properties", {}))
+
+        full = np.array(full, dtype=object)
+        variants = {
+            "full": full,
+            "simplified": simplify_coverage(full, SIMPLIFY_TOLERANCE),
+        }
+
+        target = self.cache_dir(source_hash)
+        try:
+            self.cache_root.mkdir(parents=True, exist_ok=True)
+            tmp_dir = Path(tempfile.mkdtemp(dir=self.cache_root, prefix=".tmp-"))
+        except OSError as e:
+            # Directorio de datos de sólo lectura: el caché vive en /tmp durante este proceso
+            logger.warning(f"⚠️ No se puede escribir el caché junto al GeoJSON ({e}). Usando directorio temporal.")
+            self.cache_root = Path(tempfile.mkdtemp(prefix="geocache-"))
+            target = self.cache_dir(source_hash)
+            tmp_dir = Path(tempfile.mkdtemp(dir=self.cache_root, prefix=".tmp-"))
+
+        for variant, geoms in variants.items():
+            wkb = shapely.to_wkb(geoms) if len(geoms) else np.array([], dtype=object)
+            offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum([len(b) for b in wkb])
+            bounds = shapely.bounds(geoms) if len(geoms) else np.empty((0, 4))
+            np.save(tmp_dir / f"{variant}.bounds.npy", bounds)
+            np.save(tmp_dir / f"{variant}.offsets.npy", offsets)
+            with open(tmp_dir / f"{variant}.wkb", "wb") as f:
+                for b in wkb: f.write(b)
+
+        map_etags = {}
+        for resolution, tolerance in (MAP_RESOLUTIONS.items() if self.render_maps else ()):
+            body = self._render_map(full, properties, tolerance)
+            map_etags[resolution] = hashlib.sha256(body).hexdigest()[:32]
+            (tmp_dir / f"map-{resolution}.geojson").write_bytes(body)
+            (tmp_dir / f"map-{resolution}.geojson.gz").write_bytes(gzip.compress(body, compresslevel=9, mtime=0))
+            if brotli:
+                (tmp_dir / f"map-{resolution}.geojson.br").write_bytes(brotli.compress(body, quality=11))
+
+        meta = {
+            "version": CACHE_VERSION,
+            "source": self.geojson_path.name,
+            "source_sha256": source_hash,
+            "simplify_tolerance": SIMPLIFY_TOLERANCE,
+            "name_property": self.name_property,
+            "render_maps": self.render_maps,
+            "names": names,
+            "codes": codes,
+            "map_etags": map_etags,
+        }
+        (tmp_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+        # Publicación atómica; si otro worker ganó la carrera conservamos el suyo
+        if target.exists() and not self._is_valid(target, source_hash):
+            shutil.rmtree(target, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, target)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not self._is_valid(target, source_hash): raise
+
+        # Limpiar cachés de versiones anteriores del GeoJSON
+        for old in self.cache_root.glob(f"{self.geojson_path.stem}-*"):
+            if old != target: shutil.rmtree(old, ignore_errors=True)
+
+        logger.info(f"💾 Caché de geometrías generado: {target} ({len(names)} zonas).")
+        return target
+
+    @staticmethod
+    def _render_map(geoms: np.ndarray, properties: List[dict], tolerance: float) -> bytes:
+        """FeatureCollection compacta: geometrías simplificadas y coordenadas redondeadas."""
+        geoms = simplify_coverage(geoms, tolerance)
+        if len(geoms):
+            geoms = shapely.transform(geoms, lambda coords: np.round(coords, MAP_PRECISION))
+        features = [
+            '{"type":"Feature","properties":%s,"geometry":%s}' % (
+                json.dumps(props, ensure_ascii=False, separators=(",", ":")), shapely.to_geojson(geom)
+            )
+            for geom, props in zip(geoms, properties)
+        ]
+        return ('{"type":"FeatureCollection","features":[%s]}' % ",".join(features)).encode("utf-8")
+
+    def load_map(self, resolution: str, encoding: str = "identity"):
+        """Cuerpo precomprimido del mapa y su ETag. None si la codificación no está disponible."""
+        if resolution not in MAP_RESOLUTIONS or encoding not in MAP_ENCODINGS:
+            raise ValueError(f"Mapa desconocido: {resolution}/{encoding}")
+        cache_dir = self.ensure()
+        meta = json.loads((cache_dir / "meta.json").read_text(encoding="utf-8"))
+        suffix = {"identity": "", "gzip": ".gz", "br": ".br"}[encoding]
+        path = cache_dir / f"map-{resolution}.geojson{suffix}"
+        if not path.exists() or resolution not in meta["map_etags"]:
+            return None
+        return path.read_bytes(), meta["map_etags"][resolution]
+
+    def ensure(self) -> Path:
+        """Devuelve el directorio del caché vigente, reconstruyéndolo si el GeoJSON cambió."""
+        source_hash = self.source_hash()
+        cache_dir = self.cache_dir(source_hash)
+        if not self._is_valid(cache_dir, source_hash):
+            logger.info("🔄 Caché de geometrías ausente u obsoleto. Reconstruyendo...")
+            cache_dir = self.build(source_hash)
+        return cache_dir
+
+    def load(self, variant: str = "full") -> GeometryLayer:
+        if variant not in VARIANTS:
+            raise ValueError(f"Variante desconocida: {variant}")
+        cache_dir = self.ensure()
+        meta = json.loads((cache_dir / "meta.json").read_text(encoding="utf-8"))
+        return GeometryLayer(cache_dir, variant, meta["names"], meta.get("codes"))
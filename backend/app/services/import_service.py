@@ -0,0 +1,501 @@
+import codecs
+import io
+import logging
+import shutil
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+import numpy as np
+import pandas as pd
+from sqlalchemy import and_, column, delete, func, literal, or_, select, table as sa_table, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models.imports import ImportJob, ImportStatus
+from app.models.requests import CitizenRequest, RequestStatus, Topic, Sentiment, Urgency, RequestType, AnalysisStatus
+from app.services.ai_service import ai_service
+from app.services.tile_service import tile_service
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORAGE_DIR = Path(__file__).resolve().parent.parent / "data" / "imports"
+GENERAL_LOCATION = "Ubicación General / No especificada"
+IMPORTED_LOCATION_PREFIX = "Importado - "
+# Tabla temporal por conexión donde COPY deja cada bloque antes de pasarlo a citizen_requests
+STAGING_TABLE = "import_staging"
+STAGING_COLUMNS = ("folio", "description", "location_text", "location_found", "status", "created_at", "official_response")
+_staging = sa_table(STAGING_TABLE, *(column(name) for name in STAGING_COLUMNS))
+# ESTATUS de la PNT -> RequestStatus por palabra clave (lo que no coincide queda Recibida)
+PNT_STATUS_KEYWORDS = (
+    (("terminada", "entregada"), RequestStatus.atendida),
+    (("proceso", "trámite"), RequestStatus.en_revision),
+    (("desechada", "cancelada"), RequestStatus.rechazada),
+)
+
+class ImportClaimLost(Exception):
+    """El job fue reclamado por otro proceso (latido vencido): este runner deja de escribir."""
+
+class ImportService:
+    """
+    Importación masiva de solicitudes (CSV/XLSX de transparencia): limpieza con operaciones de columna
+    y COPY + INSERT ... ON CONFLICT (folio) DO NOTHING por bloques grandes, en lugar de un SELECT
+    y un objeto ORM por renglón. Los archivos grandes se procesan como ImportJob con checkpoints.
+    """
+    CHUNK_SIZE = 20000
+    # Muestra del inicio del archivo con la que se decide la codificación
+    SNIFF_BYTES = 64 * 1024
+
+    @classmethod
+    def sniff_encoding(cls, fileobj: BinaryIO) -> str:
+        """
+        Codificación a partir de una muestra (el archivo no se lee completo): UTF-8 si la muestra es
+        UTF-8 válido (con o sin BOM), si no cp1252, y latin-1 como último recurso (acepta cualquier byte).
+        """
+        sample = fileobj.read(cls.SNIFF_BYTES)
+        fileobj.seek(0)
+        if sample.startswith(codecs.BOM_UTF8): return "utf-8-sig"
+        for encoding in ("utf-8", "cp1252"):
+            try:
+                # final=False: un carácter multibyte cortado al final de la muestra no cuenta como error
+                codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+                return encoding
+            except UnicodeDecodeError: continue
+        return "latin-1"
+
+    @staticmethod
+    def is_xlsx(fileobj: BinaryIO, filename: str | None = None) -> bool:
+        if filename and filename.lower().endswith(".xlsx"): return True
+        magic = fileobj.read(4)
+        fileobj.seek(0)
+        # Un .xlsx es un ZIP; un CSV nunca empieza así
+        return magic == b"PK\x03\x04"
+
+    def read_chunks(self, fileobj: BinaryIO, filename: str | None = None, chunksize: int | None = None, skip: int = 0) -> Iterator[pd.DataFrame]:
+        """
+        Bloques de `chunksize` renglones (todo como texto, vacíos como NaN) leídos en streaming desde
+        el archivo ya en disco: la memoria no depende del tamaño del archivo. CSV o XLSX.
+        `skip` descarta los primeros renglones de datos (reanudar desde un checkpoint).
+        """
+        for df in self._read_chunks(fileobj, filename, chunksize or self.CHUNK_SIZE):
+            if skip >= len(df):
+                skip -= len(df)
+                continue
+            yield df.iloc[skip:] if skip else df
+            skip = 0
+
+    def _read_chunks(self, fileobj: BinaryIO, filename: str | None, chunksize: int) -> Iterator[pd.DataFrame]:
+        if self.is_xlsx(fileobj, filename):
+            yield from self._read_xlsx_chunks(fileobj, chunksize)
+            return
+        encoding = self.sniff_encoding(fileobj)
+        # errors="replace": un byte inválido después de la muestra no aborta la importación
+        text_stream = io.TextIOWrapper(fileobj, encoding=encoding, errors="replace", newline="")
+        try:
+            for df in pd.read_csv(text_stream, dtype=str, on_bad_lines='skip', chunksize=chunksize):
+                df.columns = df.columns.str.strip().str.replace('ï»¿', '')
+                yield df
+        finally:
+            # No cerrar el archivo subyacente (lo cierra quien lo abrió)
+            text_stream.detach()
+
+    @staticmethod
+    def _cell_text(value):
+        if value is None: return np.nan
+        # Excel guarda los folios numéricos como float: 123.0 -> "123"
+        if isinstance(value, float) and value.is_integer(): return str(int(value))
+        return str(value)
+
+    @staticmethod
+    def _frame(batch: list, columns: pd.Index) -> pd.DataFrame:
+        # Renglones más cortos que el encabezado (celdas finales vacías) se completan con NaN
+        return pd.DataFrame(batch).reindex(columns=range(len(columns))).set_axis(columns, axis=1)
+
+    def _read_xlsx_chunks(self, fileobj: BinaryIO, chunksize: int) -> Iterator[pd.DataFrame]:
+        """Primera hoja en modo read-only de openpyxl: los renglones se recorren sin cargar el libro."""
+        from openpyxl import load_workbook
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = next(rows, None)
+            if header is None: return
+            columns = pd.Index(["" if c is None else str(c) for c in header]).str.strip()
+            batch = []
+            for row in rows:
+                if not any(value is not None for value in row): continue
+                batch.append([self._cell_text(value) for value in row[:len(columns)]])
+                if len(batch) >= chunksize:
+                    yield self._frame(batch, columns)
+                    batch = []
+            if batch:
+                yield self._frame(batch, columns)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def detect_columns(columns) -> Tuple[str | None, ...]:
+        """
+        (folio, descripción, municipio, estatus, fecha de solicitud, respuesta) por nombre de columna;
+        None si no se encuentra. Sólo folio y descripción son obligatorias.
+        """
+        col_folio = next((c for c in columns if 'FOLIO' in c.upper() or 'ID' in c.upper()), None)
+        col_desc = next((c for c in columns if 'DESCRIPCION' in c.upper() or 'MOTIVO' in c.upper()), None)
+        col_mun = next((c for c in columns if 'MUNICIPIO' in c.upper() or 'UBICACION' in c.upper()), None)
+        col_status = next((c for c in columns if 'ESTATUS' in c.upper()), None)
+        col_date = next((c for c in columns if 'FECHA' in c.upper() and 'SOLICITUD' in c.upper()), None)
+        col_response = next((c for c in columns if 'RESPUESTA' in c.upper() and 'FECHA' not in c.upper()), None)
+        return col_folio, col_desc, col_mun, col_status, col_date, col_response
+
+    @staticmethod
+    def _clean_text(series: pd.Series) -> pd.Series:
+        # Postgres no acepta NUL dentro de un texto (ni en COPY ni en INSERT)
+        return series.astype(str).str.replace('\x00', '', regex=False).str.slice(0, 4000)
+
+    @staticmethod
+    def prepare(
+        df: pd.DataFrame, col_folio: str, col_desc: str, col_mun: str | None,
+        col_status: str | None = None, col_date: str | None = None, col_response: str | None = None,
+    ) -> pd.DataFrame:
+        """
+        Renglones listos para insertar (folio, description, location_text, location_found, status,
+        created_at, official_response): folios limpios de al menos 3 caracteres y sin repetir dentro
+        del archivo (gana el primero). Estatus, fecha (DD/MM/AAAA) y respuesta son opcionales: sin
+        columna o sin valor válido quedan Recibida, la fecha de carga y sin respuesta.
+        """
+        folio = df[col_folio].astype(str).str.replace('=', '', regex=False).str.replace('"', '', regex=False).str.strip()
+        description = df[col_desc].astype(str)
+        description = ImportService._clean_text(description.where(description != 'nan', "Solicitud importada"))
+
+        # Municipio válido: no NaN, no vacío y no 'nan' literal (en cualquier capitalización)
+        if col_mun:
+            raw_mun = df[col_mun]
+            mun = raw_mun.astype(str).str.strip()
+            location_found = (raw_mun.notna() & (mun != '') & (mun.str.lower() != 'nan')).to_numpy()
+            location_text = np.where(location_found, IMPORTED_LOCATION_PREFIX + mun, GENERAL_LOCATION)
+        else:
+            location_found = np.zeros(len(df), dtype=bool)
+            location_text = np.full(len(df), GENERAL_LOCATION, dtype=object)
+
+        # Enums no nativos: la columna guarda el NOMBRE del miembro
+        status = np.full(len(df), RequestStatus.recibida.name, dtype=object)
+        if col_status:
+            raw_status = df[col_status].fillna('').astype(str).str.lower()
+            status = np.select(
+                [raw_status.str.contains('|'.join(words), regex=True) for words, _ in PNT_STATUS_KEYWORDS],
+                [value.name for _, value in PNT_STATUS_KEYWORDS],
+                default=RequestStatus.recibida.name,
+            )
+
+        # Vacío -> NULL en el COPY: la fecha cae en now() y la respuesta queda sin valor
+        created_at = np.full(len(df), None, dtype=object)
+        if col_date:
+            parsed = pd.to_datetime(df[col_date].astype(str).str.strip(), format="%d/%m/%Y", exact=False, errors="coerce")
+            created_at = parsed.dt.strftime("%Y-%m-%d").to_numpy(dtype=object)
+        official_response = np.full(len(df), None, dtype=object)
+        if col_response:
+            raw_response = df[col_response]
+            response = raw_response.astype(str).str.strip()
+            has_response = raw_response.notna() & (response != '') & (response.str.lower() != 'nan')
+            official_response = ImportService._clean_text(response).where(has_response, None).to_numpy(dtype=object)
+
+        rows = pd.DataFrame({
+            "folio": folio.to_numpy(),
+            "description": description.to_numpy(),
+            "location_text": location_text,
+            "location_found": location_found,
+            "status": status,
+            "created_at": created_at,
+            "official_response": official_response,
+        })
+        rows = rows[rows["folio"].str.len() >= 3]
+        return rows.drop_duplicates("folio", keep="first")
+
+    def insert(self, db: Session, rows: pd.DataFrame, heartbeat: Optional[Callable[[], None]] = None) -> Tuple[int, int, int]:
+        """
+        COPY del bloque a una tabla temporal y un solo INSERT ... SELECT ... ON CONFLICT (folio)
+        DO NOTHING: los folios ya cargados (reimportaciones, una importación simultánea o un bloque
+        repetido al reanudar) se descartan en la misma sentencia. No confirma: el llamador hace commit
+        junto con su checkpoint. `heartbeat` se llama antes de cada sub-bloque (los bloques que se
+        dividen pueden tardar). Devuelve (insertadas, con ubicación, fallidas).
+        """
+        table = CitizenRequest.__table__
+        # Mismos valores por defecto que el modelo, resueltos en SQL para todo el bloque
+        inserted = (
+            pg_insert(table)
+            .from_select(
+                ["id", "folio", "description", "location_text", "status", "created_at", "official_response",
+                 "topic", "sentiment", "urgency", "request_type", "analysis_status", "timeline"],
+                select(
+                    func.gen_random_uuid(), _staging.c.folio, _staging.c.description, _staging.c.location_text,
+                    _staging.c.status, func.coalesce(_staging.c.created_at, func.now()), _staging.c.official_response,
+                    literal(Topic.otros, table.c.topic.type), literal(Sentiment.neutro, table.c.sentiment.type),
+                    literal(Urgency.media, table.c.urgency.type), literal(RequestType.desconocida, table.c.request_type.type),
+                    literal(AnalysisStatus.pendiente, table.c.analysis_status.type), literal([], table.c.timeline.type),
+                ),
+            )
+            .on_conflict_do_nothing(index_elements=[table.c.folio])
+            .returning(table.c.folio)
+            .cte("inserted")
+        )
+        counts = (
+            select(func.count(), func.count().filter(_staging.c.location_found))
+            .select_from(inserted.join(_staging, inserted.c.folio == _staging.c.folio))
+        )
+        # Fuera del savepoint: un rollback parcial no debe borrar la tabla temporal
+        db.connection().exec_driver_sql(
+            f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} "
+            "(folio TEXT, description TEXT, location_text TEXT, location_found BOOLEAN, "
+            "status TEXT, created_at TIMESTAMPTZ, official_response TEXT) ON COMMIT DELETE ROWS"
+        )
+        return self._insert_block(db, rows, counts, heartbeat)
+
+    def _insert_block(self, db: Session, rows: pd.DataFrame, counts, heartbeat=None) -> Tuple[int, int, int]:
+        """Un bloque dentro de un savepoint; si Postgres lo rechaza se divide a la mitad hasta aislar los renglones malos."""
+        if rows.empty: return 0, 0, 0
+        if heartbeat: heartbeat()
+        buffer = io.StringIO()
+        rows.to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        try:
+            with db.begin_nested():
+                conn = db.connection()
+                conn.exec_driver_sql(f"TRUNCATE {STAGING_TABLE}")
+                with conn.connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY {STAGING_TABLE} ({', '.join(STAGING_COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+                        buffer,
+                    )
+                imported, located = conn.execute(counts).one()
+            return imported, located, 0
+        except Exception as e:
+            if len(rows) == 1:
+                logger.warning(f"⚠️ Renglón rechazado en la importación (folio {rows['folio'].iloc[0]}): {e}")
+                return 0, 0, 1
+            half = len(rows) // 2
+            first = self._insert_block(db, rows.iloc[:half], counts, heartbeat)
+            second = self._insert_block(db, rows.iloc[half:], counts, heartbeat)
+            return tuple(a + b for a, b in zip(first, second))
+
+    # --- Jobs de importación: procesamiento en el servidor con checkpoints reanudables ---
+    @staticmethod
+    def storage_dir() -> Path:
+        path = Path(settings.IMPORT_STORAGE_DIR) if settings.IMPORT_STORAGE_DIR else DEFAULT_STORAGE_DIR
+        path.mkdir(parents=True, exist_ok=True)
+        return path
+
+    def create_job(self, db: Session, fileobj: BinaryIO, filename: str, user_id: uuid.UUID | None = None) -> ImportJob:
+        """Copia la subida (en streaming) a un archivo propio del job: sobrevive a la petición y a un reinicio."""
+        self.purge_expired_files(db)
+        job_id = uuid.uuid4()
+        path = self.storage_dir() / f"{job_id}{Path(filename or '').suffix.lower()}"
+        with open(path, "wb") as target:
+            shutil.copyfileobj(fileobj, target, length=1024 * 1024)
+        job = ImportJob(id=job_id, filename=filename or path.name, file_path=str(path), created_by=user_id)
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+
+    def delete_job(self, db: Session, job_id: uuid.UUID) -> bool:
+        """
+        Abandona un job: borra el registro y su copia en disco (las solicitudes ya insertadas se quedan).
+        No toca un job PROCESANDO con latido reciente; False en ese caso.
+        """
+        table = ImportJob.__table__
+        stale = func.now() - timedelta(seconds=settings.IMPORT_STALE_SECONDS)
+        file_path = db.execute(
+            delete(table)
+            .where(table.c.id == job_id, or_(table.c.status != ImportStatus.procesando, table.c.heartbeat_at < stale))
+            .returning(table.c.file_path)
+        ).scalar()
+        db.commit()
+        if file_path is None: return False
+        Path(file_path).unlink(missing_ok=True)
+        logger.info(f"🗑️  Importación {job_id} abandonada; archivo eliminado.")
+        return True
+
+    def purge_expired_files(self, db: Session) -> int:
+        """
+        Borra la copia de los jobs en ERROR que nadie reanudó en IMPORT_RETENTION_HOURS. El registro
+        (contadores, error) se conserva; sin archivo ya no se puede reanudar.
+        """
+        table = ImportJob.__table__
+        expired = db.execute(
+            select(table.c.file_path).where(
+                table.c.status == ImportStatus.error,
+                table.c.finished_at < func.now() - timedelta(hours=settings.IMPORT_RETENTION_HOURS),
+            )
+        ).scalars().all()
+        purged = 0
+        for file_path in expired:
+            path = Path(file_path)
+            if path.exists():
+                path.unlink(missing_ok=True)
+                purged += 1
+        if purged:
+            logger.info(f"🧹 {purged} archivos de importaciones abandonadas eliminados.")
+        return purged
+
+    def claim_job(self, db: Session, job_id: uuid.UUID) -> uuid.UUID | None:
+        """
+        Toma el job si nadie lo está ejecutando: PENDIENTE, ERROR o PROCESANDO sin latido reciente
+        (el proceso que lo corría se cayó). Un solo UPDATE, así que dos procesos nunca lo toman a la vez.
+        Devuelve el token del reclamo (None si otro lo tiene): toda escritura posterior lo exige.
+        """
+        table = ImportJob.__table__
+        stale = func.now() - timedelta(seconds=settings.IMPORT_STALE_SECONDS)
+        token = uuid.uuid4()
+        claimed = db.execute(
+            update(table)
+            .where(
+                table.c.id == job_id,
+                or_(
+                    table.c.status.in_([ImportStatus.pendiente, ImportStatus.error]),
+                    and_(table.c.status == ImportStatus.procesando, table.c.heartbeat_at < stale),
+                ),
+            )
+            .values(
+                status=ImportStatus.procesando, attempts=table.c.attempts + 1, error=None, claim_token=token,
+                started_at=func.coalesce(table.c.started_at, func.now()), heartbeat_at=func.now(),
+            )
+            .returning(table.c.id)
+        ).first()
+        db.commit()
+        return token if claimed is not None else None
+
+    @staticmethod
+    def _update_claimed(db: Session, job_id: uuid.UUID, token: uuid.UUID, **values) -> None:
+        """UPDATE del job sólo si el reclamo sigue siendo nuestro; si no, ImportClaimLost (el llamador hace rollback)."""
+        table = ImportJob.__table__
+        updated = db.execute(
+            update(table).where(table.c.id == job_id, table.c.claim_token == token).values(**values)
+        ).rowcount
+        if not updated:
+            raise ImportClaimLost(f"La importación {job_id} fue tomada por otro proceso")
+
+    def _heartbeat(self, job_id: uuid.UUID, token: uuid.UUID) -> Callable[[], None]:
+        """
+        Latido para bloques lentos (p. ej. divisiones sucesivas de un bloque rechazado): se confirma
+        en su propia sesión, fuera de la transacción del bloque, a lo más cada IMPORT_STALE_SECONDS/4.
+        """
+        last = time.monotonic()
+
+        def beat():
+            nonlocal last
+            if time.monotonic() - last < settings.IMPORT_STALE_SECONDS / 4: return
+            db = SessionLocal()
+            try:
+                self._update_claimed(db, job_id, token, heartbeat_at=func.now())
+                db.commit()
+            finally:
+                db.close()
+            last = time.monotonic()
+        return beat
+
+    def process_job(self, db: Session, job: ImportJob, token: uuid.UUID) -> ImportJob:
+        """
+        Procesa un job ya reclamado desde su checkpoint. Cada bloque se inserta y el checkpoint y los
+        contadores se guardan en la misma transacción: tras una caída se retoma exactamente donde quedó.
+        Si otro proceso retomó el job (este perdió el latido), el bloque en curso se descarta y se detiene.
+        """
+        table = ImportJob.__table__
+        logger.info(f"📥 Importación {job.id} ({job.filename}) desde el renglón {job.checkpoint_row}...")
+        heartbeat = self._heartbeat(job.id, token)
+        try:
+            with open(job.file_path, "rb") as fileobj:
+                columns = None
+                for df in self.read_chunks(fileobj, job.filename, skip=job.checkpoint_row):
+                    if columns is None:
+                        columns = self.detect_columns(df.columns)
+                        if not columns[0] or not columns[1]:
+                            raise ValueError("Columnas requeridas no encontradas.")
+                    imported, located, failed = self.insert(db, self.prepare(df, *columns), heartbeat)
+                    self._update_claimed(
+                        db, job.id, token,
+                        checkpoint_row=table.c.checkpoint_row + len(df),
+                        rows_read=table.c.rows_read + len(df),
+                        rows_inserted=table.c.rows_inserted + imported,
+                        locations_found=table.c.locations_found + located,
+                        rows_failed=table.c.rows_failed + failed,
+                        rows_skipped=table.c.rows_skipped + (len(df) - imported - failed),
+                        heartbeat_at=func.now(),
+                    )
+                    db.commit()
+            self._update_claimed(db, job.id, token, status=ImportStatus.completado, finished_at=func.now())
+            db.commit()
+        except ImportClaimLost as e:
+            db.rollback()
+            logger.warning(f"⚠️ {e}; este proceso deja de escribir en ella.")
+            db.refresh(job)
+            return job
+        except Exception as e:
+            db.rollback()
+            logger.error(f"❌ Importación {job.id} detenida en el renglón {job.checkpoint_row}: {e}")
+            try:
+                self._update_claimed(db, job.id, token, status=ImportStatus.error, error=str(e)[:2000], finished_at=func.now())
+                db.commit()
+            except ImportClaimLost:
+                db.rollback()
+            db.refresh(job)
+            return job
+
+        db.refresh(job)
+        # La copia ya no hace falta: un job completado no se reanuda
+        Path(job.file_path).unlink(missing_ok=True)
+        logger.info(
+            f"📊 Importación {job.id}: {job.rows_inserted} insertadas, {job.rows_skipped} omitidas, "
+            f"{job.rows_failed} fallidas de {job.rows_read} leídas ({job.locations_found} con ubicación)."
+        )
+        if job.rows_inserted:
+            tile_service.invalidate_requests()
+        return job
+
+    def run_job(self, job_id: uuid.UUID, token: uuid.UUID | None = None) -> bool:
+        """
+        Entrada en segundo plano (BackgroundTasks / hilo de arranque) con sesión propia. Sin `token`
+        reclama el job primero; False si otro proceso lo tiene.
+        """
+        db = SessionLocal()
+        try:
+            token = token or self.claim_job(db, job_id)
+            if not token: return False
+            job = self.process_job(db, db.get(ImportJob, job_id), token)
+            if job.status == ImportStatus.completado and job.rows_inserted:
+                ai_service.notify_queue(db)
+                if settings.AI_WORKER_MODE == "inline":
+                    ai_service.run_process_queue()
+        except Exception as e:
+            logger.error(f"🔥 Error en la importación {job_id}: {e}")
+        finally:
+            db.close()
+        return True
+
+    def resume_stale_jobs(self) -> int:
+        """Al arrancar: retoma en un hilo los jobs pendientes o abandonados por un proceso caído."""
+        db = SessionLocal()
+        try:
+            self.purge_expired_files(db)
+            table = ImportJob.__table__
+            ids = db.execute(
+                select(table.c.id).where(table.c.status.in_([ImportStatus.pendiente, ImportStatus.procesando]))
+                .order_by(table.c.created_at)
+            ).scalars().all()
+        finally:
+            db.close()
+        if ids:
+            logger.info(f"♻️  Reanudando {len(ids)} importaciones interrumpidas...")
+            threading.Thread(target=self._resume_jobs, args=(ids,), daemon=True).start()
+        return len(ids)
+
+    def _resume_jobs(self, ids: list):
+        # Un job con latido reciente pudo quedar de un proceso que acaba de caer: se reintenta una vez
+        # cuando su latido ya venció (si otro proceso vivo lo tiene, seguirá latiendo y no se toma)
+        busy = [job_id for job_id in ids if not self.run_job(job_id)]
+        if busy:
+            time.sleep(settings.IMPORT_STALE_SECONDS)
+            for job_id in busy: self.run_job(job_id)
+
+import_service = ImportService()
@@ -0,0 +1,174 @@
+import json
+import logging
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+import numpy as np
+from app.services.dedup_service import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Versión del formato del artefacto: cambiarla invalida los modelos entrenados antes
+MODEL_VERSION = 1
+# Cabezas del modelo: una regresión logística multinomial por campo
+FIELDS = ("topic", "urgency", "sentiment", "request_type")
+DEFAULT_MODEL_PATH = Path(__file__).resolve().parent.parent / "data" / "models" / "local_classifier.npz"
+
+def resolve_model_path(configured: str = "") -> Path:
+    return Path(configured) if configured else DEFAULT_MODEL_PATH
+
+def features(text: str) -> List[str]:
+    """Unigramas y bigramas del texto normalizado, con números enmascarados."""
+    words = re.sub(r"\d+", "#", normalize_text(text)).split()
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+class LocalClassifier:
+    """
+    Clasificador local TF-IDF + regresión logística (sólo numpy) entrenado con las solicitudes
+    ya clasificadas por el LLM. Cada predicción trae la confianza de la cabeza menos segura:
+    sólo las que superan el umbral se resuelven sin llamar al LLM.
+    """
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, heads: Dict[str, Tuple[List[str], np.ndarray]], defaults: Dict[str, dict]):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.heads = heads # campo -> (clases, pesos [n_features + 1, n_clases]; la última fila es el sesgo)
+        self.defaults = defaults # tema -> {"department", "suggested_action"} más frecuentes
+        self.metrics = {}
+
+    # --- Vectorización dispersa (CSR a mano) ---
+    def _transform(self, texts: List[str]):
+        indptr, indices, data = [0], [], []
+        for text in texts:
+            counts = Counter(self.vocabulary[f] for f in features(text) if f in self.vocabulary)
+            cols = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+            tf = 1.0 + np.log(np.fromiter(counts.values(), dtype=np.float64, count=len(counts)))
+            weights = tf * self.idf[cols]
+            norm = np.linalg.norm(weights)
+            indices.append(cols)
+            data.append(weights / norm if norm else weights)
+            indptr.append(indptr[-1] + len(cols))
+        empty = np.zeros(0)
+        return (
+            np.asarray(indptr, dtype=np.int64),
+            np.concatenate(indices).astype(np.int64) if indices else empty.astype(np.int64),
+            np.concatenate(data) if data else empty,
+        )
+
+    @staticmethod
+    def _scores(X, W: np.ndarray) -> np.ndarray:
+        """X @ W + sesgo con reduceat por renglón (más rápido que np.add.at)."""
+        indptr, indices, data = X
+        n = len(indptr) - 1
+        scores = np.tile(W[-1], (n, 1))
+        nonempty = np.flatnonzero(np.diff(indptr))
+        if len(nonempty):
+            scores[nonempty] += np.add.reduceat(W[indices] * data[:, None], indptr[nonempty], axis=0)
+        return scores
+
+    @staticmethod
+    def _softmax(scores: np.ndarray) -> np.ndarray:
+        scores = scores - scores.max(axis=1, keepdims=True)
+        exp = np.exp(scores)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    @classmethod
+    def _fit_heads(cls, X, targets: List[np.ndarray], sizes: List[int], n_features: int, epochs: int, l2: float) -> List[np.ndarray]:
+        """
+        Descenso de gradiente full-batch con Adam sobre la entropía cruzada + L2. Las cabezas se
+        entrenan juntas (pesos apilados por columnas) para recorrer los datos dispersos una vez por época.
+        """
+        indptr, indices, data = X
+        n = len(indptr) - 1
+        rows = np.repeat(np.arange(n), np.diff(indptr))
+        # Xᵀ @ R por columnas: los valores no cero ordenados por característica, sumados por tramo
+        by_feature = np.argsort(indices, kind="stable")
+        feature_ids, starts = np.unique(indices[by_feature], return_index=True)
+        bounds = np.cumsum([0] + sizes)
+        W = np.zeros((n_features + 1, bounds[-1]))
+        m, v = np.zeros_like(W), np.zeros_like(W)
+        onehot = np.hstack([np.eye(size)[y] for y, size in zip(targets, sizes)])
+        lr, beta1, beta2 = 0.1, 0.9, 0.999
+        for t in range(1, epochs + 1):
+            scores = cls._scores(X, W)
+            probs = np.hstack([cls._softmax(scores[:, a:b]) for a, b in zip(bounds, bounds[1:])])
+            residual = (probs - onehot) / n
+            grad = np.zeros_like(W)
+            if len(indices):
+                contributions = residual[rows[by_feature]] * data[by_feature, None]
+                grad[feature_ids] = np.add.reduceat(contributions, starts, axis=0)
+            grad[:-1] += l2 * W[:-1]
+            grad[-1] = residual.sum(axis=0)
+            m = beta1 * m + (1 - beta1) * grad
+            v = beta2 * v + (1 - beta2) * grad ** 2
+            W -= lr * (m / (1 - beta1 ** t)) / (np.sqrt(v / (1 - beta2 ** t)) + 1e-8)
+        return [W[:, a:b] for a, b in zip(bounds, bounds[1:])]
+
+    @classmethod
+    def fit(cls, texts: List[str], labels: Dict[str, List[str]], defaults: Dict[str, dict],
+            min_df: int = 2, max_features: int = 50000, epochs: int = 150, l2: float = 1e-4) -> "LocalClassifier":
+        df = Counter()
+        for text in texts:
+            df.update(set(features(text)))
+        kept = sorted(f for f, count in df.most_common(max_features) if count >= min_df)
+        vocabulary = {f: i for i, f in enumerate(kept)}
+        idf = np.array([np.log((1 + len(texts)) / (1 + df[f])) + 1.0 for f in kept])
+
+        model = cls(vocabulary, idf, {}, defaults)
+        classes = {field: sorted(set(labels[field])) for field in FIELDS}
+        targets = []
+        for field in FIELDS:
+            index = {c: i for i, c in enumerate(classes[field])}
+            targets.append(np.array([index[label] for label in labels[field]], dtype=np.int64))
+        weights = cls._fit_heads(
+            model._transform(texts), targets, [len(classes[field]) for field in FIELDS], len(vocabulary), epochs, l2
+        )
+        model.heads = {field: (classes[field], np.ascontiguousarray(W)) for field, W in zip(FIELDS, weights)}
+        return model
+
+    def predict(self, texts: List[str]) -> List[Tuple[dict, float]]:
+        """[(valores por campo + dependencia y acción sugeridas, confianza)] en el orden de `texts`."""
+        if not texts: return []
+        X = self._transform(texts)
+        values = [{} for _ in texts]
+        confidence = np.ones(len(texts))
+        for field, (classes, W) in self.heads.items():
+            probs = self._softmax(self._scores(X, W))
+            best = probs.argmax(axis=1)
+            confidence = np.minimum(confidence, probs[np.arange(len(texts)), best])
+            for i, b in enumerate(best):
+                values[i][field] = classes[b]
+        for item in values:
+            item.update(self.defaults.get(item["topic"], {}))
+        return list(zip(values, confidence.tolist()))
+
+    # --- Artefacto en disco ---
+    def save(self, path: Path, metrics: dict | None = None):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        vocab = sorted(self.vocabulary, key=self.vocabulary.get)
+        meta = {
+            "version": MODEL_VERSION,
+            "classes": {field: classes for field, (classes, _) in self.heads.items()},
+            "defaults": self.defaults,
+            "metrics": metrics or {},
+        }
+        tmp = path.with_suffix(".tmp.npz")
+        np.savez_compressed(
+            tmp, vocabulary=np.array(vocab, dtype=str), idf=self.idf, meta=np.array(json.dumps(meta, ensure_ascii=False)),
+            **{f"W_{field}": W for field, (_, W) in self.heads.items()},
+        )
+        # Reemplazo atómico: los workers en marcha nunca leen un artefacto a medias
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> "LocalClassifier":
+        with np.load(path) as archive:
+            meta = json.loads(str(archive["meta"]))
+            if meta.get("version") != MODEL_VERSION:
+                raise ValueError(f"versión de artefacto {meta.get('version')} != {MODEL_VERSION}")
+            vocabulary = {f: i for i, f in enumerate(archive["vocabulary"].tolist())}
+            heads = {field: (classes, archive[f"W_{field}"]) for field, classes in meta["classes"].items()}
+            model = cls(vocabulary, archive["idf"], heads, meta["defaults"])
+        model.metrics = meta.get("metrics", {})
+        return model
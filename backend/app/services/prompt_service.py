@@ -4,19 +4,38 @@ from typing import List, Dict, Any
 import logging
 from sqlalchemy.orm import Session
 from app.models.knowledge import KnowledgeItem
+from app.models.requests import Topic, Urgency, Sentiment, RequestType
 from app.services.embedding_service import embedding_service
 
 logger = logging.getLogger(__name__)
 
 class PromptService:
+    # Plantillas compiladas una sola vez al arrancar (sin revisar el disco en cada render)
+    TEMPLATES = (
+        "analysis/batch_root_cause.j2",
+        "analysis/triage_level1.j2",
+        "analysis/classify_batch_system.j2",
+    )
+
     def __init__(self):
         current_dir = os.path.dirname(os.path.abspath(__file__))
         prompts_dir = os.path.join(current_dir, "../prompts")
         
         self.env = Environment(
             loader=FileSystemLoader(prompts_dir),
-            autoescape=select_autoescape(['html', 'xml', 'j2'])
+            autoescape=select_autoescape(['html', 'xml', 'j2']),
+            auto_reload=False,
+            trim_blocks=True, # Sin líneas vacías tras {% for %}/{% include %}: menos tokens por llamada
         )
+        self.templates = {name: self.env.get_template(name) for name in self.TEMPLATES}
+        # Prompt de sistema del clasificador: estático y byte-idéntico entre llamadas para que
+        # el caché de prefijos del proveedor lo reutilice
+        self.classification_system_prompt = self.templates["analysis/classify_batch_system.j2"].render(
+            request_types=[t.value for t in RequestType if t != RequestType.desconocida],
+            topics=[t.value for t in Topic],
+            urgencies=[u.value for u in Urgency],
+            sentiments=[s.value for s in Sentiment],
+        ).strip()
 
     def get_rag_context(self, db: Session, query_text: str, limit: int = 3) -> str:
         """
@@ -62,8 +81,7 @@ class PromptService:
             rag_context = self.get_rag_context(db, search_query)
             
             # 3. Renderizar Template
-            template = self.env.get_template("analysis/batch_root_cause.j2")
-            return template.render(requests=requests, rag_context=rag_context)
+            return self.templates["analysis/batch_root_cause.j2"].render(requests=requests, rag_context=rag_context)
             
         except Exception as e:
             logger.error(f"❌ Error renderizando prompt batch: {e}")
@@ -71,8 +89,7 @@ class PromptService:
 
     def render_triage(self, request_data: Dict[str, Any], rag_context: str = "") -> str:
         try:
-            template = self.env.get_template("analysis/triage_level1.j2")
-            return template.render(request=request_data, rag_context=rag_context)
+            return self.templates["analysis/triage_level1.j2"].render(request=request_data, rag_context=rag_context)
         except Exception as e:
             logger.error(f"❌ Error renderizando prompt triage: {e}")
             return ""
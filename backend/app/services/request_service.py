@@ -1,30 +1,61 @@
 import uuid
 from datetime import datetime
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models.requests import CitizenRequest, RequestStatus
-from app.models.organization import Department
+from sqlalchemy import BigInteger, cast, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from app.models.requests import CitizenRequest, FolioCounter, RequestStatus, Topic, AnalysisStatus
 from app.schemas.requests import RequestCreate, RequestUpdateStatus
-from app.services.ai_service import ai_service
 from app.services.routing_service import routing_service # <--- IMPORTANTE
+from app.services.tile_service import tile_service
+
+# Formato de folio: YUC-{año}-{00000}
+FOLIO_PREFIX = "YUC"
 
 class RequestService:
-    def generate_folio(self, db: Session) -> str:
-        year = datetime.now().year
-        count = db.query(func.count(CitizenRequest.id)).scalar() or 0
-        return f"YUC-{year}-{str(count + 1).zfill(5)}"
+    def generate_folio(self, db: Session, year: int | None = None) -> str:
+        """
+        Reserva el siguiente folio del año con un solo UPDATE ... RETURNING sobre el contador. Corre en
+        su propia transacción corta: dos altas simultáneas nunca reciben el mismo número y el candado
+        del contador no dura lo que la transacción del llamador; un folio reservado que no se usa queda
+        como hueco, igual que con una secuencia. (Las importaciones traen sus propios folios.)
+        """
+        year = year or datetime.now().year
+        table = FolioCounter.__table__
+        bump = (
+            update(table)
+            .where(table.c.year == year)
+            .values(last_value=table.c.last_value + 1)
+            .returning(table.c.last_value)
+        )
+        with db.get_bind().begin() as conn:
+            last = conn.execute(bump).scalar()
+            if last is None:
+                # Primer folio del año: el contador arranca en el mayor folio ya emitido con este formato
+                folio = CitizenRequest.__table__.c.folio
+                number = cast(func.substring(folio, rf"^{FOLIO_PREFIX}-{year}-(\d+)$"), BigInteger)
+                conn.execute(
+                    pg_insert(table)
+                    .from_select(
+                        ["year", "last_value"],
+                        select(literal(year), func.coalesce(func.max(number), 0))
+                        .where(folio.like(f"{FOLIO_PREFIX}-{year}-%")),
+                    )
+                    .on_conflict_do_nothing()
+                )
+                last = conn.execute(bump).scalar()
+        return f"{FOLIO_PREFIX}-{year}-{str(last).zfill(5)}"
 
-    async def create_request(self, db: Session, request_in: RequestCreate, citizen_id: uuid.UUID) -> CitizenRequest:
+    def create_request(self, db: Session, request_in: RequestCreate, citizen_id: uuid.UUID) -> CitizenRequest:
         # 1. Generar Folio
         folio = self.generate_folio(db)
         
-        # 2. Clasificar con IA
-        ai_data = await ai_service.classify_request(request_in.description)
-        topic = ai_data.get("topic")
+        # 2. La clasificación IA se hace en la cola: la solicitud nace PENDIENTE con el tema por defecto
+        topic = Topic.otros
         
         # 3. RUTEO INTELIGENTE (El Eslabón Perdido)
         dept_id = None
         detected_zone = None
+        detected_sector = None
         
         # Si hay coordenadas, usamos el RoutingService
         if request_in.latitude and request_in.longitude:
@@ -32,14 +63,12 @@ class RequestService:
             detected_zone = routing_service.get_zone_from_coords(request_in.latitude, request_in.longitude)
             
             if detected_zone:
-                # B. Determinar nombre del departamento responsable
-                target_dept_name = routing_service.get_department_for_request(detected_zone, topic)
-                
-                # C. Buscar ese departamento en la BD para obtener su UUID
-                if target_dept_name:
-                    dept_obj = db.query(Department).filter(Department.name == target_dept_name).first()
-                    if dept_obj:
-                        dept_id = dept_obj.id
+                # B. Colonia/AGEB dentro del municipio (sólo si existe la capa de sectores)
+                detected_sector = routing_service.get_sector_from_coords(
+                    request_in.latitude, request_in.longitude, zone=detected_zone
+                )
+                # C. Departamento provisional (reglas de la zona); el worker IA vuelve a rutear con el tema real
+                dept_id = routing_service.get_department_id(db, detected_zone, topic, detected_sector)
         
         # Si el usuario mandó un ID manual (y no lo sobreescribimos), úsalo
         if not dept_id and request_in.department_id:
@@ -50,7 +79,8 @@ class RequestService:
         # Enriquecer la ubicación con el municipio detectado
         final_location = request_in.location_text
         if detected_zone:
-            final_location = f"{final_location} [{detected_zone}]"
+            zone_label = f"{detected_zone} / {detected_sector}" if detected_sector else detected_zone
+            final_location = f"{final_location} [{zone_label}]"
 
         # 4. Crear Objeto
         db_request = CitizenRequest(
@@ -62,21 +92,21 @@ class RequestService:
             evidence_url=request_in.evidence_url,
             citizen_id=citizen_id,
             department_id=dept_id, # <--- Aquí va el ID calculado
-            # Datos IA
             topic=topic,
-            sentiment=ai_data.get("sentiment"),
-            urgency=ai_data.get("urgency"),
+            analysis_status=AnalysisStatus.pendiente,
             # Timeline
             timeline=[{
                 "action": "created",
                 "timestamp": datetime.now().isoformat(),
-                "note": f"Recibido. Clasificado como {topic}. Zona detectada: {detected_zone or 'Desconocida'}."
+                "note": f"Recibido. Clasificación en proceso. Zona detectada: {detected_zone or 'Desconocida'}."
             }]
         )
         
         db.add(db_request)
         db.commit()
         db.refresh(db_request)
+        # El nuevo punto debe aparecer en el mapa de calor
+        tile_service.invalidate_point(db_request.latitude, db_request.longitude)
         return db_request
 
     def update_status(self, db: Session, request_id: str, update_data: RequestUpdateStatus, official_id: str) -> CitizenRequest:
@@ -1,96 +1,384 @@
-import json
 import logging
-from pathlib import Path
-from shapely.geometry import Point, shape
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+import numpy as np
+import shapely
+from shapely.geometry import Point, box
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.organization import Department
+from app.models.requests import Topic
+from app.models.routing import RoutingRule, RoutingConfigVersion
+from app.services.geometry_cache import (
+    GeometryCache, GeometryLayer, PartitionedLayer, SECTORS_GEOJSON, SECTOR_NAME_PROPERTY, resolve_geojson_path
+)
 
 logger = logging.getLogger(__name__)
 
+# Matriz inicial (zona, tema, departamento): se siembra en routing_rules si la tabla está vacía.
+# Después la BD es la fuente de verdad y se edita con /routing/rules.
+DEFAULT_ROUTING_RULES = [
+    ("Mérida", "Servicios Públicos", "Dirección de Servicios Públicos Municipales"),
+    ("Mérida", "Seguridad", "Policía Municipal de Mérida"),
+    ("Kanasín", "Seguridad", "Policía Municipal de Kanasín"),
+    ("Valladolid", "Salud", "Jurisdicción Sanitaria No. 2"),
+    (None, "Salud", "Secretaría de Salud de Yucatán (SSY)"),
+    (None, "Seguridad", "Secretaría de Seguridad Pública (SSP)"),
+    (None, "Transporte", "Instituto de Movilidad (IMDUT)"),
+    (None, None, "Atención Ciudadana General"),
+]
+# Cada cuánto un worker compara su versión con la de la BD (una consulta de una fila)
+VERSION_CHECK_INTERVAL_SECONDS = 5
+# Llave de pg_advisory_xact_lock para sembrar la matriz una sola vez aunque arranquen varios workers
+SEED_LOCK_KEY = 7_300_201
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat: float, lon: float, precision: int) -> str:
+    """Geohash estándar: celdas vecinas comparten prefijo, así que sirve como llave redondeada."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, ch, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            ch = (ch << 1) | 1
+            rng[0] = mid
+        else:
+            ch <<= 1
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_GEOHASH_ALPHABET[ch])
+            bits, ch = 0, 0
+    return "".join(chars)
+
+class GeocodeCache:
+    """LRU acotado de geohash -> municipio, con contadores de aciertos/fallos."""
+    MISSING = object()
+
+    def __init__(self, max_size: int, precision: int):
+        self.max_size = max_size
+        self.precision = precision
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, lat: float, lon: float) -> str:
+        return geohash(lat, lon, self.precision)
+
+    def get(self, key: str):
+        """Devuelve el municipio (puede ser None) o GeocodeCache.MISSING si no está."""
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return self.MISSING
+
+    def put(self, key: str, zone: str | None):
+        with self._lock:
+            self._data[key] = zone
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "precision": self.precision,
+        }
+
+class RoutingSnapshot(NamedTuple):
+    """Tabla de ruteo compilada e inmutable; se reemplaza completa al recargar."""
+    version: int
+    department_names: Mapping # (zona, sector, tema) -> nombre del departamento
+    department_ids: Mapping # (zona, sector, tema) -> Department.id (None si no existe en la BD)
+
 class RoutingService:
     def __init__(self):
-        geojson_path = Path("/app/app/data/yucatan_municipios.geojson")
-        if not geojson_path.exists():
-            geojson_path = Path("app/data/yucatan_municipios.geojson")
-
-        if not geojson_path.exists():
-            self.zones = []
+        # Las geometrías NO se cargan aquí: se leen del caché binario la primera vez que se consultan
+        geojson_path = resolve_geojson_path()
+        if not geojson_path:
             logger.error("❌ GeoJSON no encontrado.")
-            return
+        self.geometry_cache = GeometryCache(geojson_path) if geojson_path else None
+        self._layers = {}
+        self._layers_lock = threading.Lock()
+        sectors_path = resolve_geojson_path(SECTORS_GEOJSON)
+        self.sector_cache = GeometryCache(
+            sectors_path, name_property=SECTOR_NAME_PROPERTY, render_maps=False
+        ) if sectors_path else None
+        self._sectors = None
+        self._sectors_loaded = False
+        self._maps = {}
+        self.geocode_cache = GeocodeCache(settings.GEOCODE_CACHE_SIZE, settings.GEOCODE_CACHE_PRECISION)
 
-        try:
-            with open(geojson_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                self.zones = data.get("features", [])
-            logger.info(f"🗺️  GeoJSON cargado: {len(self.zones)} zonas.")
-        except Exception as e:
-            logger.error(f"❌ Error leyendo GeoJSON: {e}")
-            self.zones = []
-        
-        # Puntos de respaldo para municipios con geometrías complejas que fallan en Shapely
-        self.fallback_centroids = {
-            "Progreso": Point(-89.6630, 21.2820), # Malecón
-            "Celestún": Point(-90.3989, 20.8589)  # Centro
-        }
+        # Versión -1: aún no se ha leído la BD; mientras tanto los nombres salen de la matriz inicial
+        self._routing = self._compile(self._default_rules(), {}, version=-1)
+        self._last_version_check = 0.0
 
-        self.assignment_matrix = {
-            ("Mérida", "Servicios Públicos"): "Dirección de Servicios Públicos Municipales",
-            ("Mérida", "Seguridad"): "Policía Municipal de Mérida",
-            ("Kanasín", "Seguridad"): "Policía Municipal de Kanasín",
-            ("Valladolid", "Salud"): "Jurisdicción Sanitaria No. 2",
-        }
+    def get_layer(self, variant: str = "full") -> GeometryLayer | None:
+        """Capa de geometrías (full o simplified) cargada perezosamente desde el caché en disco."""
+        if variant in self._layers: return self._layers[variant]
+        if not self.geometry_cache: return None
+        with self._layers_lock:
+            if variant not in self._layers:
+                try:
+                    self._layers[variant] = self.geometry_cache.load(variant)
+                    logger.info(f"🗺️  Geometrías '{variant}' cargadas: {len(self._layers[variant])} zonas.")
+                except Exception as e:
+                    logger.error(f"❌ Error cargando geometrías: {e}")
+                    self._layers[variant] = None
+        return self._layers[variant]
+
+    def get_map(self, resolution: str, encoding: str = "identity"):
+        """(cuerpo, etag) del GeoJSON del mapa en la resolución/codificación pedida, en memoria tras el primer uso."""
+        key = (resolution, encoding)
+        if key in self._maps: return self._maps[key]
+        if not self.geometry_cache: return None
+        # Primer uso: una sola lectura (o reconstrucción del caché) aunque lleguen varias peticiones a la vez
+        with self._layers_lock:
+            if key not in self._maps:
+                self._maps[key] = self.geometry_cache.load_map(resolution, encoding)
+        return self._maps[key]
+
+    def get_sectors(self) -> PartitionedLayer | None:
+        """Capa de colonias/AGEBs particionada por municipio; None si no hay GeoJSON de sectores."""
+        if self._sectors_loaded: return self._sectors
+        with self._layers_lock:
+            if not self._sectors_loaded:
+                if self.sector_cache:
+                    try:
+                        self._sectors = PartitionedLayer(self.sector_cache.load("full"))
+                        logger.info(
+                            f"🏘️  Sectores cargados: {len(self._sectors)} polígonos en "
+                            f"{len(self._sectors.partitions)} municipios."
+                        )
+                    except Exception as e:
+                        logger.error(f"❌ Error cargando sectores: {e}")
+                self._sectors_loaded = True
+        return self._sectors
+
+    @property
+    def zone_names(self) -> list:
+        layer = self.get_layer()
+        return layer.names if layer else []
+
+    def _zone_code(self, zone: str) -> str | None:
+        layer = self.get_layer()
+        if not layer or zone not in layer.names: return None
+        return layer.codes[layer.names.index(zone)]
+
+    def sector_names(self, zone: str) -> list:
+        sectors = self.get_sectors()
+        code = self._zone_code(zone) if sectors else None
+        return sectors.names(code) if code else []
+
+    def get_sector_from_coords(self, lat: float, lon: float, zone: str | None = None) -> str | None:
+        """
+        Colonia/AGEB que contiene el punto. Búsqueda jerárquica: primero el municipio
+        (o el que ya resolvió el llamador) y luego sólo el sub-índice de ese municipio.
+        """
+        sectors = self.get_sectors()
+        if not sectors: return None
+        zone = zone or self.get_zone_from_coords(lat, lon)
+        code = self._zone_code(zone) if zone else None
+        if not code: return None
+        idx = sectors.locate(code, lon, lat)
+        return sectors.layer.names[idx] if idx is not None else None
 
     def get_candidates_from_coords(self, lat: float, lon: float):
-        if not self.zones: return []
+        layer = self.get_layer()
+        if not layer or layer.tree is None: return []
             
         point = Point(lon, lat)
         candidates = []
-        processed_names = set()
-
-        # 1. Búsqueda Geométrica (Polígonos)
-        for zone in self.zones:
-            name = zone["properties"].get("NOMGEO")
-            try:
-                polygon = shape(zone["geometry"])
-                if not polygon.is_valid: polygon = polygon.buffer(0)
-
-                dist = polygon.distance(point)
-                
-                if dist < 0.2: # 20km radio
-                    candidates.append({"zone": name, "distance": dist})
-                    processed_names.add(name)
-            except Exception as e:
-                # Si falla la geometría, no lo ignoramos silenciosamente
-                # logger.warning(f"Error procesando geometría de {name}: {e}")
-                continue
-        
-        # 2. Búsqueda de Respaldo (Puntos Fijos)
-        # Si Progreso falló arriba por error de geometría, lo atrapamos aquí
-        for name, centroid in self.fallback_centroids.items():
-            if name not in processed_names:
-                dist = point.distance(centroid)
-                if dist < 0.1: # 10km radio para el punto fijo
-                    candidates.append({"zone": name, "distance": dist})
-                    logger.info(f"⚠️ Usando fallback por punto para {name}")
+
+        # Búsqueda Geométrica (Polígonos cuyo bounding box cae dentro del radio)
+        # Se ordenan los índices para conservar el orden original del GeoJSON ante empates
+        nearby = np.sort(layer.tree.query(box(lon - 0.2, lat - 0.2, lon + 0.2, lat + 0.2)))
+        for idx, polygon in zip(nearby, layer.geometries(nearby)):
+            name = layer.names[idx]
+            # contains() sobre geometría preparada evita calcular distancias cuando el punto está dentro
+            dist = 0.0 if polygon.contains(point) else polygon.distance(point)
+
+            if dist < 0.2: # 20km radio
+                candidates.append({"zone": name, "distance": dist})
 
         # Ordenar
         candidates.sort(key=lambda x: x["distance"])
         return candidates[:5]
 
     def get_zone_from_coords(self, lat: float, lon: float) -> str | None:
-        candidates = self.get_candidates_from_coords(lat, lon)
-        if candidates:
-            best = candidates[0]
-            # Umbral de aceptación
-            if best["distance"] < 0.15:
-                return best["zone"]
+        # Ubicaciones repetidas (el mismo bache reportado 40 veces) se resuelven desde el caché
+        key = self.geocode_cache.key(lat, lon)
+        zone = self.geocode_cache.get(key)
+        if zone is GeocodeCache.MISSING:
+            zone = self.resolve_zone(lat, lon)
+            self.geocode_cache.put(key, zone)
+        return zone
+
+    def resolve_zone(self, lat: float, lon: float) -> str | None:
+        """Resolución exacta, sin pasar por el caché."""
+        layer = self.get_layer()
+        if not layer or layer.tree is None: return None
+
+        # 1. Punto dentro de un municipio (contains sobre geometría preparada)
+        point = Point(lon, lat)
+        inside = np.sort(layer.tree.query(point))
+        for idx, polygon in zip(inside, layer.geometries(inside)):
+            if polygon.contains(point): return layer.names[idx]
+
+        # 2. Costa, islotes o huecos entre polígonos: municipio más cercano dentro del umbral de aceptación
+        nearest = layer.nearest(lon, lat, max_distance=0.15)
+        if nearest is not None and nearest[1] < 0.15:
+            return layer.names[nearest[0]]
         return None
 
-    def get_department_for_request(self, zone: str, topic: str) -> str | None:
+    def get_zones_bulk(self, lats, lons, coarse: bool = False):
+        """
+        Versión vectorizada de get_zone_from_coords para miles de puntos en una sola pasada.
+        Recibe arreglos de latitudes/longitudes y devuelve (zonas, distancias) del mismo largo;
+        los puntos sin municipio aceptable quedan como None / NaN.
+        coarse=True usa las geometrías simplificadas (más rápido, ~100 m de error en bordes).
+        """
+        layer = self.get_layer("simplified" if coarse else "full")
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        n = len(lats)
+        zone_idx = np.full(n, -1, dtype=np.int64)
+        distances = np.full(n, np.nan)
+
+        if n and layer and layer.tree is not None:
+            # 1. Punto-en-polígono: el índice filtra por bounding box y contains_xy (geometría
+            #    preparada) decide, agrupando los puntos por municipio candidato.
+            pt_idx, geom_idx = layer.tree.query(shapely.points(lons, lats))
+            for g in np.unique(geom_idx):
+                pts = pt_idx[geom_idx == g]
+                pts = pts[zone_idx[pts] < 0] # Ante solapes gana el primero del GeoJSON
+                inside = pts[shapely.contains_xy(layer.geometry(g), lons[pts], lats[pts])]
+                zone_idx[inside] = g
+                distances[inside] = 0.0
+
+            # 2. El resto: municipio más cercano dentro del umbral de aceptación (0.15°)
+            missing = np.flatnonzero(zone_idx < 0)
+            if len(missing):
+                m_lats, m_lons = lats[missing], lons[missing]
+                boxes = shapely.box(m_lons - 0.15, m_lats - 0.15, m_lons + 0.15, m_lats + 0.15)
+                box_idx, geom_idx = layer.tree.query(boxes)
+                near_dist = shapely.distance(
+                    layer.geometries(geom_idx),
+                    shapely.points(m_lons[box_idx], m_lats[box_idx])
+                )
+                ok = near_dist < 0.15
+                box_idx, geom_idx, near_dist = box_idx[ok], geom_idx[ok], near_dist[ok]
+                if len(box_idx):
+                    # Menor distancia por punto; empates resueltos por orden del GeoJSON
+                    order = np.lexsort((geom_idx, near_dist, box_idx))
+                    box_idx, geom_idx, near_dist = box_idx[order], geom_idx[order], near_dist[order]
+                    first = np.r_[True, box_idx[1:] != box_idx[:-1]]
+                    target = missing[box_idx[first]]
+                    zone_idx[target] = geom_idx[first]
+                    distances[target] = near_dist[first]
+
+        zones = np.array((layer.names if layer else []) + [None], dtype=object)[zone_idx]
+        return zones, distances
+
+    @staticmethod
+    def _default_rules():
+        return [(zone, None, topic, name) for zone, topic, name in DEFAULT_ROUTING_RULES]
+
+    @staticmethod
+    def _compile(rules, department_ids: dict, version: int) -> RoutingSnapshot:
+        names = {(zone, sector, topic): name for zone, sector, topic, name in rules}
+        ids = {key: department_ids.get(name) for key, name in names.items()}
+        return RoutingSnapshot(version, MappingProxyType(names), MappingProxyType(ids))
+
+    @staticmethod
+    def _lookup_keys(zone: str, topic: str, sector: str | None = None):
+        # Sector -> todo el municipio -> el tema en cualquier municipio -> defecto
+        sector_keys = ((zone, sector, topic), (zone, sector, None)) if sector else ()
+        return sector_keys + ((zone, None, topic), (zone, None, None), (None, None, topic), (None, None, None))
+
+    def get_config_version(self, db: Session) -> int:
+        return db.query(RoutingConfigVersion.version).filter(RoutingConfigVersion.id == 1).scalar() or 0
+
+    def bump_config_version(self, db: Session):
+        """Incrementa la versión dentro de la transacción del llamador (se publica con su commit)."""
+        updated = db.query(RoutingConfigVersion).filter(RoutingConfigVersion.id == 1).update(
+            {RoutingConfigVersion.version: RoutingConfigVersion.version + 1}, synchronize_session=False
+        )
+        if not updated:
+            db.add(RoutingConfigVersion(id=1, version=1))
+
+    def seed_default_rules(self, db: Session):
+        # Zona/tema NULL no chocan en un índice único: el candado serializa la verificación y el insert
+        db.execute(select(func.pg_advisory_xact_lock(SEED_LOCK_KEY)))
+        if db.query(RoutingRule.id).first():
+            db.commit() # Libera el candado
+            return
+        for zone, topic, name in DEFAULT_ROUTING_RULES:
+            db.add(RoutingRule(zone=zone, topic=Topic(topic) if topic else None, department_name=name))
+        self.bump_config_version(db)
+        db.commit()
+        logger.info(f"🌱 Matriz de ruteo inicial sembrada: {len(DEFAULT_ROUTING_RULES)} reglas.")
+
+    def refresh_routing_table(self, db: Session) -> RoutingSnapshot:
+        """
+        Compila routing_rules contra la tabla departments en un dict (zona, sector, tema) -> id.
+        Se reemplaza de forma atómica, así que las lecturas concurrentes nunca ven una tabla a medias.
+        """
+        # La versión se lee ANTES que las reglas: si cambian en medio, la siguiente verificación recompila
+        version = self.get_config_version(db)
+        rules = [
+            (r.zone, r.sector, r.topic.value if r.topic else None, r.department_name)
+            for r in db.query(RoutingRule).all()
+        ] or self._default_rules()
+
+        ids = {}
+        for dept_id, name in db.query(Department.id, Department.name).order_by(Department.created_at).all():
+            ids.setdefault(name, dept_id) # Ante nombres duplicados gana el más antiguo
+
+        self._routing = self._compile(rules, ids, version)
+        self._last_version_check = time.monotonic()
+        logger.info(
+            f"🧭 Tabla de ruteo v{version} compilada: "
+            f"{sum(v is not None for v in self._routing.department_ids.values())}/{len(rules)} reglas con departamento."
+        )
+        return self._routing
+
+    def get_department_id(self, db: Session, zone: str, topic: str, sector: str | None = None) -> uuid.UUID | None:
+        """Departamento responsable desde la tabla en memoria; sólo consulta la BD para verificar la versión."""
         if not zone or not topic: return None
-        dept = self.assignment_matrix.get((zone, topic))
-        if dept: return dept
-        if topic == "Salud": return "Secretaría de Salud de Yucatán (SSY)"
-        if topic == "Seguridad": return "Secretaría de Seguridad Pública (SSP)"
-        if topic == "Transporte": return "Instituto de Movilidad (IMDUT)"
-        return "Atención Ciudadana General"
+        topic = getattr(topic, "value", topic)
+
+        snapshot = self._routing
+        now = time.monotonic()
+        if snapshot.version < 0 or now - self._last_version_check > VERSION_CHECK_INTERVAL_SECONDS:
+            self._last_version_check = now
+            if snapshot.version < 0 or self.get_config_version(db) != snapshot.version:
+                snapshot = self.refresh_routing_table(db)
+
+        for key in self._lookup_keys(zone, topic, sector):
+            if key in snapshot.department_ids: return snapshot.department_ids[key]
+        return None
 
 routing_service = RoutingService()
\ No newline at end of file
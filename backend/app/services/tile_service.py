@@ -0,0 +1,200 @@
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+import mapbox_vector_tile
+import numpy as np
+import shapely
+from shapely.geometry import Point, box
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.models.requests import CitizenRequest
+from app.services.routing_service import routing_service
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS = 6378137.0
+EXTENT = 4096
+# Margen alrededor del tile (en unidades de EXTENT) para que los bordes no se vean cortados
+BUFFER = 64
+# Por debajo de este zoom las solicitudes se agregan en una malla de GRID x GRID celdas por tile
+CLUSTER_MAX_ZOOM = 13
+CLUSTER_GRID = 64
+MAX_POINTS_PER_TILE = 5000
+# Por debajo de este zoom basta con la variante simplificada de las geometrías
+SIMPLIFIED_MAX_ZOOM = 10
+CACHE_SIZE = 2048
+# Otros workers no reciben la invalidación: acotamos cuánto puede envejecer un tile de solicitudes
+REQUESTS_TTL_SECONDS = 60
+
+def tile_bounds(z: int, x: int, y: int):
+    """(oeste, sur, este, norte) en grados del tile XYZ."""
+    n = 2 ** z
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+def lonlat_to_tile(lat: float, lon: float, z: int):
+    n = 2 ** z
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def to_mercator(coords: np.ndarray) -> np.ndarray:
+    lon, lat = coords[:, 0], np.clip(coords[:, 1], -85.0511, 85.0511)
+    return np.column_stack([
+        EARTH_RADIUS * np.radians(lon),
+        EARTH_RADIUS * np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)),
+    ])
+
+class TileCache:
+    """LRU acotado de tiles ya codificados, con expiración opcional por entrada."""
+    def __init__(self, max_size: int, ttl: float | None = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None: return None
+            value, created = entry
+            if self.ttl and time.monotonic() - created > self.ttl:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class TileService:
+    def __init__(self):
+        # Los municipios no cambian en caliente; las solicitudes sí
+        self.municipality_tiles = TileCache(CACHE_SIZE)
+        self.request_tiles = TileCache(CACHE_SIZE, ttl=REQUESTS_TTL_SECONDS)
+
+    def _encode(self, name: str, features: list, bounds_m) -> bytes:
+        if not features: return b""
+        return mapbox_vector_tile.encode(
+            [{"name": name, "features": features}],
+            default_options={"quantize_bounds": bounds_m, "extents": EXTENT},
+        )
+
+    def _mercator_bounds(self, z: int, x: int, y: int):
+        west, south, east, north = tile_bounds(z, x, y)
+        (minx, miny), (maxx, maxy) = to_mercator(np.array([[west, south], [east, north]]))
+        return minx, miny, maxx, maxy
+
+    def _municipality_layer(self, z: int, x: int, y: int) -> bytes:
+        layer = routing_service.get_layer("simplified" if z < SIMPLIFIED_MAX_ZOOM else "full")
+        if not layer or layer.tree is None: return b""
+
+        west, south, east, north = tile_bounds(z, x, y)
+        pad_x = (east - west) * BUFFER / EXTENT
+        pad_y = (north - south) * BUFFER / EXTENT
+        idx = np.sort(layer.tree.query(box(west - pad_x, south - pad_y, east + pad_x, north + pad_y)))
+        if not len(idx): return b""
+
+        bounds_m = self._mercator_bounds(z, x, y)
+        clipped = shapely.clip_by_rect(layer.geometries(idx), west - pad_x, south - pad_y, east + pad_x, north + pad_y)
+        projected = shapely.transform(clipped, to_mercator)
+        # Nada por debajo de una unidad del tile es visible
+        projected = shapely.simplify(projected, (bounds_m[2] - bounds_m[0]) / EXTENT, preserve_topology=True)
+
+        features = [
+            {"geometry": geom, "properties": {"name": layer.names[i]}}
+            for i, geom in zip(idx, projected)
+            if not geom.is_empty
+        ]
+        return self._encode("municipios", features, bounds_m)
+
+    def _requests_layer(self, db: Session, z: int, x: int, y: int) -> bytes:
+        west, south, east, north = tile_bounds(z, x, y)
+        in_tile = (
+            CitizenRequest.latitude.isnot(None),
+            CitizenRequest.longitude.isnot(None),
+            CitizenRequest.longitude >= west, CitizenRequest.longitude < east,
+            CitizenRequest.latitude > south, CitizenRequest.latitude <= north,
+        )
+        bounds_m = self._mercator_bounds(z, x, y)
+
+        if z < CLUSTER_MAX_ZOOM:
+            # Agregación en BD: celda de la malla en coordenadas Web Mercator del tile
+            merc_y = func.ln(func.tan(math.pi / 4 + func.radians(CitizenRequest.latitude) / 2)) * EARTH_RADIUS
+            cell_x = func.floor((CitizenRequest.longitude - west) / (east - west) * CLUSTER_GRID)
+            cell_y = func.floor((merc_y - bounds_m[1]) / (bounds_m[3] - bounds_m[1]) * CLUSTER_GRID)
+            rows = db.query(
+                func.count(CitizenRequest.id),
+                func.avg(CitizenRequest.longitude),
+                func.avg(CitizenRequest.latitude),
+            ).filter(*in_tile).group_by(cell_x, cell_y).all()
+            features = [
+                {"geometry": Point(to_mercator(np.array([[lon, lat]]))[0]), "properties": {"count": count}}
+                for count, lon, lat in rows
+            ]
+        else:
+            rows = db.query(
+                CitizenRequest.id, CitizenRequest.folio, CitizenRequest.longitude, CitizenRequest.latitude,
+                CitizenRequest.topic, CitizenRequest.urgency, CitizenRequest.status,
+            ).filter(*in_tile).order_by(CitizenRequest.created_at.desc()).limit(MAX_POINTS_PER_TILE).all()
+            coords = to_mercator(np.array([[r.longitude, r.latitude] for r in rows])) if rows else []
+            features = [
+                {
+                    "geometry": Point(xy),
+                    "properties": {
+                        "id": str(r.id),
+                        "folio": r.folio,
+                        "topic": r.topic.value if r.topic else None,
+                        "urgency": r.urgency.value if r.urgency else None,
+                        "status": r.status.value if r.status else None,
+                        "count": 1,
+                    },
+                }
+                for r, xy in zip(rows, coords)
+            ]
+        return self._encode("solicitudes", features, bounds_m)
+
+    def get_tile(self, db: Session, z: int, x: int, y: int) -> bytes:
+        """Tile MVT con las capas 'municipios' y 'solicitudes' (una concatenación protobuf válida)."""
+        key = (z, x, y)
+        municipalities = self.municipality_tiles.get(key)
+        if municipalities is None:
+            municipalities = self._municipality_layer(z, x, y)
+            self.municipality_tiles.put(key, municipalities)
+
+        requests_tile = self.request_tiles.get(key)
+        if requests_tile is None:
+            requests_tile = self._requests_layer(db, z, x, y)
+            self.request_tiles.put(key, requests_tile)
+
+        return municipalities + requests_tile
+
+    def invalidate_point(self, lat: float | None, lon: float | None, max_zoom: int = 22):
+        """Descarta los tiles de solicitudes que contienen el punto, en todos los niveles de zoom."""
+        if lat is None or lon is None: return
+        for z in range(max_zoom + 1):
+            x, y = lonlat_to_tile(lat, lon, z)
+            self.request_tiles.discard((z, x, y))
+
+    def invalidate_requests(self):
+        self.request_tiles.clear()
+
+tile_service = TileService()
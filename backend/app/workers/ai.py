@@ -0,0 +1,87 @@
+"""
+Worker dedicado de clasificación IA, independiente del servidor web.
+
+Uso: python -m app.workers.ai
+
+Vacía la cola (reclamos con SKIP LOCKED, así que se pueden correr varias réplicas),
+luego duerme hasta recibir un NOTIFY de la API o cumplirse el sondeo de respaldo.
+SIGTERM/SIGINT dejan de reclamar lotes nuevos y esperan a que terminen los que están en vuelo.
+"""
+import asyncio
+import logging
+import signal
+import psycopg2
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from app.core.config import settings
+from app.services.ai_service import ai_service, AI_QUEUE_CHANNEL
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class AIWorker:
+    def __init__(self, poll_seconds: int):
+        self.poll_seconds = poll_seconds
+        self.stop = asyncio.Event()
+        self.wakeup = asyncio.Event()
+        self._listener = None
+
+    def _listen(self, loop: asyncio.AbstractEventLoop):
+        """Conexión aparte en autocommit suscrita al canal; el event loop la vigila sin bloquear."""
+        try:
+            conn = psycopg2.connect(
+                host=settings.DB_HOST, port=settings.DB_PORT, user=settings.DB_USER,
+                password=settings.DB_PASSWORD, dbname=settings.DB_NAME,
+            )
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {AI_QUEUE_CHANNEL};")
+            loop.add_reader(conn.fileno(), self._on_notify)
+            self._listener = conn
+            logger.info(f"👂 Escuchando NOTIFY en '{AI_QUEUE_CHANNEL}' (sondeo de respaldo cada {self.poll_seconds}s).")
+        except Exception as e:
+            logger.warning(f"⚠️ LISTEN no disponible ({e}). Sólo sondeo cada {self.poll_seconds}s.")
+
+    def _on_notify(self):
+        try:
+            self._listener.poll()
+        except psycopg2.Error as e:
+            logger.error(f"❌ Se perdió la conexión LISTEN: {e}")
+            asyncio.get_running_loop().remove_reader(self._listener.fileno())
+            self._listener = None
+            return
+        if self._listener.notifies:
+            self._listener.notifies.clear()
+            self.wakeup.set()
+
+    async def _sleep(self):
+        """Hasta un aviso, una señal de apagado o el siguiente sondeo (los leases vencidos no generan NOTIFY)."""
+        waiters = [asyncio.create_task(self.wakeup.wait()), asyncio.create_task(self.stop.wait())]
+        try:
+            await asyncio.wait(waiters, timeout=self.poll_seconds, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters: waiter.cancel()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self.stop.set)
+        self._listen(loop)
+        logger.info("🤖 Worker IA dedicado iniciado.")
+        try:
+            while not self.stop.is_set():
+                # Los avisos que lleguen mientras se vacía la cola provocan otra pasada inmediata
+                self.wakeup.clear()
+                await ai_service.process_queue(stop=self.stop)
+                if self._listener is None and not self.stop.is_set():
+                    self._listen(loop)
+                await self._sleep()
+        finally:
+            if self._listener is not None:
+                loop.remove_reader(self._listener.fileno())
+                self._listener.close()
+            logger.info("👋 Worker IA detenido.")
+
+def main():
+    asyncio.run(AIWorker(settings.AI_WORKER_POLL_SECONDS).run())
+
+if __name__ == "__main__":
+    main()
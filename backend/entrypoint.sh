@@ -10,6 +10,10 @@ echo "Iniciando CRAC Backend..."
 echo "Ejecutando migraciones de base de datos..."
 # python -m alembic upgrade head  <-- Descomentar cuando tengamos la primera migración lista
 
-# 2. Iniciar servidor FastAPI
+# 2. Precompilar el caché de geometrías municipales (sólo se reconstruye si cambió el GeoJSON)
+echo "Verificando caché de geometrías..."
+python -m app.scripts.build_geometry_cache || echo "Aviso: no se pudo generar el caché, se generará al primer uso."
+
+# 3. Iniciar servidor FastAPI
 echo "Iniciando servidor FastAPI..."
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
\ No newline at end of file
@@ -1,3 +1,5 @@
+import re
+from concurrent.futures import ThreadPoolExecutor
 import pytest
 import requests
 from tests.conftest import API_BASE_URL
@@ -38,4 +40,20 @@ def test_create_request_auto_assignment(auth_citizen):
     response = requests.post(f"{API_BASE_URL}/requests", headers=auth_citizen, json=payload)
     assert response.status_code == 201
     data = response.json()
-    assert data["department_id"] is None
\ No newline at end of file
+    assert data["department_id"] is None
+
+@pytest.mark.order(23)
+def test_create_request_concurrent_folios(auth_citizen):
+    """Altas simultáneas: cada una recibe un folio distinto y consecutivo del año."""
+    def create(i):
+        payload = {"description": f"Reporte simultáneo número {i} de luminaria apagada", "location_text": "Centro"}
+        return requests.post(f"{API_BASE_URL}/requests", headers=auth_citizen, json=payload)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        responses = list(pool.map(create, range(16)))
+    assert all(r.status_code == 201 for r in responses)
+    folios = [r.json()["folio"] for r in responses]
+    assert len(set(folios)) == len(folios)
+    assert all(re.fullmatch(r"YUC-\d{4}-\d{5}", folio) for folio in folios)
+    numbers = sorted(int(folio.rsplit("-", 1)[1]) for folio in folios)
+    assert numbers == list(range(numbers[0], numbers[0] + len(numbers)))
@@ -1,3 +1,7 @@
+import asyncio
+import io
+import time
+import uuid
 import pytest
 import requests
 from tests.conftest import API_BASE_URL
@@ -34,4 +38,333 @@ def test_ai_batch_processing(auth_superadmin):
     assert resp.status_code == 200
     results = resp.json()
     assert len(results) == 3
-    assert results[0]["topic"] == "Seguridad"
\ No newline at end of file
+    assert results[0]["topic"] == "Seguridad"
+
+@pytest.mark.order(27)
+def test_ai_worker_drains_queue(auth_superadmin):
+    """Los workers concurrentes vacían la cola (varios lotes en vuelo, varios workers) y terminan."""
+    rows = "\n".join(f"AI-WORKER-{i:03d},Reporte de prueba para el worker {i}" for i in range(23))
+    files = {'file': ('ai_worker.csv', io.BytesIO(f"FOLIO,DESCRIPCION\n{rows}\n".encode('utf-8')), 'text/csv')}
+    resp = requests.post(f"{API_BASE_URL}/requests/import-csv", headers=auth_superadmin, files=files)
+    assert resp.status_code == 200
+    assert resp.json()["imported"] == 23
+    # Workers simultáneos: SKIP LOCKED evita que reclamen las mismas filas
+    for _ in range(2):
+        assert requests.post(f"{API_BASE_URL}/ai/trigger-batch", headers=auth_superadmin).status_code == 200
+
+    for _ in range(30):
+        progress = requests.get(f"{API_BASE_URL}/ai/progress", headers=auth_superadmin).json()
+        if progress["pending"] == 0: break
+        time.sleep(1)
+    # Sin LLM disponible los lotes vuelven a la cola con backoff (diferidos), pero ninguno queda 'procesando'
+    assert progress["pending"] == 0
+    assert progress["status"] == "idle"
+
+    items = requests.get(f"{API_BASE_URL}/requests?search=AI-WORKER-&limit=50", headers=auth_superadmin).json()["items"]
+    assert len(items) == 23
+    assert all(item["analysis_status"] in ("COMPLETADO", "PENDIENTE", "ERROR") for item in items)
+
+@pytest.mark.order(28)
+def test_ai_classification_cache_stats(auth_superadmin):
+    """El caché de clasificaciones reporta su tamaño y tasa de aciertos."""
+    resp = requests.get(f"{API_BASE_URL}/ai/cache-stats", headers=auth_superadmin)
+    assert resp.status_code == 200
+    data = resp.json()
+    for key in ("prompt_version", "model", "entries", "stored_hits", "hits", "misses", "hit_ratio"):
+        assert key in data
+    assert 0.0 <= data["hit_ratio"] <= 1.0
+
+    # Reanalizar todo: lo ya clasificado se resuelve desde el caché, nada queda atorado
+    resp = requests.post(f"{API_BASE_URL}/ai/trigger-batch?force_reanalysis=true", headers=auth_superadmin)
+    assert resp.status_code == 200
+    for _ in range(30):
+        progress = requests.get(f"{API_BASE_URL}/ai/progress", headers=auth_superadmin).json()
+        if progress["pending"] == 0: break
+        time.sleep(1)
+    assert progress["pending"] == 0
+    after = requests.get(f"{API_BASE_URL}/ai/cache-stats", headers=auth_superadmin).json()
+    assert after["hits"] >= data["hits"] + data["entries"]
+
+@pytest.mark.order(29)
+def test_ai_near_duplicates_share_label(auth_superadmin):
+    """Las solicitudes casi idénticas se agrupan: sólo el representante va al LLM."""
+    template = "Solicito copia del contrato de recoleccion de basura del municipio de {} correspondiente al ejercicio {}"
+    towns = ["Merida", "Progreso", "Valladolid", "Tizimin", "Motul", "Ticul"]
+    rows = "\n".join(f"AI-NEARDUP-{i:03d},{template.format(town, 2020 + i)}" for i, town in enumerate(towns))
+    files = {'file': ('ai_neardup.csv', io.BytesIO(f"FOLIO,DESCRIPCION\n{rows}\n".encode('utf-8')), 'text/csv')}
+    resp = requests.post(f"{API_BASE_URL}/requests/import-csv", headers=auth_superadmin, files=files)
+    assert resp.status_code == 200
+    assert resp.json()["imported"] == len(towns)
+
+    for _ in range(30):
+        progress = requests.get(f"{API_BASE_URL}/ai/progress", headers=auth_superadmin).json()
+        if progress["pending"] == 0: break
+        time.sleep(1)
+    assert progress["pending"] == 0
+
+    items = requests.get(f"{API_BASE_URL}/requests?search=AI-NEARDUP-&limit=50", headers=auth_superadmin).json()["items"]
+    assert len(items) == len(towns)
+    members = [item for item in items if item["duplicate_of_id"]]
+    assert members
+    ids = {item["id"] for item in items}
+    assert all(item["duplicate_of_id"] in ids and 0 < item["analysis_confidence"] <= 1 for item in members)
+
+@pytest.mark.order(29)
+def test_near_duplicate_incremental_clustering():
+    """Con firmas de una pasada anterior sólo se evalúan pares con al menos una fila nueva."""
+    import numpy as np
+    from app.services.dedup_service import near_duplicate_service
+
+    template = "Solicito copia del contrato de recoleccion de basura del municipio de {} correspondiente al ejercicio {}"
+    texts = [template.format("Merida", 2020), "Bache profundo en la calle 60 del centro", template.format("Progreso", 2021)]
+    sigs = near_duplicate_service.signatures(texts)
+    assert near_duplicate_service.cluster_signatures(sigs, 0.7, fresh=np.array([False, False, False])) == []
+    pairs = near_duplicate_service.cluster_signatures(sigs, 0.7, fresh=np.array([False, False, True]))
+    assert [(rep, member) for rep, member, _ in pairs] == [(0, 2)]
+    assert pairs == near_duplicate_service.cluster(texts, 0.7)
+
+@pytest.mark.order(30)
+def test_ai_worker_stats(auth_superadmin):
+    """Las estadísticas del worker reportan el aprovechamiento de cada llamada al LLM."""
+    resp = requests.get(f"{API_BASE_URL}/ai/worker-stats", headers=auth_superadmin)
+    assert resp.status_code == 200
+    data = resp.json()
+    for key in ("llm_calls", "items", "items_per_call", "prompt_tokens", "completion_tokens", "cached_prompt_tokens", "system_prompt_tokens", "splits", "token_budget", "rate_limiter", "local_model"):
+        assert key in data
+    assert data["token_budget"] > 0
+    assert data["items"] >= data["llm_calls"]
+
+@pytest.mark.order(31)
+def test_ai_async_classification_on_create(auth_citizen, auth_superadmin):
+    """Crear una solicitud no espera al LLM: nace PENDIENTE y la cola la clasifica después."""
+    payload = {"description": "Hay una fuga de agua potable en la calle 60 desde hace dos días", "latitude": 20.9670, "longitude": -89.6237}
+    resp = requests.post(f"{API_BASE_URL}/requests", headers=auth_citizen, json=payload)
+    assert resp.status_code == 201
+    data = resp.json()
+    assert data["folio"]
+    assert data["analysis_status"] == "PENDIENTE"
+    assert [event["action"] for event in data["timeline"]] == ["created"]
+
+    for _ in range(30):
+        progress = requests.get(f"{API_BASE_URL}/ai/progress", headers=auth_superadmin).json()
+        if progress["pending"] == 0: break
+        time.sleep(1)
+    items = requests.get(f"{API_BASE_URL}/requests?search={data['folio']}", headers=auth_superadmin).json()["items"]
+    item = next(i for i in items if i["id"] == data["id"])
+    assert item["analysis_status"] in ("COMPLETADO", "PENDIENTE")
+    # Sin LLM disponible queda PENDIENTE en backoff; si se clasificó, el timeline lo registra una sola vez
+    if item["analysis_status"] == "COMPLETADO":
+        assert [event["action"] for event in item["timeline"]] == ["created", "classified"]
+
+
+@pytest.mark.order(32)
+def test_ai_prompt_encoding_and_stream_parsing():
+    """Entrada FOLIO|TEXTO de una línea por solicitud y parser tolerante de la respuesta en streaming."""
+    from app.services.ai_service import JSONObjectStream, encode_items, folio_key
+
+    assert encode_items([
+        {"folio": "990019000", "texto": "Bache  en la\ncalle 60 | esquina 47"},
+        {"folio": "AI-1", "texto": "Luminaria apagada"},
+    ]) == "990019000|Bache en la calle 60 / esquina 47\nAI-1|Luminaria apagada"
+
+    # Envoltura, bloque ``` y objetos partidos entre fragmentos; el objeto roto sólo pierde su folio
+    response = '```json\n{"clasificaciones": [{"folio": 990019000, "topic": "Salud"}, {"folio": "AI-1", "topic": "Otros"}, {"folio": 7, "topic": }, {"folio": " 0042 ", "topic": "Seguridad"}]}\n```'
+    parser = JSONObjectStream()
+    items = [item for i in range(0, len(response), 7) for item in parser.feed(response[i:i + 7])]
+    assert {folio_key(item["folio"]): item["topic"] for item in items} == {"990019000": "Salud", "AI-1": "Otros", "0042": "Seguridad"}
+
+@pytest.mark.order(32)
+def test_ai_numeric_folios(monkeypatch):
+    """Folios sólo numéricos: el modelo los devuelve como números JSON y aun así se cruzan con su solicitud."""
+    from app.database import SessionLocal
+    from app.models.requests import AnalysisStatus, CitizenRequest
+    from app.services.ai_service import JSONObjectStream
+
+    topics = ["Transporte", "Seguridad", "Transparencia"]
+    texts = [
+        "Bache profundo frente a la escuela primaria de Chuburna",
+        "Robo de cableado en el parque de San Sebastian",
+        "Solicito copia de la nomina del ayuntamiento de Hunucma",
+    ]
+
+    async def numeric_llm(chunk, on_item):
+        # Respuesta en streaming con los folios numéricos como números JSON, en orden inverso
+        body = ", ".join(
+            f'{{"folio": {int(item["folio"])}, "topic": "{topics[int(item["folio"]) % 10]}", "urgency": "Media", "sentiment": "Neutro", "tipo": "OPERATIVA"}}'
+            for item in reversed(chunk)
+        )
+        parser = JSONObjectStream()
+        response = f'{{"clasificaciones": [{body}]}}'
+        for i in range(0, len(response), 11):
+            for item in parser.feed(response[i:i + 11]):
+                on_item(item)
+
+    db = SessionLocal()
+    base = 9_900_190_000 + uuid.uuid4().int % 10_000 * 10
+    ids = _claimed_rows(db, texts, folios=[str(base + i) for i in range(len(texts))])
+    try:
+        ai_service = _stub_llm(monkeypatch, numeric_llm)
+        asyncio.run(ai_service._process_batch(db, ids))
+
+        db.expire_all()
+        rows = db.query(CitizenRequest).filter(CitizenRequest.id.in_(ids)).all()
+        assert all(row.analysis_status == AnalysisStatus.completado for row in rows)
+        assert {row.folio: row.topic.value for row in rows} == {str(base + i): topic for i, topic in enumerate(topics)}
+    finally:
+        db.query(CitizenRequest).filter(CitizenRequest.id.in_(ids)).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+
+def _claimed_rows(db, texts, folios=None):
+    """Filas ya reclamadas por este proceso (PROCESANDO, intento 1, lease vigente): el worker del servidor no las toca."""
+    from datetime import datetime, timedelta, timezone
+    from app.models.requests import AnalysisStatus, CitizenRequest
+    tag = uuid.uuid4().hex[:8]
+    rows = [
+        CitizenRequest(
+            folio=folios[i] if folios else f"AI-STUB-{tag}-{i}", description=f"{text} ({tag})", timeline=[],
+            analysis_status=AnalysisStatus.procesando, analysis_attempts=1,
+            analysis_lease_expires_at=datetime.now(timezone.utc) + timedelta(minutes=5),
+        )
+        for i, text in enumerate(texts)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in rows]
+
+def _stub_llm(monkeypatch, classify_chunk):
+    """Worker de este proceso con el LLM sustituido: sin caché local ni clasificador local de por medio."""
+    from app.services.ai_service import ai_service
+    monkeypatch.setattr(ai_service, "client", ai_service.client or object())
+    monkeypatch.setattr(ai_service, "_local_classify", lambda texts: None)
+    monkeypatch.setattr(ai_service, "_classify_chunk", classify_chunk)
+    return ai_service
+
+@pytest.mark.order(33)
+def test_ai_failed_batch_backs_off(auth_superadmin, monkeypatch):
+    """Un lote que falla vuelve a la cola con backoff: otra pasada inmediata del worker no lo reclama."""
+    from app.database import SessionLocal
+    from app.models.requests import AnalysisStatus, CitizenRequest
+
+    async def failing(chunk, on_item):
+        raise RuntimeError("respuesta inválida del LLM")
+
+    db = SessionLocal()
+    try:
+        ids = _claimed_rows(db, ["Bache frente al mercado", "Fuga de agua en la colonia Centro"])
+        ai_service = _stub_llm(monkeypatch, failing)
+        asyncio.run(ai_service._process_batch(db, ids))
+
+        # Vaciado completo de la cola en el servidor: las filas en backoff no se reclaman
+        assert requests.post(f"{API_BASE_URL}/ai/trigger-batch", headers=auth_superadmin).status_code == 200
+        for _ in range(30):
+            progress = requests.get(f"{API_BASE_URL}/ai/progress", headers=auth_superadmin).json()
+            if progress["pending"] == 0: break
+            time.sleep(1)
+        assert progress["pending"] == 0
+        assert progress["deferred"] >= len(ids)
+
+        db.expire_all()
+        rows = db.query(CitizenRequest).filter(CitizenRequest.id.in_(ids)).all()
+        assert all(row.analysis_status == AnalysisStatus.pendiente for row in rows)
+        assert all(row.analysis_attempts == 1 and row.analysis_lease_expires_at is not None for row in rows)
+    finally:
+        db.query(CitizenRequest).filter(CitizenRequest.folio.like("AI-STUB-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+
+@pytest.mark.order(34)
+def test_ai_unreachable_llm_keeps_attempts(auth_superadmin, monkeypatch):
+    """Con el LLM inaccesible (sin conexión) las filas esperan su backoff sin gastar intentos."""
+    import httpx
+    from openai import APIConnectionError
+    from app.database import SessionLocal
+    from app.models.requests import AnalysisStatus, CitizenRequest
+
+    async def unreachable(chunk, on_item):
+        raise APIConnectionError(request=httpx.Request("POST", "http://llm.invalid/chat/completions"))
+
+    db = SessionLocal()
+    try:
+        ids = _claimed_rows(db, ["Luminaria apagada en el parque", "Solicito copia del contrato de obra"])
+        ai_service = _stub_llm(monkeypatch, unreachable)
+        asyncio.run(ai_service._process_batch(db, ids))
+
+        db.expire_all()
+        rows = db.query(CitizenRequest).filter(CitizenRequest.id.in_(ids)).all()
+        assert all(row.analysis_status == AnalysisStatus.pendiente for row in rows)
+        assert all(row.analysis_attempts == 0 and row.analysis_lease_expires_at is not None for row in rows)
+    finally:
+        db.query(CitizenRequest).filter(CitizenRequest.folio.like("AI-STUB-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+@pytest.mark.order(35)
+def test_ai_exhausted_request_gets_timeline_event(auth_superadmin, monkeypatch):
+    """Una solicitud ciudadana que agota sus intentos queda en ERROR con un evento 'ai_failed' en su timeline."""
+    from app.core.config import settings
+    from app.database import SessionLocal
+    from app.models.requests import AnalysisStatus, CitizenRequest
+
+    async def failing(chunk, on_item):
+        raise RuntimeError("respuesta inválida del LLM")
+
+    db = SessionLocal()
+    try:
+        citizen_id, import_id = _claimed_rows(db, ["Poste caído sobre la banqueta", "Solicito el padrón de proveedores"])
+        db.query(CitizenRequest).filter(CitizenRequest.id.in_([citizen_id, import_id])).update(
+            {CitizenRequest.analysis_attempts: settings.AI_MAX_ATTEMPTS}, synchronize_session=False
+        )
+        citizen = db.get(CitizenRequest, citizen_id)
+        citizen.timeline = [{"action": "created", "timestamp": "2024-01-01T00:00:00", "note": "Recibido."}]
+        db.commit()
+
+        ai_service = _stub_llm(monkeypatch, failing)
+        asyncio.run(ai_service._process_batch(db, [citizen_id, import_id]))
+
+        db.expire_all()
+        citizen, imported = db.get(CitizenRequest, citizen_id), db.get(CitizenRequest, import_id)
+        assert citizen.analysis_status == imported.analysis_status == AnalysisStatus.error
+        assert [event["action"] for event in citizen.timeline] == ["created", "ai_failed"]
+        assert imported.timeline == []
+    finally:
+        db.query(CitizenRequest).filter(CitizenRequest.folio.like("AI-STUB-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
+
+@pytest.mark.order(36)
+def test_ai_reclassification_invalidates_tiles(auth_superadmin, monkeypatch):
+    """Los tiles del mapa muestran tema y urgencia: una fila clasificada descarta los tiles que la contienen."""
+    from app.database import SessionLocal
+    from app.models.requests import AnalysisStatus, CitizenRequest, Topic
+    from app.services.tile_service import lonlat_to_tile, tile_service
+
+    lat, lon = 20.9674, -89.6243
+    async def classify(chunk, on_item):
+        for item in chunk:
+            on_item({"folio": item["folio"], "topic": "Servicios Públicos", "urgency": "Alta", "sentiment": "Negativo", "tipo": "OPERATIVA"})
+
+    db = SessionLocal()
+    try:
+        (req_id,) = _claimed_rows(db, ["Luminarias apagadas en todo el parque de Santiago"])
+        db.query(CitizenRequest).filter(CitizenRequest.id == req_id).update(
+            {CitizenRequest.latitude: lat, CitizenRequest.longitude: lon}, synchronize_session=False
+        )
+        db.commit()
+        keys = [(z, *lonlat_to_tile(lat, lon, z)) for z in (5, 12, 16)]
+        for key in keys:
+            tile_service.request_tiles.put(key, b"stale")
+
+        ai_service = _stub_llm(monkeypatch, classify)
+        asyncio.run(ai_service._process_batch(db, [req_id]))
+
+        db.expire_all()
+        row = db.get(CitizenRequest, req_id)
+        assert row.analysis_status == AnalysisStatus.completado and row.topic == Topic.servicios
+        assert all(tile_service.request_tiles.get(key) is None for key in keys)
+    finally:
+        db.query(CitizenRequest).filter(CitizenRequest.folio.like("AI-STUB-%")).delete(synchronize_session=False)
+        db.commit()
+        db.close()
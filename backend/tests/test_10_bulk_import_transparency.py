@@ -15,4 +15,37 @@ def test_upload_transparency_csv_success(auth_superadmin):
     
     assert resp.status_code == 200, f"Error en carga: {resp.text}"
     data = resp.json()
-    assert data["processed"] > 0
\ No newline at end of file
+    assert data["processed"] > 0
+
+
+@pytest.mark.order(61)
+def test_import_requests_xlsx_and_legacy_encoding(auth_superadmin):
+    """El importador acepta XLSX y CSV en cp1252 (exportaciones de la PNT) sin perder acentos."""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["FOLIO", "DESCRIPCIONSOLICITUD", "MUNICIPIO"])
+    ws.append([310571800001, "Solicito el padrón de beneficiarios", "Mérida"])
+    ws.append(["XLSX-IMP-002", "Solicito el presupuesto de obra pública", None])
+    ws.append(["XLSX-IMP-002", "Folio repetido dentro del archivo", "Progreso"])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    files = {'file': ('pnt.xlsx', io.BytesIO(buffer.getvalue()), 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')}
+    resp = requests.post(f"{API_BASE_URL}/requests/import-csv", headers=auth_superadmin, files=files)
+    assert resp.status_code == 200, resp.text
+    assert resp.json()["imported"] == 2
+    assert resp.json()["locations_found"] == 1
+
+    item = requests.get(f"{API_BASE_URL}/requests?search=310571800001", headers=auth_superadmin).json()["items"][0]
+    assert item["folio"] == "310571800001"
+    assert item["location_text"] == "Importado - Mérida"
+
+    csv_content = "FOLIO,DESCRIPCIONSOLICITUD,MUNICIPIO\nCP1252-IMP-001,Solicitud de información pública,Kanasín\n"
+    files = {'file': ('pnt.csv', io.BytesIO(csv_content.encode('cp1252')), 'text/csv')}
+    resp = requests.post(f"{API_BASE_URL}/requests/import-csv", headers=auth_superadmin, files=files)
+    assert resp.status_code == 200
+    assert resp.json()["imported"] == 1
+    item = requests.get(f"{API_BASE_URL}/requests?search=CP1252-IMP-001", headers=auth_superadmin).json()["items"][0]
+    assert item["location_text"] == "Importado - Kanasín"
+    assert item["description"] == "Solicitud de información pública"
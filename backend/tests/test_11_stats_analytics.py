@@ -17,4 +17,15 @@ def test_stats_kpi_cards(auth_superadmin):
     resp = requests.get(f"{API_BASE_URL}/stats/dashboard", headers=auth_superadmin)
     assert resp.status_code == 200
     data = resp.json()
-    assert "total_requests" in data
\ No newline at end of file
+    assert "total_requests" in data
+
+
+@pytest.mark.order(42)
+def test_geocoding_cache_stats(auth_superadmin):
+    """Contadores del caché de geocodificación inversa"""
+    resp = requests.get(f"{API_BASE_URL}/stats/geocoding-cache", headers=auth_superadmin)
+    assert resp.status_code == 200
+    data = resp.json()
+    for key in ("hits", "misses", "hit_ratio", "size", "max_size", "precision"):
+        assert key in data
+    assert 0 <= data["hit_ratio"] <= 1
@@ -1,6 +1,7 @@
 import pytest
 import requests
 from tests.conftest import API_BASE_URL
+from tests.state import state
 
 @pytest.mark.order(210)
 def test_geojson_integrity(auth_superadmin):
@@ -43,4 +44,122 @@ def test_geocoding_precision(auth_superadmin):
         if not found_in_top:
              pytest.fail(f"❌ {expected} no apareció en los primeros candidatos.")
         else:
-             print(f"✅ {expected} encontrado en candidatos viables.")
\ No newline at end of file
+             print(f"✅ {expected} encontrado en candidatos viables.")
+
+
+@pytest.mark.order(212)
+def test_batch_geocoding(auth_superadmin):
+    payload = {
+        "lats": [20.9670, 21.2820, 20.8589, 25.0000],
+        "lons": [-89.6237, -89.6630, -90.3989, -85.0000],
+    }
+    resp = requests.post(f"{API_BASE_URL}/routing/get-zones/batch", headers=auth_superadmin, json=payload)
+    assert resp.status_code == 200
+    data = resp.json()
+    assert data["zones"] == ["Mérida", "Progreso", "Celestún", None]
+    assert data["distances"][0] == 0.0
+    assert data["distances"][3] is None
+
+    bad = requests.post(f"{API_BASE_URL}/routing/get-zones/batch", headers=auth_superadmin, json={"lats": [20.9], "lons": []})
+    assert bad.status_code == 400
+
+@pytest.mark.order(213)
+def test_geojson_resolutions_and_etag():
+    low = requests.get(f"{API_BASE_URL}/routing/yucatan-geojson?resolution=low", headers={"Accept-Encoding": "gzip"})
+    full = requests.get(f"{API_BASE_URL}/routing/yucatan-geojson?resolution=full", headers={"Accept-Encoding": "gzip"})
+    assert low.status_code == 200 and full.status_code == 200
+    assert low.headers.get("Content-Encoding") == "gzip"
+    assert len(low.json()["features"]) == len(full.json()["features"]) == 106
+    assert int(low.headers["Content-Length"]) < int(full.headers["Content-Length"])
+
+    # Sin parámetros no se manda la geometría completa: resolución media, igual que el zoom inicial del dashboard
+    default = requests.get(f"{API_BASE_URL}/routing/yucatan-geojson", headers={"Accept-Encoding": "gzip"})
+    zoomed = requests.get(f"{API_BASE_URL}/routing/yucatan-geojson?zoom=9", headers={"Accept-Encoding": "gzip"})
+    assert default.headers["ETag"] == zoomed.headers["ETag"] != full.headers["ETag"]
+
+    cached = requests.get(
+        f"{API_BASE_URL}/routing/yucatan-geojson?resolution=low",
+        headers={"Accept-Encoding": "gzip", "If-None-Match": low.headers["ETag"]}
+    )
+    assert cached.status_code == 304
+
+@pytest.mark.order(214)
+def test_vector_tiles(auth_superadmin, auth_citizen):
+    import mapbox_vector_tile
+
+    # Un punto en el centro de Mérida, visible en el tile de zoom alto
+    payload = {"description": "Bache profundo frente al mercado", "latitude": 20.9670, "longitude": -89.6237}
+    assert requests.post(f"{API_BASE_URL}/requests", headers=auth_citizen or auth_superadmin, json=payload).status_code == 201
+
+    # z=7 cubre casi todo Yucatán: municipios + conteos agregados
+    resp = requests.get(f"{API_BASE_URL}/routing/tiles/7/32/56.mvt", headers=auth_superadmin)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/vnd.mapbox-vector-tile"
+    tile = mapbox_vector_tile.decode(resp.content)
+    assert len(tile["municipios"]["features"]) > 50
+    assert sum(f["properties"]["count"] for f in tile["solicitudes"]["features"]) >= 1
+
+    # z=15 sobre el punto: puntos individuales con folio
+    resp = requests.get(f"{API_BASE_URL}/routing/tiles/15/8226/14431.mvt", headers=auth_superadmin)
+    tile = mapbox_vector_tile.decode(resp.content)
+    assert any(f["properties"].get("folio") for f in tile["solicitudes"]["features"])
+
+    assert requests.get(f"{API_BASE_URL}/routing/tiles/3/99/0.mvt", headers=auth_superadmin).status_code == 404
+
+@pytest.mark.order(215)
+def test_department_routing_table_refresh(auth_superadmin):
+    """Un departamento recién creado se usa para rutear sin reiniciar el servidor."""
+    assert state.dependency_id is not None
+    dept = requests.post(f"{API_BASE_URL}/departments", headers=auth_superadmin, json={
+        "name": "Atención Ciudadana General",
+        "dependency_id": state.dependency_id,
+    })
+    assert dept.status_code == 201
+
+    # Tizimín no tiene reglas específicas: cae en el departamento general
+    payload = {"description": "Solicito información general sobre horarios de atención", "latitude": 21.1435, "longitude": -88.1544}
+    resp = requests.post(f"{API_BASE_URL}/requests", headers=auth_superadmin, json=payload)
+    assert resp.status_code == 201
+    assert resp.json()["department_id"] == dept.json()["id"]
+
+@pytest.mark.order(216)
+def test_routing_rules_hot_reload(auth_superadmin):
+    """Una regla nueva en la matriz se aplica sin reiniciar (y se puede revertir)."""
+    rules = requests.get(f"{API_BASE_URL}/routing/rules", headers=auth_superadmin)
+    assert rules.status_code == 200
+    assert any(r["zone"] is None and r["topic"] is None for r in rules.json())
+
+    # Todo lo de Tizimín, sin importar el tema, al departamento de prueba
+    payload = {"zone": "Tizimín", "topic": None, "department_name": "Dirección de Urgencias Epidemiológicas"}
+    created = requests.post(f"{API_BASE_URL}/routing/rules", headers=auth_superadmin, json=payload)
+    assert created.status_code == 201
+    dup = requests.post(f"{API_BASE_URL}/routing/rules", headers=auth_superadmin, json=payload)
+    assert dup.status_code == 409
+    bad = requests.post(f"{API_BASE_URL}/routing/rules", headers=auth_superadmin, json={**payload, "zone": "Atlantis"})
+    assert bad.status_code == 400
+
+    req = {"description": "Reporte de prueba para la matriz de ruteo", "latitude": 21.1435, "longitude": -88.1544}
+    resp = requests.post(f"{API_BASE_URL}/requests", headers=auth_superadmin, json=req)
+    assert resp.status_code == 201
+    assert resp.json()["department_id"] == state.department_id
+
+    deleted = requests.delete(f"{API_BASE_URL}/routing/rules/{created.json()['id']}", headers=auth_superadmin)
+    assert deleted.status_code == 204
+
+@pytest.mark.order(217)
+def test_sector_routing_validation(auth_superadmin):
+    """Las reglas por colonia/AGEB exigen municipio y un sector existente en la capa cargada."""
+    resp = requests.get(f"{API_BASE_URL}/routing/zones/Mérida/sectors", headers=auth_superadmin)
+    assert resp.status_code == 200
+    assert isinstance(resp.json(), list)
+    assert requests.get(f"{API_BASE_URL}/routing/zones/Atlantis/sectors", headers=auth_superadmin).status_code == 404
+
+    zone = requests.post(f"{API_BASE_URL}/routing/get-zone", headers=auth_superadmin, json={"lat": 20.9670, "lon": -89.6237})
+    assert zone.json()["zone"] == "Mérida"
+    assert "sector" in zone.json()
+
+    payload = {"zone": None, "sector": "Centro", "topic": "Servicios Públicos", "department_name": "Cuadrilla Centro"}
+    no_zone = requests.post(f"{API_BASE_URL}/routing/rules", headers=auth_superadmin, json=payload)
+    assert no_zone.status_code == 400
+    unknown = requests.post(f"{API_BASE_URL}/routing/rules", headers=auth_superadmin, json={**payload, "zone": "Mérida", "sector": "Sector inexistente"})
+    assert unknown.status_code == 400
@@ -0,0 +1,108 @@
+import io
+import time
+import pytest
+import requests
+from tests.conftest import API_BASE_URL
+
+def _wait_for_job(job_id, headers, timeout=30):
+    for _ in range(timeout * 2):
+        job = requests.get(f"{API_BASE_URL}/imports/{job_id}", headers=headers).json()
+        if job["status"] not in ("PENDIENTE", "PROCESANDO"): return job
+        time.sleep(0.5)
+    return job
+
+@pytest.mark.order(230)
+def test_import_job_runs_in_background(auth_superadmin, auth_citizen):
+    """POST /imports devuelve el job de inmediato; el avance y los contadores se consultan aparte."""
+    rows = "\n".join(f"JOB-IMP-{i:04d},Solicitud de información número {i} sobre licitaciones,Mérida" for i in range(300))
+    # Folio repetido y folio inválido: cuentan como omitidos
+    csv_content = f"FOLIO,DESCRIPCIONSOLICITUD,MUNICIPIO\n{rows}\nJOB-IMP-0000,Repetida,Mérida\n=,Sin folio,Mérida\n"
+    files = lambda: {'file': ('jobs.csv', io.BytesIO(csv_content.encode('utf-8')), 'text/csv')}
+
+    if auth_citizen:
+        assert requests.post(f"{API_BASE_URL}/imports", headers=auth_citizen, files=files()).status_code == 403
+    resp = requests.post(f"{API_BASE_URL}/imports", headers=auth_superadmin, files=files())
+    assert resp.status_code == 202
+    job_id = resp.json()["id"]
+
+    job = _wait_for_job(job_id, auth_superadmin)
+    assert job["status"] == "COMPLETADO"
+    assert job["rows_read"] == 302
+    assert job["rows_inserted"] == 300
+    assert job["rows_skipped"] == 2
+    assert job["rows_failed"] == 0
+    assert job["checkpoint_row"] == 302
+    assert job["locations_found"] == 300
+    assert job["rows_per_second"] > 0
+
+    # Un job terminado no se reanuda; uno inexistente da 404
+    assert requests.post(f"{API_BASE_URL}/imports/{job_id}/resume", headers=auth_superadmin).status_code == 409
+    assert requests.get(f"{API_BASE_URL}/imports/00000000-0000-0000-0000-000000000000", headers=auth_superadmin).status_code == 404
+    assert any(j["id"] == job_id for j in requests.get(f"{API_BASE_URL}/imports", headers=auth_superadmin).json())
+
+@pytest.mark.order(231)
+def test_import_job_idempotent_reimport(auth_superadmin):
+    """Subir otra vez el mismo archivo no duplica solicitudes: todo cuenta como omitido."""
+    rows = "\n".join(f"JOB-IMP-{i:04d},Solicitud de información número {i} sobre licitaciones,Mérida" for i in range(300))
+    files = {'file': ('jobs.csv', io.BytesIO(f"FOLIO,DESCRIPCIONSOLICITUD,MUNICIPIO\n{rows}\n".encode('utf-8')), 'text/csv')}
+    resp = requests.post(f"{API_BASE_URL}/imports", headers=auth_superadmin, files=files)
+    assert resp.status_code == 202
+    job = _wait_for_job(resp.json()["id"], auth_superadmin)
+    assert job["status"] == "COMPLETADO"
+    assert job["rows_inserted"] == 0
+    assert job["rows_skipped"] == 300
+
+    total = requests.get(f"{API_BASE_URL}/requests?search=JOB-IMP-&limit=1", headers=auth_superadmin).json()["total"]
+    assert total == 300
+
+@pytest.mark.order(232)
+def test_import_job_missing_columns(auth_superadmin):
+    """Un archivo sin las columnas requeridas deja el job en ERROR con el motivo."""
+    files = {'file': ('bad.csv', io.BytesIO(b"A,B\n1,2\n"), 'text/csv')}
+    resp = requests.post(f"{API_BASE_URL}/imports", headers=auth_superadmin, files=files)
+    assert resp.status_code == 202
+    job = _wait_for_job(resp.json()["id"], auth_superadmin)
+    assert job["status"] == "ERROR"
+    assert "Columnas requeridas" in job["error"]
+
+
+@pytest.mark.order(232)
+def test_import_job_pnt_status_date_and_response(auth_superadmin):
+    """ESTATUS, FECHASOLICITUD (DD/MM/AAAA) y TEXTORESPUESTA de la PNT se conservan; sin valor válido, los defectos."""
+    csv_content = (
+        "FOLIO,DESCRIPCIONSOLICITUD,MUNICIPIO,ESTATUS,FECHASOLICITUD,TEXTORESPUESTA\n"
+        "JOB-PNT-001,Copia del presupuesto de obra,Mérida,Terminada,05/03/2023,Se entrega el presupuesto solicitado\n"
+        "JOB-PNT-002,Lista de proveedores,Progreso,En proceso,17/11/2022,\n"
+        "JOB-PNT-003,Contrato de alumbrado,Motul,Desechada por improcedente,sin fecha,\n"
+        "JOB-PNT-004,Nómina de la policía,Ticul,,,\n"
+    )
+    files = {'file': ('pnt.csv', io.BytesIO(csv_content.encode('utf-8')), 'text/csv')}
+    resp = requests.post(f"{API_BASE_URL}/imports", headers=auth_superadmin, files=files)
+    assert resp.status_code == 202
+    job = _wait_for_job(resp.json()["id"], auth_superadmin)
+    assert job["status"] == "COMPLETADO" and job["rows_inserted"] == 4
+
+    items = requests.get(f"{API_BASE_URL}/requests?search=JOB-PNT-&limit=10", headers=auth_superadmin).json()["items"]
+    by_folio = {item["folio"]: item for item in items}
+    assert [by_folio[f"JOB-PNT-00{i}"]["status"] for i in range(1, 5)] == ["Atendida", "En revisión", "Rechazada", "Recibida"]
+    assert by_folio["JOB-PNT-001"]["created_at"].startswith("2023-03-0")
+    assert by_folio["JOB-PNT-002"]["created_at"].startswith("2022-11-1")
+    # Fecha ilegible: la de la carga
+    assert by_folio["JOB-PNT-003"]["created_at"][:4] >= "2024"
+    assert by_folio["JOB-PNT-001"]["official_response"] == "Se entrega el presupuesto solicitado"
+    assert by_folio["JOB-PNT-002"]["official_response"] is None
+
+
+@pytest.mark.order(233)
+def test_import_job_abandon(auth_superadmin):
+    """Un job en ERROR que no se va a reanudar se abandona: se borra el registro junto con su copia del archivo."""
+    files = {'file': ('abandon.csv', io.BytesIO(b"A,B\n1,2\n"), 'text/csv')}
+    resp = requests.post(f"{API_BASE_URL}/imports", headers=auth_superadmin, files=files)
+    assert resp.status_code == 202
+    job_id = resp.json()["id"]
+    assert _wait_for_job(job_id, auth_superadmin)["status"] == "ERROR"
+
+    assert requests.delete(f"{API_BASE_URL}/imports/{job_id}", headers=auth_superadmin).status_code == 204
+    assert requests.get(f"{API_BASE_URL}/imports/{job_id}", headers=auth_superadmin).status_code == 404
+    assert requests.post(f"{API_BASE_URL}/imports/{job_id}/resume", headers=auth_superadmin).status_code == 404
+    assert requests.delete(f"{API_BASE_URL}/imports/{job_id}", headers=auth_superadmin).status_code == 404
@@ -44,12 +44,15 @@ interface RequestMapProps {
     requests: Request[]
 }
 
+// Zoom inicial del mapa: el backend elige con él la simplificación de las fronteras
+const DEFAULT_ZOOM = 9
+
 export default function RequestMap({ requests }: RequestMapProps) {
     const [geoJsonData, setGeoJsonData] = useState(null)
 
     // Cargar el mapa vectorial de municipios desde nuestro Backend
     useEffect(() => {
-        api.get('/routing/yucatan-geojson')
+        api.get('/routing/yucatan-geojson', { params: { zoom: DEFAULT_ZOOM } })
             .then(res => setGeoJsonData(res.data))
             .catch(err => console.error("Error cargando mapa base:", err));
     }, []);
@@ -72,7 +75,7 @@ export default function RequestMap({ requests }: RequestMapProps) {
     return (
         <MapContainer 
             center={defaultCenter} 
-            zoom={9} 
+            zoom={DEFAULT_ZOOM} 
             style={{ height: "100%", width: "100%", borderRadius: "0.5rem" }}
             scrollWheelZoom={true}
         >